@@ -0,0 +1,43 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+from loguru import logger
+
+from internal.corpus_dataset import DEFAULT_DATASET_DIR, DEFAULT_ROW_GROUP_ROWS, PARTITION_KEYS, compact_corpus
+
+RAW_OUTPUT_DIR = Path("OutputRaw")
+
+# Configure logger
+log_dir = Path("logs")
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+logger.add(log_dir / "corpus_compactor.log", rotation="10 MB", level="INFO")
+
+def main():
+    parser = argparse.ArgumentParser(description="Merges the per-replay outputs of Replay-Extractor.py into one partitioned corpus dataset.")
+    parser.add_argument("--input", type=Path, default=RAW_OUTPUT_DIR, help=f"Directory of per-replay outputs (default: {RAW_OUTPUT_DIR}).")
+    parser.add_argument("--output", type=Path, default=DEFAULT_DATASET_DIR, help=f"Directory of the corpus dataset, replaced when complete (default: {DEFAULT_DATASET_DIR}).")
+    parser.add_argument("--partition-by", choices=[*PARTITION_KEYS, "none"], default="matchup", help="Split the tables into one directory per race matchup, map or base build (default: matchup).")
+    parser.add_argument("--row-group-rows", type=int, default=DEFAULT_ROW_GROUP_ROWS, help="Rows per Parquet row group of the tables.")
+    args = parser.parse_args()
+
+    if not args.input.is_dir():
+        logger.error(f"The '{args.input}' directory was not found.")
+        sys.exit(1)
+
+    logger.info(f"Compacting {args.input} into {args.output}, partitioned by {args.partition_by}.")
+    start = time.perf_counter()
+    try:
+        count = compact_corpus(args.input, args.output, None if args.partition_by == "none" else args.partition_by, args.row_group_rows)
+    except Exception as e:
+        logger.error(f"Failed to compact {args.input}: {e}")
+        sys.exit(1)
+
+    if count == 0:
+        logger.error(f"No replays found in {args.input}. The corpus dataset was not written.")
+        sys.exit(1)
+    logger.info(f"Wrote {count} replays to the corpus dataset {args.output} in {time.perf_counter() - start:.1f}s.")
+
+if __name__ == "__main__":
+    main()
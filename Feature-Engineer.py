@@ -6,10 +6,18 @@ import sys
 import importlib.util
 import inspect
 import json
-import random
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from internal.arrow_cache import DEFAULT_ARROW_CACHE_DIR, ArrowReplayBundle, ArrowTableCache
+from internal.corpus_dataset import DEFAULT_DATASET_DIR, CorpusDataset
 from internal.feature_script_base import FeatureScriptBase
 from internal.exceptions import EssentialDataMissingError
+from internal.feature_store import DEFAULT_BATCH_ROWS, FeatureCache, FeatureWriter
+from internal.job_ledger import DONE, file_content_hash, has_complete_output
+from internal.replay_bundle import ESSENTIAL_TABLES, TABLE_FILES, ReplayBundle, load_corpus_tables
+from internal.replay_index import DEFAULT_INDEX_PATH, STRATA, ReplayIndex, ReplayQuery, stratified_sample
+
+DEFAULT_CORPUS_BATCH = 500
 
 # Configure logger
 log_dir = Path("logs")
@@ -17,12 +25,295 @@ logger.remove()
 logger.add(sys.stderr, level="INFO")
 logger.add(log_dir / "feature_engineer.log", rotation="10 MB", level="INFO")
 
+def load_feature_script(feature_script_path: Path) -> FeatureScriptBase:
+    """Imports a feature script and returns an instance of its FeatureScriptBase subclass."""
+    spec = importlib.util.spec_from_file_location("feature_definitions", str(feature_script_path))
+    if spec is None:
+        raise ImportError(f"Could not find or load feature script: {feature_script_path}")
+    if spec.loader is None:
+        raise ImportError(f"Could not determine a loader for feature script: {feature_script_path}")
+    feature_module = importlib.util.module_from_spec(spec)
+    sys.modules["feature_definitions"] = feature_module
+    spec.loader.exec_module(feature_module)
+
+    feature_class = None
+    for name, obj in inspect.getmembers(feature_module, inspect.isclass):
+        if issubclass(obj, FeatureScriptBase) and obj is not FeatureScriptBase:
+            feature_class = obj
+            break
+
+    if not feature_class:
+        raise TypeError(f"The feature script '{feature_script_path}' must contain a class that inherits from FeatureScriptBase.")
+
+    return feature_class()
+
+# Replays are read from the per-replay directories in OutputRaw, or from a corpus dataset (Corpus-Compactor.py).
+ReplaySource = Path | CorpusDataset
+
+def load_replay_metadata(source: ReplaySource, replay_id: str) -> dict | None:
+    """Loads a replay's metadata (now includes PlayerName from Replay-Metadata.py). None (after logging why) if there is none."""
+    if isinstance(source, CorpusDataset):
+        return source.metadata(replay_id)
+    info_file_path = list((source / replay_id).glob("*_info.json"))
+    if not info_file_path:
+        logger.warning(f"No _info.json file found for replay {replay_id}. Skipping.")
+        return None
+    with open(info_file_path[0], 'r') as f:
+        return json.load(f)
+
+def load_replay_players(source: ReplaySource, replay_id: str, min_d: int | None) -> dict | None:
+    """Loads a replay's metadata and player names and IDs. Returns None (after logging why) if the replay should be skipped."""
+    metadata = load_replay_metadata(source, replay_id)
+    if metadata is None:
+        return None
+
+    # Filter by game duration
+    if min_d is not None:
+        duration = metadata.get("Duration", 0)
+        if duration < min_d:
+            logger.info(f"Skipping replay {replay_id}: duration ({duration}s) is less than {min_d}s.")
+            return None
+
+    # Extract player names and IDs from metadata
+    p1_name, p2_name = None, None
+    p1_id, p2_id = None, None
+
+    for player_data in metadata.get('Players', []):
+        if player_data.get('PlayerID') == 1:
+            p1_id = 1
+            p1_name = player_data.get('PlayerName')
+        elif player_data.get('PlayerID') == 2:
+            p2_id = 2
+            p2_name = player_data.get('PlayerName')
+
+    if not (p1_name and p2_name and p1_id and p2_id):
+        logger.warning(f"Could not determine full player info from metadata for replay {replay_id}. Skipping.")
+        return None
+
+    return {"metadata": metadata, "p1_name": p1_name, "p2_name": p2_name, "p1_id": p1_id, "p2_id": p2_id}
+
+
+def filter_by_duration(source: Path, replay_ids: list[str], min_d: int) -> list[str]:
+    """
+    The replays at least min_d seconds long, from their _info.json. Without the replay index, this is done before the
+    feature cache is looked up, so cached replays are filtered too.
+    """
+    kept = []
+    for replay_id in replay_ids:
+        metadata = load_replay_metadata(source, replay_id)
+        if metadata is not None and metadata.get("Duration", 0) >= min_d:
+            kept.append(replay_id)
+    if len(kept) < len(replay_ids):
+        logger.info(f"Skipping {len(replay_ids) - len(kept)} replays that are shorter than {min_d}s or have no metadata.")
+    return kept
+
+def has_essential_files(source: ReplaySource, replay_id: str, tables: dict[str, list[str] | None]) -> bool:
+    """Essential Parquet files must exist (if the feature script uses them), they are only read later."""
+    for name in ESSENTIAL_TABLES:
+        if name not in tables:
+            continue
+        exists = source.has_table(replay_id, name) if isinstance(source, CorpusDataset) else (source / replay_id / TABLE_FILES[name]).exists()
+        if not exists:
+            logger.warning(f"No {TABLE_FILES[name]} file found for replay {replay_id}. Skipping.")
+            return False
+    return True
+
+def load_replay_bundle(source: ReplaySource, replay_id: str, min_d: int | None, tables: dict[str, list[str] | None] | None = None, time_window=None,
+                       arrow_cache: ArrowTableCache | None = None) -> dict | None:
+    """
+    Loads a replay's metadata into a replay bundle whose tables (`tables`, default all of them with every column) are
+    read from the Parquet files (or their memory-mapped copies in `arrow_cache`) on first access. Returns None (after
+    logging why) if the replay should be skipped.
+    """
+    players = load_replay_players(source, replay_id, min_d)
+    if tables is None:
+        tables = {name: None for name in TABLE_FILES}
+    if players is None or not has_essential_files(source, replay_id, tables):
+        return None
+
+    # units, resources, deaths and upgrades (None if the file doesn't exist) are loaded lazily
+    if isinstance(source, CorpusDataset):
+        return source.replay_bundle(replay_id, tables, time_window, **players)
+    if arrow_cache is not None:
+        return ArrowReplayBundle(arrow_cache, source / replay_id, replay_id, tables, time_window, **players)
+    return ReplayBundle(source / replay_id, replay_id, tables, time_window, **players)
+
+def _player_value(metadata: dict, index: int, key: str):
+    try:
+        return metadata['Players'][index][key]
+    except (KeyError, IndexError):
+        return None
+
+def load_corpus(source: ReplaySource, replay_ids: list[str], min_d: int | None, tables: dict[str, list[str] | None], time_window=None,
+                arrow_cache: ArrowTableCache | None = None) -> dict | None:
+    """
+    Loads a batch of replays for FeatureScriptBase.process_corpus: one row per replay in corpus["replays"] and each
+    table concatenated over the replays. Replays load_replay_bundle would skip are left out. None if no replay is left.
+    """
+    replay_rows, metadata_by_replay, replay_paths = [], {}, {}
+    for replay_id in replay_ids:
+        players = load_replay_players(source, replay_id, min_d)
+        if players is None or not has_essential_files(source, replay_id, tables):
+            continue
+        metadata = players.pop("metadata")
+        winner = next((player.get('PlayerID') for player in metadata.get('Players', []) if player.get('Result') == 'Win'), None)
+        replay_rows.append({"replay_id": replay_id, **players, "p1_race": _player_value(metadata, 0, 'SelectedRace'),
+                            "p2_race": _player_value(metadata, 1, 'SelectedRace'), "winner": winner, "duration": metadata.get("Duration")})
+        metadata_by_replay[replay_id] = metadata
+        replay_paths[replay_id] = source / replay_id if not isinstance(source, CorpusDataset) else None
+    if not replay_paths:
+        return None
+
+    if isinstance(source, CorpusDataset):
+        corpus = source.load_tables(list(replay_paths), tables, time_window)
+    else:
+        corpus = load_corpus_tables(replay_paths, tables, time_window, arrow_cache)
+    corpus["replays"] = pd.DataFrame(replay_rows)
+    corpus["metadata"] = metadata_by_replay
+    return corpus
+
+def run_replay(feature_script_instance: FeatureScriptBase, feature_script_name: str, source: ReplaySource, replay_id: str, min_d: int | None,
+               arrow_cache: ArrowTableCache | None = None) -> pd.DataFrame | None:
+    """Loads and processes a single replay. Errors are logged and skip the replay (None is returned)."""
+    logger.info(f"Processing replay: {replay_id}")
+
+    try:
+        replay_bundle = load_replay_bundle(source, replay_id, min_d, feature_script_instance.required_tables(), feature_script_instance.time_window, arrow_cache)
+        if replay_bundle is None:
+            return None
+
+        feature_script_instance._init_bundle(replay_bundle)
+        try:
+            processed_df = feature_script_instance.process_replay(replay_bundle, replay_id)
+            return processed_df if processed_df is not None else pd.DataFrame() # Empty (not None), so it's reported as "no data"
+        except EssentialDataMissingError as e:
+            logger.error(f"A vital data file is missing for replay {replay_id}: {e}")
+            logger.critical(f"Delete the folder for replay {replay_id} and re-run replay-extractor to fix this.")
+            return None # Skip this replay and continue with the next
+        except Exception as fe_e:
+            logger.error(f"An unexpected error occurred in feature script '{feature_script_name}' for replay {replay_id}: {fe_e}")
+            return None # Skip this replay and continue with the next
+
+    except Exception as e:
+        logger.error(f"Failed to process replay {replay_id}: {e}")
+        return None
+
+def run_corpus(feature_script_instance: FeatureScriptBase, feature_script_name: str, source: ReplaySource, replay_ids: list[str], min_d: int | None,
+               arrow_cache: ArrowTableCache | None = None) -> tuple[list[str], pd.DataFrame | None]:
+    """Loads and processes a batch of replays with process_corpus. Returns the replays that were loaded and the features (None if the batch failed)."""
+    logger.info(f"Processing a batch of {len(replay_ids)} replays: {replay_ids[0]} to {replay_ids[-1]}")
+
+    try:
+        corpus = load_corpus(source, replay_ids, min_d, feature_script_instance.required_tables(), feature_script_instance.time_window, arrow_cache)
+        if corpus is None:
+            return [], None
+        loaded_ids = corpus["replays"]["replay_id"].tolist()
+        try:
+            processed_df = feature_script_instance.process_corpus(corpus)
+            return loaded_ids, processed_df if processed_df is not None else pd.DataFrame()
+        except Exception as fe_e:
+            logger.error(f"An unexpected error occurred in feature script '{feature_script_name}' for the batch of replays {replay_ids[0]} to {replay_ids[-1]}: {fe_e}")
+            return loaded_ids, None # Skip this batch and continue with the next
+
+    except Exception as e:
+        logger.error(f"Failed to process the batch of replays {replay_ids[0]} to {replay_ids[-1]}: {e}")
+        return [], None
+
+def run_work_item(feature_script_instance: FeatureScriptBase, feature_script_name: str, source: ReplaySource, item: str | list[str], min_d: int | None,
+                  arrow_cache: ArrowTableCache | None = None) -> tuple[list[str], pd.DataFrame | None]:
+    """Processes a batch of replays (a list of replay IDs) with process_corpus, or a single replay with process_replay."""
+    if isinstance(item, list):
+        return run_corpus(feature_script_instance, feature_script_name, source, item, min_d, arrow_cache)
+    return [item], run_replay(feature_script_instance, feature_script_name, source, item, min_d, arrow_cache)
+
+def replays_with_rows(replay_ids: list[str], processed_df: pd.DataFrame) -> set[str]:
+    if processed_df.empty:
+        return set()
+    if len(replay_ids) == 1:
+        return set(replay_ids)
+    return set(processed_df["replay_id"].astype(str).unique()) & set(replay_ids)
+
+def select_replays(args, query: ReplayQuery) -> tuple[ReplaySource, list[str]]:
+    """
+    Resolves the replays to process: the extracted replays in the replay index matching the query (if the index
+    exists), otherwise every replay in the corpus dataset matching it, or every directory in OutputRaw. With --limit,
+    a seeded sample stratified by --stratify. Raises ValueError if the query can't be answered without the index.
+    """
+    stratify_by = None if args.stratify == "none" else args.stratify
+    use_index = not args.no_index and DEFAULT_INDEX_PATH.is_file()
+    strata = None
+
+    if args.dataset:
+        # Without the index, the query is pushed down to the dataset's metadata table
+        source = CorpusDataset(args.dataset, filters=None if use_index else query.to_filters())
+        dataset_replays = source.replays
+    else:
+        source = Path("OutputRaw")
+
+    if use_index:
+        with ReplayIndex(DEFAULT_INDEX_PATH) as replay_index:
+            rows = replay_index.select(query, ("replay_id", stratify_by or "replay_id", "extraction_status"))
+        # Replays without a status were indexed before Replay-Extractor.py recorded one: extracted if they have output
+        if args.dataset:
+            rows = [row for row in rows if row[0] in dataset_replays.index and row[2] in (DONE, None)]
+        else:
+            rows = [row for row in rows if row[2] == DONE or (row[2] is None and has_complete_output(source / row[0]))]
+        replay_ids, strata = [row[0] for row in rows], [row[1] for row in rows]
+        logger.info(f"Selected {len(replay_ids)} extracted replays from the replay index{' that are in the corpus dataset' if args.dataset else ''}.")
+    elif args.dataset:
+        replay_ids = source.replay_ids()
+        strata = dataset_replays[stratify_by].tolist() if stratify_by else None
+        logger.info(f"Found {len(replay_ids)} replays to process in the corpus dataset {args.dataset}.")
+    else:
+        if not query._replace(min_duration=None).is_empty():
+            raise ValueError(f"Selecting replays by anything but --min-d needs the replay index ({DEFAULT_INDEX_PATH}, written by Replay-Metadata.py) or --dataset.")
+        replay_ids = sorted(entry.name for entry in source.iterdir() if entry.is_dir() and not entry.name.startswith("."))
+        logger.info(f"Found {len(replay_ids)} replay directories to process.")
+        if query.min_duration is not None:
+            replay_ids = filter_by_duration(source, replay_ids, query.min_duration)
+
+    if args.limit and args.limit < len(replay_ids):
+        logger.info(f"Selecting a sample of {args.limit} replays (seed {args.seed}{f', stratified by {stratify_by}' if strata is not None and stratify_by else ''}).")
+        replay_ids = stratified_sample(replay_ids, strata if stratify_by else None, args.limit, args.seed)
+    return source, replay_ids
+
+# Pool workers load the feature script once (in _init_worker) and keep it here.
+_worker_state = {}
+
+def _init_worker(feature_script_path: Path, feature_script_name: str, source: ReplaySource, min_d: int | None, arrow_cache: ArrowTableCache | None):
+    _worker_state["instance"] = load_feature_script(feature_script_path)
+    _worker_state["args"] = (feature_script_name, source, min_d, arrow_cache)
+
+def _run_in_worker(item: str | list[str]) -> tuple[list[str], pd.DataFrame | None]:
+    feature_script_name, source, min_d, arrow_cache = _worker_state["args"]
+    return run_work_item(_worker_state["instance"], feature_script_name, source, item, min_d, arrow_cache)
+
 def main():
     parser = argparse.ArgumentParser(description="Feature engineering script for StarCraft II replay data.")
     parser.add_argument("feature_script_name", type=str,
                         help="Name of the Python script in the 'FeatureScripts' directory (without .py extension).")
-    parser.add_argument("--limit", type=int, default=None, help="Randomly select N replays to process instead of all of them.")
+    parser.add_argument("--limit", type=int, default=None, help="Process a seeded sample of N replays (stratified by --stratify) instead of all of them.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the --limit sample.")
+    parser.add_argument("--stratify", choices=[*STRATA, "none"], default="matchup", help="Keep the proportions of each matchup, map or build in the --limit sample (default: matchup).")
     parser.add_argument("--min-d", type=int, default=None, help="Skip replays shorter than this duration in seconds.")
+    parser.add_argument("--max-d", type=int, default=None, help="Skip replays longer than this duration in seconds.")
+    parser.add_argument("--matchup", nargs="+", default=None, help="Only replays of these matchups (e.g. PvZ TvT).")
+    parser.add_argument("--player", nargs="+", default=None, help="Only replays where one of these players played.")
+    parser.add_argument("--map", nargs="+", default=None, help="Only replays on these maps.")
+    parser.add_argument("--since", default=None, help="Only replays from this date on (YYYY-MM-DD, the replay file's date).")
+    parser.add_argument("--until", default=None, help="Only replays up to this date (YYYY-MM-DD).")
+    parser.add_argument("--no-index", action="store_true", help=f"Don't select replays with the replay index ({DEFAULT_INDEX_PATH}), list OutputRaw instead.")
+    parser.add_argument("--dataset", nargs="?", const=str(DEFAULT_DATASET_DIR), default=None,
+                        help=f"Read replays from a corpus dataset written by Corpus-Compactor.py (default: {DEFAULT_DATASET_DIR}) instead of OutputRaw.")
+    parser.add_argument("--arrow-cache", nargs="?", const=str(DEFAULT_ARROW_CACHE_DIR), default=None,
+                        help=f"Read replay tables from memory-mapped, uncompressed Arrow copies in this directory (default: {DEFAULT_ARROW_CACHE_DIR}), written on first use.")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Process replays in N worker processes.")
+    parser.add_argument("--unordered", action="store_true", help="With --workers, collect replays as soon as they finish instead of in input order (the output is in input order when the cache is used).")
+    parser.add_argument("--csv", action="store_true", help="Also export the features as a CSV file next to the Parquet file.")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every replay instead of reusing cached features (the cache is left untouched).")
+    parser.add_argument("--corpus-batch", type=int, default=DEFAULT_CORPUS_BATCH, help="Replays per batch for feature scripts that implement process_corpus.")
+    parser.add_argument("--per-replay", action="store_true", help="Use process_replay even if the feature script implements process_corpus.")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per Parquet row group (replays are batched until this many rows are buffered).")
     
     args = parser.parse_args()
 
@@ -32,32 +323,13 @@ def main():
 
     # Load FeatureScript
     try:
-        spec = importlib.util.spec_from_file_location("feature_definitions", str(feature_script_path))
-        if spec is None:
-            logger.error(f"Could not find or load feature script: {feature_script_path}")
-            sys.exit(1)
-        if spec.loader is None:
-            logger.error(f"Could not determine a loader for feature script: {feature_script_path}")
-            sys.exit(1)
-        feature_module = importlib.util.module_from_spec(spec)
-        sys.modules["feature_definitions"] = feature_module
-        spec.loader.exec_module(feature_module)
-        
-        feature_class = None
-        for name, obj in inspect.getmembers(feature_module, inspect.isclass):
-            if issubclass(obj, FeatureScriptBase) and obj is not FeatureScriptBase:
-                feature_class = obj
-                break
-        
-        if not feature_class:
-            logger.error(f"The feature script '{feature_script_path}' must contain a class that inherits from FeatureScriptBase.")
-            sys.exit(1)
-            
-        feature_script_instance = feature_class()
-
+        feature_script_instance = load_feature_script(feature_script_path)
     except FileNotFoundError:
         logger.error(f"Feature script not found: {feature_script_path}")
         sys.exit(1)
+    except (ImportError, TypeError) as e:
+        logger.error(e)
+        sys.exit(1)
     except Exception as e:
         logger.error(f"Error loading or executing feature script '{feature_script_path}': {e}")
         sys.exit(1)
@@ -68,137 +340,118 @@ def main():
         output_dir = Path("OutputFeatures") / args.feature_script_name
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        output_filename = f"features_{timestamp}.csv"
+        output_filename = f"features_{timestamp}.parquet"
         output_path = output_dir / output_filename
+        csv_path = output_path.with_suffix(".csv") if args.csv else None
+        writer = FeatureWriter(output_path, batch_rows=args.batch_rows, csv_path=csv_path)
     except Exception as e:
         logger.error(f"Error setting up output path: {e}")
         sys.exit(1)
 
     # Replay processing loop
-    is_first_write = True
     processed_count = 0
-    raw_output_dir = Path("OutputRaw")
-    replay_dirs = [entry.name for entry in raw_output_dir.iterdir() if entry.is_dir()]
+    # The selection is a query on the replay index (or the corpus dataset's metadata table), no _info.json is read for it
+    query = ReplayQuery(args.min_d, args.max_d, args.matchup, args.player, args.map, args.since, args.until)
+    try:
+        source, replay_dirs = select_replays(args, query)
+    except Exception as e:
+        logger.error(f"Error selecting replays: {e}")
+        sys.exit(1)
+
+    # Repeated runs over the same replays read their tables from memory-mapped Arrow files instead of decompressing the Parquet files
+    arrow_cache = None
+    if args.arrow_cache:
+        if isinstance(source, CorpusDataset):
+            logger.error("--arrow-cache caches the tables of OutputRaw's replay directories, it can't be used with --dataset.")
+            sys.exit(1)
+        arrow_cache = ArrowTableCache(args.arrow_cache)
+        logger.info(f"Reading replay tables through the Arrow cache in {arrow_cache.directory}.")
 
-    logger.info(f"Found {len(replay_dirs)} replay directories to process.")
+    # Only replays that are new, changed, or were computed by a different version of the feature script are computed
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = FeatureCache(output_dir / "cache", file_content_hash(feature_script_path))
+        except Exception as e:
+            logger.error(f"Error opening the feature cache: {e}")
+            sys.exit(1)
+        if isinstance(source, CorpusDataset):
+            replay_dirs_to_compute = [replay_id for replay_id in replay_dirs if not cache.lookup(replay_id, input_hash=source.input_hash(replay_id))]
+        else:
+            replay_dirs_to_compute = [replay_id for replay_id in replay_dirs if not cache.lookup(replay_id, source / replay_id)]
+        logger.info(f"Feature cache: {cache.hits} hits, {cache.misses} misses.")
+    else:
+        replay_dirs_to_compute = replay_dirs
 
-    if args.limit and args.limit < len(replay_dirs):
-        logger.info(f"Randomly selecting {args.limit} replays to process.")
-        replay_dirs = random.sample(replay_dirs, args.limit)
+    # Feature scripts with a batch API get batches of replays, others one replay at a time
+    if feature_script_instance.supports_corpus() and not args.per_replay:
+        batch = max(1, args.corpus_batch)
+        work_items = [replay_dirs_to_compute[i:i + batch] for i in range(0, len(replay_dirs_to_compute), batch)]
+        logger.info(f"Feature script implements process_corpus, processing replays in batches of up to {batch}.")
+    else:
+        work_items = replay_dirs_to_compute
 
-    for replay_id in replay_dirs:
-        replay_path = raw_output_dir / replay_id
-        logger.info(f"Processing replay: {replay_id}")
+    # Results stream back here from the workers, so there is only ever one writer.
+    executor = None
+    workers = max(1, min(args.workers, len(work_items)))
+    if workers > 1:
+        logger.info(f"Processing replays with {workers} worker processes ({'as completed' if args.unordered else 'in input order'}).")
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(feature_script_path, args.feature_script_name, source, args.min_d, arrow_cache))
+        if args.unordered:
+            futures = [executor.submit(_run_in_worker, item) for item in work_items]
+            results = (future.result() for future in as_completed(futures))
+        else:
+            results = executor.map(_run_in_worker, work_items)
+    else:
+        results = (run_work_item(feature_script_instance, args.feature_script_name, source, item, args.min_d, arrow_cache) for item in work_items)
 
+    for replay_ids, processed_df in results:
+        if processed_df is None:
+            continue # Skipped or failed, already logged
+        # Buffer results, the writer (or the cache's segment writer) flushes them to disk in row groups
         try:
-            # Load metadata (now includes PlayerName from Replay-Metadata.py)
-            info_file_path = list(replay_path.glob("*_info.json"))
-            if not info_file_path:
-                logger.warning(f"No _info.json file found for replay {replay_id}. Skipping.")
-                continue
-            with open(info_file_path[0], 'r') as f:
-                metadata = json.load(f)
-
-            # Filter by game duration
-            if args.min_d is not None:
-                duration = metadata.get("Duration", 0)
-                if duration < args.min_d:
-                    logger.info(f"Skipping replay {replay_id}: duration ({duration}s) is less than {args.min_d}s.")
-                    continue
-
-            # Extract player names and IDs from metadata
-            p1_name, p2_name = None, None
-            p1_id, p2_id = None, None
-
-            for player_data in metadata.get('Players', []):
-                if player_data.get('PlayerID') == 1:
-                    p1_id = 1
-                    p1_name = player_data.get('PlayerName')
-                elif player_data.get('PlayerID') == 2:
-                    p2_id = 2
-                    p2_name = player_data.get('PlayerName')
-            
-            if not (p1_name and p2_name and p1_id and p2_id):
-                logger.warning(f"Could not determine full player info from metadata for replay {replay_id}. Skipping.")
-                continue
-
-            # Load parquet data
-            units_parquet_path = replay_path / "units.parquet"
-            if not units_parquet_path.exists():
-                logger.warning(f"No units.parquet file found for replay {replay_id}. Skipping.")
-                continue
-            full_unit_data = pd.read_parquet(units_parquet_path)
-            # Add replay_id column to the unit data (useful for later phases)
-            full_unit_data['replay_id'] = replay_id
-            
-            # Load resources.parquet (essential data)
-            resources_parquet_path = replay_path / "resources.parquet"
-            if not resources_parquet_path.exists():
-                logger.warning(f"No resources.parquet file found for replay {replay_id}. Skipping.")
-                continue
-            consolidated_resource_data = pd.read_parquet(resources_parquet_path)
-            consolidated_resource_data['replay_id'] = replay_id
-
-            # Load deaths.parquet (optional data)
-            deaths_parquet_path = replay_path / "deaths.parquet"
-            consolidated_death_data = None
-            if deaths_parquet_path.exists():
-                consolidated_death_data = pd.read_parquet(deaths_parquet_path)
-                consolidated_death_data['replay_id'] = replay_id
-
-            # Load upgrades.parquet (optional data)
-            upgrades_parquet_path = replay_path / "upgrades.parquet"
-            consolidated_upgrade_data = None
-            if upgrades_parquet_path.exists():
-                consolidated_upgrade_data = pd.read_parquet(upgrades_parquet_path)
-                consolidated_upgrade_data['replay_id'] = replay_id
-
-            # Initialize the bundle and process the replay
-            replay_bundle = {
-                "metadata": metadata,
-                "p1_name": p1_name,
-                "p2_name": p2_name,
-                "p1_id": p1_id,
-                "p2_id": p2_id,
-                "units": full_unit_data,
-                "deaths": consolidated_death_data, # Will be None if file doesn't exist
-                "resources": consolidated_resource_data,
-                "upgrades": consolidated_upgrade_data # Will be None if file doesn't exist
-            }
-
-            feature_script_instance._init_bundle(replay_bundle)
-            try:
-                processed_df = feature_script_instance.process_replay(replay_bundle, replay_id)
-            except EssentialDataMissingError as e:
-                logger.error(f"A vital data file is missing for replay {replay_id}: {e}")
-                logger.critical(f"Delete the folder for replay {replay_id} and re-run replay-extractor to fix this.")
-                continue # Skip this replay and continue with the next
-            except Exception as fe_e:
-                logger.error(f"An unexpected error occurred in feature script '{args.feature_script_name}' for replay {replay_id}: {fe_e}")
-                continue # Skip this replay and continue with the next
-
-            # Append results to disk
-            if processed_df is not None and not processed_df.empty:
-                processed_df.to_csv(output_path, mode='a', header=is_first_write, index=False)
-                if is_first_write:
-                    is_first_write = False
-                processed_count += 1
-            else:
-                logger.warning(f"No data returned from feature script for replay {replay_id}.")
-
+            if cache is not None and isinstance(source, CorpusDataset):
+                cache.add(dict.fromkeys(replay_ids), processed_df, input_hashes={replay_id: source.input_hash(replay_id) for replay_id in replay_ids})
+            elif cache is not None:
+                cache.add({replay_id: source / replay_id for replay_id in replay_ids}, processed_df)
+            elif not processed_df.empty:
+                writer.write(processed_df)
+            with_rows = replays_with_rows(replay_ids, processed_df)
+            processed_count += len(with_rows)
+            for replay_id in replay_ids:
+                if replay_id not in with_rows:
+                    logger.warning(f"No data returned from feature script for replay {replay_id}.")
         except Exception as e:
-            logger.error(f"Failed to process replay {replay_id}: {e}")
+            logger.error(f"Failed to process replay(s) {', '.join(replay_ids)}: {e}")
+
+    if executor is not None:
+        executor.shutdown()
 
     # Finalization
+    try:
+        if cache is not None:
+            # Merge the new replays into the cache, then write this run's replays (cached and new) in input order
+            cache.commit()
+            computed = set(replay_dirs_to_compute)
+            processed_count += sum(1 for replay_id in replay_dirs if replay_id not in computed and cache.cached_rows(replay_id) > 0)
+            writer.write(cache.read(replay_dirs))
+            cache.close()
+        writer.close()
+    except Exception as e:
+        logger.error(f"Failed to write engineered features to {output_path}: {e}")
+        sys.exit(1)
+
     if processed_count == 0:
         logger.error("No replays were successfully processed. No output file was generated.")
-        # Clean up empty file if it was created
-        if output_path.exists() and is_first_write:
-            output_path.unlink()
         sys.exit(1)
 
-    logger.info(f"Feature engineering process finished. {processed_count} replays processed.")
+    logger.info(f"Feature engineering process finished. {processed_count} replays processed ({writer.rows_written} rows).")
+    if cache is not None:
+        logger.info(f"{len(replay_dirs) - len(replay_dirs_to_compute)} replays were read from the feature cache, {len(replay_dirs_to_compute)} were computed.")
     logger.info(f"Engineered features saved to {output_path}.")
+    if csv_path is not None:
+        logger.info(f"CSV export saved to {csv_path}.")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,17 @@
+import numpy as np
 import pandas as pd
 from loguru import logger
 from internal.feature_script_base import FeatureScriptBase
+from internal.time_series import GroupedTimeSeries, TimeSeries
 
 class SimpleFeatures(FeatureScriptBase):
+    # Only the resources table is used, and nothing after 4 minutes
+    required_data = {
+        "resources": ["timestamp", "p1_minerals", "p1_vespene", "p1_supply_used", "p1_supply_army",
+                      "p2_minerals", "p2_vespene", "p2_supply_used", "p2_supply_army"],
+    }
+    time_window = (None, 4*60)
+
     def process_replay(self, replay_bundle: dict, replay_id: str) -> pd.DataFrame:
         self._init_bundle(replay_bundle)
         logger.info(f"Processing replay {replay_id}.")
@@ -68,94 +77,56 @@ class SimpleFeatures(FeatureScriptBase):
             'max_vespene_bank_4m': 0,
         }
 
-        # Helper to get supply counts at t seconds
-        def get_supply_at_t(df: pd.DataFrame | None, time: int):
-            if df is None or df.empty:
-                return 0, 0, 0, 0 # p1_workers, p1_army, p2_workers, p2_army
+        # Time index over the resources table, every lookup below is a searchsorted call instead of a mask over the table
+        resources = self.time_series("resources")
 
-            # Get the latest row at or before the specified time
-            snapshot = df[df['timestamp'] <= time].iloc[-1]
+        # Helper to get supply counts at each of the times (in seconds)
+        def get_supply_at_t(ts: TimeSeries | None, times: list[int]):
+            if ts is None or len(ts) == 0:
+                return [(0, 0, 0, 0) for _ in times] # p1_workers, p1_army, p2_workers, p2_army
 
-            # Extract supply values
-            p1_army_supply = snapshot.get('p1_supply_army', 0)
-            p1_total_supply = snapshot.get('p1_supply_used', 0)
-            p2_army_supply = snapshot.get('p2_supply_army', 0)
-            p2_total_supply = snapshot.get('p2_supply_used', 0)
+            # Supply values of the latest row at or before each time
+            p1_army_supply = ts.asof('p1_supply_army', times)
+            p1_total_supply = ts.asof('p1_supply_used', times)
+            p2_army_supply = ts.asof('p2_supply_army', times)
+            p2_total_supply = ts.asof('p2_supply_used', times)
 
             # Worker supply is total used supply minus army supply.
             # The raw supply values are doubled to handle 0.5 supply units, so we divide by 2 to get the actual count.
             p1_worker_supply = (p1_total_supply - p1_army_supply) / 2
             p2_worker_supply = (p2_total_supply - p2_army_supply) / 2
-            
+
             # Army supply also needs to be divided by 2
             p1_army_supply /= 2
             p2_army_supply /= 2
 
-            return p1_worker_supply, p1_army_supply, p2_worker_supply, p2_army_supply
+            return list(zip(p1_worker_supply, p1_army_supply, p2_worker_supply, p2_army_supply))
 
-        # Helper to get resource collection rates between two times
-        def get_collection_rates(df: pd.DataFrame | None, start_time: int, end_time: int):
-            if df is None or df.empty:
+        # Helper to get resource collection rates (per minute) between two times
+        def get_collection_rates(ts: TimeSeries | None, start_time: int, end_time: int):
+            if ts is None or len(ts) == 0:
                 return 0, 0, 0, 0 # p1_mpm, p1_vpm, p2_mpm, p2_vpm
 
-            start_snapshot = df[df['timestamp'] <= start_time].iloc[-1]
-            end_snapshot = df[df['timestamp'] <= end_time].iloc[-1]
-
-            p1_minerals_start = start_snapshot.get('p1_minerals', 0)
-            p1_vespene_start = start_snapshot.get('p1_vespene', 0)
-            p2_minerals_start = start_snapshot.get('p2_minerals', 0)
-            p2_vespene_start = start_snapshot.get('p2_vespene', 0)
-
-            p1_minerals_end = end_snapshot.get('p1_minerals', 0)
-            p1_vespene_end = end_snapshot.get('p1_vespene', 0)
-            p2_minerals_end = end_snapshot.get('p2_minerals', 0)
-            p2_vespene_end = end_snapshot.get('p2_vespene', 0)
-
-            # Calculate resources gathered during the interval, casting to signed integers to prevent overflow
-            p1_minerals_gathered = int(p1_minerals_end) - int(p1_minerals_start)
-            p1_vespene_gathered = int(p1_vespene_end) - int(p1_vespene_start)
-            p2_minerals_gathered = int(p2_minerals_end) - int(p2_minerals_start)
-            p2_vespene_gathered = int(p2_vespene_end) - int(p2_vespene_start)
-
-            # Calculate rate per minute
-            interval_minutes = (end_time - start_time) / 60
-            p1_mpm = p1_minerals_gathered / interval_minutes
-            p1_vpm = p1_vespene_gathered / interval_minutes
-            p2_mpm = p2_minerals_gathered / interval_minutes
-            p2_vpm = p2_vespene_gathered / interval_minutes
-
-            return p1_mpm, p1_vpm, p2_mpm, p2_vpm
+            return tuple(ts.rate(column, start_time, end_time) for column in ('p1_minerals', 'p1_vespene', 'p2_minerals', 'p2_vespene'))
 
         # Helper to get the max resource bank for each player up to a certain time
-        def get_max_bank(df: pd.DataFrame | None, end_time: int):
-            if df is None or df.empty:
+        def get_max_bank(ts: TimeSeries | None, end_time: int):
+            if ts is None or len(ts) == 0:
                 return 0, 0, 0, 0 # p1_max_min, p1_max_vesp, p2_max_min, p2_max_vesp
 
-            # Filter the dataframe up to the end time
-            df_filtered = df[df['timestamp'] <= end_time]
-
-            if df_filtered.empty:
-                return 0, 0, 0, 0
-
-            p1_max_minerals = df_filtered['p1_minerals'].max()
-            p1_max_vespene = df_filtered['p1_vespene'].max()
-            p2_max_minerals = df_filtered['p2_minerals'].max()
-            p2_max_vespene = df_filtered['p2_vespene'].max()
-
-            return p1_max_minerals, p1_max_vespene, p2_max_minerals, p2_max_vespene
+            return tuple(ts.running_max(column, end_time) for column in ('p1_minerals', 'p1_vespene', 'p2_minerals', 'p2_vespene'))
 
 
         # Feature calculation
 
         # Get supply values at 3 and 4 minutes
-        p1_workers3, p1_army_supply3, p2_workers3, p2_army_supply3 = get_supply_at_t(self.resources, (3*60))
-        p1_workers4, p1_army_supply4, p2_workers4, p2_army_supply4 = get_supply_at_t(self.resources, (4*60))
+        (p1_workers3, p1_army_supply3, p2_workers3, p2_army_supply3), (p1_workers4, p1_army_supply4, p2_workers4, p2_army_supply4) = get_supply_at_t(resources, [3*60, 4*60])
 
         # Get resource collection rates between 2 and 4 minutes
-        p1_mpm, p1_vpm, p2_mpm, p2_vpm = get_collection_rates(self.resources, (2*60), (4*60))
+        p1_mpm, p1_vpm, p2_mpm, p2_vpm = get_collection_rates(resources, (2*60), (4*60))
 
         # Get max resource bank up to 4 minutes
-        p1_max_min, p1_max_vesp, p2_max_min, p2_max_vesp = get_max_bank(self.resources, (4*60))
+        p1_max_min, p1_max_vesp, p2_max_min, p2_max_vesp = get_max_bank(resources, (4*60))
 
 
         # --- Player 1 Feature Population ---
@@ -213,3 +184,72 @@ class SimpleFeatures(FeatureScriptBase):
         df['enemy_ID'] = df['enemy_ID'].astype('category')
         
         return df
+
+    def process_corpus(self, corpus: dict) -> pd.DataFrame:
+        """The same features as process_replay, computed for a batch of replays at once."""
+        replays = corpus["replays"]
+        resources = corpus["resources"]
+        replay_count = len(replays)
+
+        # Time index over every replay's resources, each query returns one value per replay (in the order of `replays`)
+        ts = GroupedTimeSeries(resources) if resources is not None else None
+        has_resources = ts.sizes > 0 if ts is not None else np.zeros(replay_count, dtype=bool)
+
+        def per_replay(values):
+            return np.where(has_resources, values, 0) # Replays without resource data get 0, like process_replay
+
+        def asof(column: str, time: int):
+            return per_replay(ts.asof(column, time)) if ts is not None else np.zeros(replay_count)
+
+        def rate(column: str, start_time: int, end_time: int):
+            return per_replay(ts.rate(column, start_time, end_time)) if ts is not None else np.zeros(replay_count)
+
+        def running_max(column: str, end_time: int):
+            return per_replay(ts.running_max(column, end_time)) if ts is not None else np.zeros(replay_count)
+
+        # Feature calculation, per player (the raw supply values are doubled, see process_replay)
+        player = {}
+        for p in ('p1', 'p2'):
+            for minute in (3, 4):
+                army = asof(f'{p}_supply_army', minute*60)
+                used = asof(f'{p}_supply_used', minute*60)
+                player[p, f'workers{minute}'] = (used - army) / 2
+                player[p, f'army_supply{minute}'] = army / 2
+            player[p, 'mpm_2_4'] = rate(f'{p}_minerals', (2*60), (4*60))
+            player[p, 'vpm_2_4'] = rate(f'{p}_vespene', (2*60), (4*60))
+            player[p, 'max_mineral_bank_4m'] = running_max(f'{p}_minerals', (4*60))
+            player[p, 'max_vespene_bank_4m'] = running_max(f'{p}_vespene', (4*60))
+
+        # One row per player perspective, pivoted from the per-player arrays
+        perspectives = []
+        for pov, enemy, pov_id in (('p1', 'p2', 1), ('p2', 'p1', 2)):
+            features = pd.DataFrame({
+                'replay_id': replays['replay_id'].to_numpy(),
+                'pov_race': replays[f'{pov}_race'].to_numpy(),
+                'enemy_race': replays[f'{enemy}_race'].to_numpy(),
+                'pov_ID': replays[f'{pov}_name'].to_numpy(),
+                'enemy_ID': replays[f'{enemy}_name'].to_numpy(),
+                'win': (replays['winner'] == pov_id).to_numpy(),
+            }, index=np.arange(replay_count) * 2 + pov_id - 1) # p1 and p2 rows of a replay end up next to each other
+            for minute in (3, 4):
+                features[f'workers{minute}'] = player[pov, f'workers{minute}']
+                features[f'army_supply{minute}'] = player[pov, f'army_supply{minute}']
+                features[f'workers_adv{minute}'] = player[pov, f'workers{minute}'] - player[enemy, f'workers{minute}']
+                features[f'army_supply_adv{minute}'] = player[pov, f'army_supply{minute}'] - player[enemy, f'army_supply{minute}']
+            features['workers_delta_34'] = player[pov, 'workers4'] - player[pov, 'workers3']
+            features['army_supply_delta_34'] = player[pov, 'army_supply4'] - player[pov, 'army_supply3']
+            features['mpm_2_4'] = player[pov, 'mpm_2_4']
+            features['vpm_2_4'] = player[pov, 'vpm_2_4']
+            features['mpm_adv_2_4'] = player[pov, 'mpm_2_4'] - player[enemy, 'mpm_2_4']
+            features['vpm_adv_2_4'] = player[pov, 'vpm_2_4'] - player[enemy, 'vpm_2_4']
+            features['max_mineral_bank_4m'] = player[pov, 'max_mineral_bank_4m']
+            features['max_vespene_bank_4m'] = player[pov, 'max_vespene_bank_4m']
+            perspectives.append(features)
+
+        df = pd.concat(perspectives).sort_index().reset_index(drop=True)
+        df['pov_race'] = df['pov_race'].astype('category')
+        df['enemy_race'] = df['enemy_race'].astype('category')
+        df['pov_ID'] = df['pov_ID'].astype('category')
+        df['enemy_ID'] = df['enemy_ID'].astype('category')
+
+        return df
@@ -0,0 +1,99 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from datetime import datetime
+from loguru import logger
+from internal.exceptions import ModelArtifactError
+from internal.model_artifact import ARTIFACT_SUFFIX
+from internal.model_predictor import DEFAULT_BATCH_ROWS, ID_COLUMNS, PREDICTION_COLUMN, load_predictor, predict_file
+
+log_dir = Path("logs")
+OUTPUT_MODELS_DIR = Path(__file__).parent / "OutputModels"
+OUTPUT_PREDICTIONS_DIR = Path(__file__).parent / "OutputPredictions"
+
+def resolve_model_path(model: str) -> Path:
+    """A model file path, or the name of a model in OutputModels/ (with or without its suffix, artifacts first)."""
+    path = Path(model)
+    if path.exists():
+        return path
+    for candidate in (OUTPUT_MODELS_DIR / model, OUTPUT_MODELS_DIR / f"{model}{ARTIFACT_SUFFIX}", OUTPUT_MODELS_DIR / f"{model}.txt"):
+        if candidate.exists():
+            return candidate
+    raise FileNotFoundError(model)
+
+def serve(predictor):
+    """
+    Scores single games from stdin until it closes: one JSON object of feature values per line in, one JSON object
+    per line out with the game's ID columns (if given) and its prediction, or an 'error' message.
+    """
+    logger.info(f"Serving predictions: one JSON object of the model's {len(predictor.feature_names)} features per line on stdin.")
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            features = json.loads(line)
+            response = {name: features[name] for name in ID_COLUMNS if name in features}
+            response[PREDICTION_COLUMN] = predictor.predict_one(features)
+        except (ValueError, TypeError) as e:
+            response = {"error": str(e)}
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Score games with a model saved by Train-Model.py.")
+    parser.add_argument("model", type=str, help=f"Path of the saved model ({ARTIFACT_SUFFIX} or .txt), or its name in the OutputModels/ directory.")
+    parser.add_argument("features_path", type=str, nargs="?", default=None, help="Engineered features to score (.parquet from Feature-Engineer.py, or a .csv export).")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Where to write the predictions (default: OutputPredictions/<model>_<timestamp>.parquet).")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Rows read and scored at a time.")
+    parser.add_argument("--serve", action="store_true", help="Keep the model loaded and score one game per line of JSON on stdin, writing one line of JSON per game to stdout.")
+    args = parser.parse_args()
+
+    if args.serve == (args.features_path is not None):
+        parser.error("Give either a features file to score or --serve.")
+
+    try:
+        model_path = resolve_model_path(args.model)
+    except FileNotFoundError:
+        logger.error(f"Model not found: {args.model}")
+        return
+    start = time.perf_counter()
+    try:
+        predictor = load_predictor(model_path)
+    except ModelArtifactError as e:
+        logger.error(f"Could not load the model: {e}")
+        return
+    logger.info(f"Loaded model {model_path} ({predictor.booster.num_trees()} trees, {len(predictor.feature_names)} features) in {time.perf_counter() - start:.3f}s.")
+
+    if args.serve:
+        serve(predictor)
+        return
+
+    if args.output is not None:
+        output_path = Path(args.output)
+    else:
+        OUTPUT_PREDICTIONS_DIR.mkdir(exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output_path = OUTPUT_PREDICTIONS_DIR / f"{model_path.stem}_{timestamp}.parquet"
+
+    logger.info(f"Scoring features from: {args.features_path}")
+    start = time.perf_counter()
+    try:
+        result = predict_file(predictor, args.features_path, output_path, args.batch_rows)
+    except FileNotFoundError:
+        logger.error(f"File not found: {args.features_path}")
+        return
+    except ValueError as e:
+        logger.error(f"The features don't match the model: {e}")
+        return
+    elapsed = time.perf_counter() - start
+    logger.info(f"Scored {result['rows']} rows in {elapsed:.3f}s.")
+    if result["accuracy"] is not None:
+        logger.info(f"Accuracy against the features' 'win' column: {result['accuracy']:.4f}")
+    logger.success(f"Predictions saved to: {output_path}")
+
+if __name__ == "__main__":
+    # Configure logging
+    logger.add(log_dir / "predict.log", rotation="10 MB", level="INFO")
+    main()
@@ -1,7 +1,8 @@
 import re
+import json
 import shutil
+import time
 import argparse
-import asyncio
 import multiprocessing
 from pathlib import Path
 import pandas as pd
@@ -10,32 +11,52 @@ import random
 
 from loguru import logger
 
-from sc2.main import _play_replay, get_replay_version
+from sc2.main import _play_replay
 from sc2.observer_ai import ObserverAI
 from sc2.data import Race
-from sc2.sc2process import SC2Process
 from sc2.client import Client
 from sc2.protocol import ProtocolError
 
 import internal.extractor_helper as exh
+from internal.consolidation import consolidate_units, consolidate_deaths, merge_spilled_units
+from internal.compact_units import COMPACT, STANDARD, UNITS_PROFILES, write_compact_units
+from internal.client_pool import ClientWorkerPool, allocate_ports, release_ports, tile_placements
+from internal.job_ledger import JobLedger, EXTRACTING, CONSOLIDATING, DONE, FAILED, OUTPUT_FILES, has_complete_output
+from internal.pipeline_stage import BackgroundStage, Timeline
+from internal.replay_index import ReplayIndex
+from internal.replay_scheduler import read_replay_versions, group_by_version, longest_first_blocks, count_version_switches, expected_client_launches
+from internal.unit_recorder import UnitRecorder, LastSeenTable, SpilledUnits, ROW_BYTES, TYPE, OWNER, POS_X, POS_Y
 
 OUTPUT_DIR = Path("OutputRaw")
 REPLAY_DIR = Path("Replays")
+STAGING_DIR_NAME = ".partial"
+LEDGER_PATH = OUTPUT_DIR / "extraction_ledger.sqlite"
+REPLAY_INDEX_PATH = OUTPUT_DIR / "replay_index.sqlite"
+DEFAULT_SPILL_ROWS = 500_000
+LONGEST_FIRST_BLOCK_JOBS = 4 # With --jobs N, replays are ordered longest first within blocks of 4N
+UNITS_ROW_GROUP_ROWS = 131_072 # units.parquet is sorted by timestamp, so readers can skip row groups outside a time window
 
 class ObserverBot(ObserverAI):
-    def __init__(self, replay_path, observed_id, start_time=0, end_time=7200, interval=20):
+    def __init__(self, replay_path, observed_id, start_time=0, end_time=7200, interval=20, lazy_capture=False, spill_path=None, spill_rows=None):
         super().__init__()
         self.replay_path = replay_path
         self.observed_id = observed_id
         self.start_time = start_time
         self.end_time = end_time
         self.interval = interval
+        self.lazy_capture = lazy_capture
 
         # Unit/Death data
-        self.unit_data = []
+        self.unit_data = UnitRecorder(spill_path, spill_rows) # Spills rows to a Parquet part file if a path is given
+        self.spilled_units = None
         self.death_data = []
-        self.persistent_cache = {}
-        self.interval_cache = {}
+        self.persistent_cache = {} # Eager capture: tag -> latest unit state
+
+        # Lazy capture: units seen on the previous captured step, and the last known state of units that have left it.
+        self.previous_units = {}
+        self.previous_time = 0.0
+        self.previous_flushed = False
+        self.last_seen = LastSeenTable()
 
         # Resource data
         self.resource_totals_data = []
@@ -43,6 +64,14 @@ class ObserverBot(ObserverAI):
         # Upgrade data
         self.upgrade_time_data = []
 
+        # Static game data lookups, filled from the game data in on_start (types and upgrades missing from it are added when first seen)
+        self.unit_types = exh.UnitTypeTable()
+        self.upgrade_types = {}
+
+    async def on_start(self):
+        self.unit_types = exh.UnitTypeTable(self.game_data)
+        self.upgrade_types = exh.upgrade_table(self.game_data)
+
     def _prepare_step(self, state, proto_game_info):
         self.race = Race.Terran #not sure why this is needed, but the program will crash without it. # pyright: ignore[reportAttributeAccessIssue] 
         super()._prepare_step(state, proto_game_info)
@@ -67,41 +96,82 @@ class ObserverBot(ObserverAI):
 
         ### UNITS ###
         # filter out junk from self.all_units
-        snapshots, real_units = exh.split_units(self.all_units, lambda u: u.is_snapshot)
-        filtered_units = snapshots.filter(lambda u: not (exh.resource_snap(u) and u.is_structure)) + real_units
+        filtered_units = exh.filter_units(self.all_units, self.unit_types)
+
+        if self.lazy_capture:
+            self._capture_lazy(filtered_units, iteration)
+            return
 
-        # On every step, update both caches with the latest unit data.
+        # On every step, stage the latest state of each unit (and keep it for death records).
+        unit_data = self.unit_data
+        persistent_cache = self.persistent_cache
+        now = self.time
         for unit in filtered_units:
-            try: # owner id is weird sometimes.
-                owner = unit.owner_id
-            except AttributeError:
-                owner = 0
-            
-            unit_state = {
-                "timestamp": self.time,
-                "unit_tag": unit.tag,
-                "unit_type": unit.type_id.name,
-                "player_id": owner,
-                "position_x": unit.position.x,
-                "position_y": unit.position.y,
-                "is_snapshot": unit.is_snapshot,
-                "health": unit.health,
-                "shield": unit.shield,
-                "energy": unit.energy,
-                "build_progress": unit.build_progress,
-                "resource_remaining": unit.mineral_contents if unit.is_mineral_field else (unit.vespene_contents if unit.is_vespene_geyser else np.nan),
-            }
-            self.persistent_cache[unit.tag] = unit_state
-            self.interval_cache[unit.tag] = unit_state
+            unit_state = self._unit_state(unit, now)
+            persistent_cache[unit_state[1]] = unit_data.stage(unit_state)
 
-        # At the specified interval, flush the interval_cache to the main data list and clear it.
+        # At the specified interval, flush the staged rows to the column buffers.
         if iteration % self.interval == 0:
-            self.unit_data.extend(self.interval_cache.values())
-            self.interval_cache.clear()
+            unit_data.flush()
+
+    def _unit_state(self, unit, timestamp) -> tuple:
+        """Builds a full unit row, ordered as internal.unit_recorder.UNIT_COLUMNS."""
+        try: # owner id is weird sometimes.
+            owner = unit.owner_id
+        except AttributeError:
+            owner = 0
+
+        type_info = self.unit_types[unit]
+        resource_kind = type_info.resource_kind
+        position = unit.position
+        return (
+            timestamp,
+            unit.tag,
+            self.unit_data.intern_type(type_info.name),
+            owner,
+            position.x,
+            position.y,
+            unit.is_snapshot,
+            unit.health,
+            unit.shield,
+            unit.energy,
+            unit.build_progress,
+            unit.mineral_contents if resource_kind == exh.MINERALS else (unit.vespene_contents if resource_kind == exh.VESPENE else np.nan),
+        )
+
+    def _capture_lazy(self, filtered_units, iteration: int):
+        """
+        Same output as the eager capture, but full rows are only built on flush steps and for units that leave the
+        filtered set between flushes (their last state would otherwise be lost).
+        """
+        now = self.time
+        flush = iteration % self.interval == 0
+        current_units = {unit.tag: unit for unit in filtered_units}
+
+        for tag in self.previous_units.keys() - current_units.keys():
+            self._retire_unit(tag, self.previous_units[tag])
+
+        if flush:
+            for unit in current_units.values():
+                self.unit_data.stage(self._unit_state(unit, now))
+            self.unit_data.flush()
+
+        self.previous_units = current_units
+        self.previous_time = now
+        self.previous_flushed = flush
+
+    def _retire_unit(self, tag, unit) -> tuple:
+        """Records the last state of a unit that has left the filtered set since the previous captured step."""
+        unit_state = self._unit_state(unit, self.previous_time)
+        if not self.previous_flushed: # Otherwise this exact state was already flushed on the previous step.
+            self.unit_data.stage(unit_state)
+        self.last_seen.put(tag, unit_state[TYPE], unit_state[OWNER], unit_state[POS_X], unit_state[POS_Y])
+        return unit_state
 
     def close(self):
-        # No files to close anymore
-        pass
+        # Close the unit spill file (if spilling)
+        if self.unit_data._spill_path is not None:
+            self.spilled_units = self.unit_data.close_spill()
 
     async def on_end(self, game_result):
         # This callback is unreliable when the game ends by reaching the end of a replay file (but I'm using it anyway just in case).
@@ -109,15 +179,24 @@ class ObserverBot(ObserverAI):
         pass
 
     async def on_unit_destroyed(self, unit_tag):
-        if unit_tag in self.persistent_cache:
-            unit_data = self.persistent_cache.pop(unit_tag)
+        if self.lazy_capture:
+            unit = self.previous_units.pop(unit_tag, None)
+            if unit is not None:
+                self._retire_unit(unit_tag, unit)
+            last_state = self.last_seen.pop(unit_tag)
+        else:
+            unit_state = self.persistent_cache.pop(unit_tag, None)
+            last_state = unit_state and (unit_state[TYPE], unit_state[OWNER], unit_state[POS_X], unit_state[POS_Y])
+
+        if last_state is not None:
+            type_code, owner, position_x, position_y = last_state
             row_dict = {
                 "timestamp": self.time,
                 "unit_tag": unit_tag,
-                "unit_type": unit_data["unit_type"],
-                "player_id": unit_data["player_id"],
-                "position_x": unit_data["position_x"],
-                "position_y": unit_data["position_y"],
+                "unit_type": self.unit_data.type_name(type_code),
+                "player_id": owner,
+                "position_x": position_x,
+                "position_y": position_y,
             }
             self.death_data.append(row_dict)
 
@@ -137,13 +216,15 @@ class ObserverBot(ObserverAI):
         pass
 
     async def on_upgrade_complete(self, the_upgrade):
-        up_data = self.game_data.upgrades[the_upgrade.value]
-        t_start = self.time - ((up_data.cost.time or 0) / 22.4)
+        up_data = self.upgrade_types.get(the_upgrade.value)
+        if up_data is None:
+            up_data = self.upgrade_types[the_upgrade.value] = exh.upgrade_info(self.game_data.upgrades[the_upgrade.value])
+        t_start = self.time - (up_data.research_time / 22.4)
         new_upgrade = {'time_completed': self.time, 
                        'upgrade': up_data.name, 
                        'player_id': self.observed_id, 
-                       'mineral_cost': up_data.cost.minerals, 
-                       'vespene_cost': up_data.cost.vespene, 
+                       'mineral_cost': up_data.mineral_cost, 
+                       'vespene_cost': up_data.vespene_cost, 
                        'imputed_start': t_start}
         self.upgrade_time_data.append(new_upgrade)
 
@@ -153,53 +234,42 @@ class ObserverBot(ObserverAI):
     async def on_enemy_unit_left_vision(self, unit_tag):
         pass
 
-async def process_perspective(replay_path, observed_id, port, base_build, data_version, start_time, end_time, interval, placement=None):
-    """Processes a single player's perspective of a replay and returns the collected data."""
-    bot = ObserverBot(replay_path, observed_id=observed_id, start_time=start_time, end_time=end_time, interval=interval)
+async def play_perspective(controller, replay_path, observed_id, start_time, end_time, interval, lazy_capture=False, spill_path=None, spill_rows=None):
+    """
+    Plays a single player's perspective of a replay on an already running client and returns the collected data.
+    If spill_path is given, unit data is streamed to that Parquet part file and a SpilledUnits handle is returned in place of the units DataFrame.
+    """
+    bot = ObserverBot(replay_path, observed_id=observed_id, start_time=start_time, end_time=end_time, interval=interval,
+                      lazy_capture=lazy_capture, spill_path=spill_path, spill_rows=spill_rows)
     try:
-        async with SC2Process(port=port, base_build=base_build, data_hash=data_version, placement=placement) as server:
-            await server.ping()
-            client = Client(server._ws)
-            await server.start_replay(
-                replay_path=str(replay_path),
-                realtime=False,
-                observed_id=observed_id
-            )
-            await _play_replay(client, bot, realtime=False, player_id=observed_id) # pyright: ignore[reportGeneralTypeIssues]
+        client = Client(controller._ws)
+        await controller.start_replay(
+            replay_path=str(replay_path),
+            realtime=False,
+            observed_id=observed_id
+        )
+        await _play_replay(client, bot, realtime=False, player_id=observed_id) # pyright: ignore[reportGeneralTypeIssues]
     except ProtocolError as e:
         # This is expected when the replay ends.
         if "Game over" in str(e):
             pass
         else:
-            logger.error(f"Caught unexpected ProtocolError in process_perspective: {e}")
+            logger.error(f"Caught unexpected ProtocolError in play_perspective: {e}")
             raise
     except Exception as e:
-        logger.error(f"Caught exception in process_perspective: {e}")
+        logger.error(f"Caught exception in play_perspective: {e}")
         raise
     finally:
         bot.close()
 
     # Create DataFrames from the bot's collected data
-    units_df = pd.DataFrame(bot.unit_data) if bot.unit_data else pd.DataFrame()
+    units_df = bot.spilled_units if bot.spilled_units is not None else bot.unit_data.to_frame()
     deaths_df = pd.DataFrame(bot.death_data) if bot.death_data else pd.DataFrame()
     resources_df = pd.DataFrame(bot.resource_totals_data) if bot.resource_totals_data else pd.DataFrame()
     upgrades_df = pd.DataFrame(bot.upgrade_time_data) if bot.upgrade_time_data else pd.DataFrame()
     
     return units_df, deaths_df, resources_df, upgrades_df
 
-def process_perspective_wrapper(args):
-    """Synchronous wrapper to run the async process_perspective function for multiprocessing."""
-    # Unpack all arguments for clarity
-    replay_path, observed_id, port, base_build, data_version, start_time, end_time, interval, placement = args
-    
-    setup_logging() # Ensure logger is configured in the child process (prevents verbose logging from the SC2API)
-    try:
-        return asyncio.run(process_perspective(replay_path, observed_id, port, base_build, data_version, start_time, end_time, interval, placement))
-    except Exception as e:
-        logger.error(f"Error in process for player {observed_id} on port {port}: {e}")
-        # Return None or empty DataFrames on failure to ensure the pool doesn't hang
-        return None
-
 def setup_logging():
     """Configures the logger to save logs to a file."""
     log_dir = Path("logs")
@@ -214,6 +284,147 @@ def rm_failed_extraction(game_out_dir, log_inst):
                         except OSError as e:
                             log_inst.critical(f"Error removing directory {game_out_dir}: {e}") #TODO Consider tracking all CRITICAL errors and displaying all of them again when the program exits.
 
+def publish_replay_output(staging_dir, game_output_dir):
+    """
+    Replaces the replay's published files with the consolidated files of the staging directory. Files of an earlier
+    extraction that this one didn't write (a game without deaths or upgrades) are deleted, so the output never mixes
+    two extractions. units.parquet marks a finished replay, so it is removed first and moved last.
+    """
+    (game_output_dir / "units.parquet").unlink(missing_ok=True)
+    for file_name in OUTPUT_FILES:
+        staged_path = staging_dir / file_name
+        if staged_path.exists():
+            staged_path.replace(game_output_dir / file_name)
+        else:
+            (game_output_dir / file_name).unlink(missing_ok=True)
+    staging_dir.rmdir()
+
+def estimate_replay_length(replay_path, start_time, end_time) -> float:
+    """Estimates how many in-game seconds a replay will be played for, using the Duration from Replay-Metadata.py if available."""
+    match = re.search(r"^(\d+)_", replay_path.name)
+    if match:
+        game_num = match.group(1)
+        info_path = OUTPUT_DIR / game_num / f"{game_num}_info.json"
+        try:
+            with open(info_path, 'r') as f:
+                duration = json.load(f).get("Duration")
+            if duration is not None:
+                return max(0, min(duration, end_time) - start_time)
+        except (OSError, ValueError):
+            pass
+    return end_time - start_time # Unknown length, assume the worst case.
+
+def consolidate_replay(replay_name, game_num, game_output_dir, results, spill_rows=None, units_profile=STANDARD) -> bool:
+    """Merges both perspectives of a replay and writes the final Parquet files. Returns False if the extraction failed."""
+    # Check for failures
+    if any(r is None for r in results):
+        logger.error(f"A process failed for replay {replay_name}. Cleaning up output directory.")
+        rm_failed_extraction(game_output_dir, logger)
+        return False
+
+    # Earlier check for None results passed, these asserts are always valid by definition of the if statement. They are included to make the linter happy.
+    assert results[0] is not None
+    assert results[1] is not None
+
+    # Unpack results
+    p1_units_df, p1_deaths_df, p1_resources_df, p1_upgrades_df = results[0]
+    p2_units_df, p2_deaths_df, p2_resources_df, p2_upgrades_df = results[1]
+
+    # A successful run can never have empty resource data (because 0 minerals != null minerals).
+    if p1_resources_df.empty or p2_resources_df.empty:
+        logger.error(f"A process for replay {replay_name} returned empty resource data. This is impossible. Cleaning up output directory.")
+        rm_failed_extraction(game_output_dir, logger)
+        return False
+
+    # A successful run can never have empty unit data (because of starting workers and bases).
+    if p1_units_df.empty or p2_units_df.empty:
+        logger.error(f"A process for replay {replay_name} returned empty unit data. This is impossible. Cleaning up output directory.")
+        rm_failed_extraction(game_output_dir, logger)
+        return False
+
+    logger.info(f"Consolidating data for {game_output_dir.name}...")
+
+    # Files are written to a staging directory and only moved into place once all of them are complete.
+    staging_dir = game_output_dir / STAGING_DIR_NAME
+    staging_dir.mkdir(parents=True, exist_ok=True)
+
+    # Consolidate Unit data
+    final_units_path = staging_dir / "units.parquet"
+    if isinstance(p1_units_df, SpilledUnits) and isinstance(p2_units_df, SpilledUnits):
+        # Streamed perspectives are merged chunk by chunk, so memory use stays bounded by the spill threshold.
+        merge_spilled_units(p1_units_df, p2_units_df, final_units_path, batch_rows=spill_rows or DEFAULT_SPILL_ROWS, units_profile=units_profile)
+        p1_units_df.path.unlink()
+        p2_units_df.path.unlink()
+    else:
+        final_units_df = consolidate_units(p1_units_df, p2_units_df)
+        final_units_df = exh.optimize_unit_dtypes(final_units_df)
+        if units_profile == COMPACT:
+            write_compact_units(final_units_df, final_units_path)
+        else:
+            final_units_df.to_parquet(final_units_path, row_group_size=UNITS_ROW_GROUP_ROWS)
+    logger.info(f"Successfully created consolidated units file: {final_units_path}")
+
+    # Consolidate Death data
+    final_deaths_df = consolidate_deaths(p1_deaths_df, p2_deaths_df)
+    if not final_deaths_df.empty:
+        final_deaths_df = exh.optimize_death_dtypes(final_deaths_df)
+        final_deaths_path = staging_dir / "deaths.parquet"
+        final_deaths_df.to_parquet(final_deaths_path)
+        logger.info(f"Successfully created consolidated deaths file: {final_deaths_path}")
+
+    # Consolidate Resources data
+    p1_resources_df.rename(columns={"minerals": "p1_minerals","vespene": "p1_vespene","supply_cap": "p1_supply_cap","supply_used": "p1_supply_used","supply_army": "p1_supply_army"}, inplace = True)
+    p2_resources_df.rename(columns={"minerals": "p2_minerals","vespene": "p2_vespene","supply_cap": "p2_supply_cap","supply_used": "p2_supply_used","supply_army": "p2_supply_army"}, inplace = True)
+
+    # Double supply values to make 0.5 supply values integers. Supply values can now become uint16_t.
+    supply_cols = ['p1_supply_cap', 'p1_supply_used','p1_supply_army']
+    p1_resources_df[supply_cols] = p1_resources_df[supply_cols] * 2
+    supply_cols = ['p2_supply_cap', 'p2_supply_used','p2_supply_army']
+    p2_resources_df[supply_cols] = p2_resources_df[supply_cols] * 2
+
+    # Fill missing (in case of desync) then merge.
+    combined_resources_df = pd.merge(p1_resources_df, p2_resources_df, on= 'timestamp', how= 'outer')
+    combined_resources_df.sort_values(by='timestamp', inplace=True)
+    combined_resources_df.ffill(inplace=True)
+
+    # Optimize final DF and save.
+    final_resources_df = exh.optimize_resource_dtypes(combined_resources_df)
+    final_resources_path = staging_dir / "resources.parquet"
+    final_resources_df.to_parquet(final_resources_path)
+    logger.info(f"Successfully created consolidated resources file: {final_resources_path}")
+
+    # Optimize upgrade data and save.
+    upgrade_dfs = [df for df in [p1_upgrades_df, p2_upgrades_df] if not df.empty]
+    if upgrade_dfs:
+        combined_upgrades_df = pd.concat(upgrade_dfs, ignore_index=True)
+        combined_upgrades_df.sort_values(by='time_completed', inplace=True)
+        final_upgrades_path = staging_dir / "upgrades.parquet"
+        final_upgrades_df = exh.optimize_upgrade_dtypes(combined_upgrades_df)
+        final_upgrades_df.to_parquet(final_upgrades_path)
+        logger.info(f"Successfully created upgrades file: {final_upgrades_path}")
+    else:
+        logger.info(f"No upgrades found in game {game_num}.")
+
+    publish_replay_output(staging_dir, game_output_dir)
+    logger.info(f"Published output for replay {game_num} to {game_output_dir}")
+    return True
+
+def write_replay(replay_path, game_num, game_output_dir, results, spill_rows, units_profile, timeline, ledger, replay_index):
+    """Writer stage job: consolidates and publishes a replay, cleaning up its output if anything fails."""
+    start = time.time()
+    ledger.record(game_num, replay_path, CONSOLIDATING)
+    try:
+        succeeded = consolidate_replay(replay_path.name, game_num, game_output_dir, results, spill_rows, units_profile)
+        ledger.record(game_num, replay_path, DONE if succeeded else FAILED, error=None if succeeded else "Extraction returned no data.")
+    except Exception as e:
+        # Log error for a single replay (e.g. client crash) and continue
+        logger.error(f"Failed to process replay {replay_path.name}. Error: {e}")
+        rm_failed_extraction(game_output_dir, logger)
+        ledger.record(game_num, replay_path, FAILED, error=str(e))
+    finally:
+        replay_index.set_extraction_status({game_num: ledger.entries[game_num].state})
+        timeline.record(game_num, "consolidate", start, time.time())
+
 if __name__ == "__main__":
     multiprocessing.freeze_support() # For windows OS
 
@@ -226,9 +437,20 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--start", help="The in-game time to start recording data (in seconds).", default=0, type=int)
     parser.add_argument("-e", "--end", help="The in-game time to stop recording and end the replay (in seconds).", default=7200, type=int)
     parser.add_argument("-i", "--interval", help="The time between record entries (in game steps).", default=20, type=int)
-    parser.add_argument("--single-thread", help="Run the extraction in a single thread instead of in parallel.", action="store_true")
+    parser.add_argument("--single-thread", help="Run the extraction with a single game client instead of two in parallel.", action="store_true")
+    parser.add_argument("-j", "--jobs", help="The number of replays to extract at the same time (each uses one game client per perspective).", default=1, type=int)
+    parser.add_argument("--writers", help="The number of background threads that consolidate and write finished replays while the next ones are extracted.", default=1, type=int)
+    parser.add_argument("--spill-rows", help="Stream unit data to disk in chunks of this many rows instead of keeping the whole game in memory.", default=None, type=int)
+    parser.add_argument("--spill-mb", help="Stream unit data to disk in chunks of about this many megabytes instead of keeping the whole game in memory.", default=None, type=float)
+    parser.add_argument("--units-profile", help="Storage profile of units.parquet: 'compact' stores integer game loops, dense unit IDs and quantised positions, zstd compressed and sorted by unit (readers decode it transparently).", choices=UNITS_PROFILES, default=STANDARD)
+    parser.add_argument("--lazy-capture", help="Only build full unit records on interval steps (same output, less work per step).", action="store_true")
     args = parser.parse_args()
 
+    # Replays are only considered finished if they were extracted with the same parameters (lazy capture and spilling don't change the output).
+    extraction_params = {"start": args.start, "end": args.end, "interval": args.interval}
+    ledger = JobLedger(LEDGER_PATH)
+    replay_index = ReplayIndex(REPLAY_INDEX_PATH) # Mirrors the ledger's states, so Feature-Engineer.py can select extracted replays
+
     replay_paths_to_process = []
 
     if args.replay:
@@ -268,205 +490,175 @@ if __name__ == "__main__":
             exit()
         output_dir.mkdir(exist_ok=True) # Creates output directory if needed
 
+        stale_replays = 0
         for replay_file in replays_dir.glob("*.SC2Replay"):
             match = re.search(r"^(\d+)_", replay_file.name)
             if match:
                 game_num = match.group(1)
-                game_output_dir = output_dir / game_num
-                
-                # Check if the directory exists and contains the final parquet file (because the metadata script could have created the directory)
-                if game_output_dir.is_dir() and any(game_output_dir.glob('units.parquet')):
+
+                # The ledger decides what is finished. Only its done state counts, so a crash while writing never looks like a finished replay.
+                if ledger.is_finished(game_num, replay_file, extraction_params):
                     logger.debug(f"Skipping replay {game_num} as it has already been processed.")
                     continue
-                
+                if game_num not in ledger.entries and (output_dir / game_num / "units.parquet").is_file():
+                    # Output from before the ledger existed. Its parameters are unknown, and it was written one file at a time.
+                    if has_complete_output(output_dir / game_num):
+                        ledger.record(game_num, replay_file, DONE)
+                        logger.debug(f"Skipping replay {game_num} as it has already been processed.")
+                        continue
+                    logger.info(f"The output of replay {game_num} from before the ledger existed is incomplete. It will be extracted again.")
+                if ledger.is_stale(game_num, extraction_params):
+                    ledger.mark_stale(game_num)
+                    stale_replays += 1
+
                 replay_paths_to_process.append(replay_file)
 
+        if stale_replays:
+            logger.warning(f"{stale_replays} replay(s) were extracted with different parameters and are marked as stale. They will be extracted again.")
+        logger.info(f"Ledger state before this run: {ledger.counts()}")
+
+    replay_index.set_extraction_status({game_num: entry.state for game_num, entry in ledger.entries.items()})
+
     # Process all collected paths
     if not replay_paths_to_process:
         logger.info("No replays found or no new replays to process.")
     else:
         random.shuffle(replay_paths_to_process)
         logger.info(f"Found {len(replay_paths_to_process)} replay(s) to process.")
+
+        # Read every replay's game version up front, and group replays by version so clients rarely need to switch binaries.
+        replay_versions, version_errors = read_replay_versions(replay_paths_to_process)
+        for rp, error in version_errors.items():
+            if match := re.search(r"^(\d+)_", rp.name):
+                ledger.record(match.group(1), rp, FAILED, error=f"Could not read the game version: {error}")
+        if version_errors:
+            logger.warning(f"{len(version_errors)} replay(s) whose game version can't be read are marked as failed.")
+        version_groups = group_by_version(replay_paths_to_process, replay_versions)
+        if args.jobs > 1:
+            # Longest replays first within small blocks, so short ones fill the gaps instead of a long one running alone at the end of a
+            # group. Sorting whole groups would make a stopped run extract only the longest replays.
+            for group in version_groups:
+                group[:] = longest_first_blocks(group, LONGEST_FIRST_BLOCK_JOBS * args.jobs, lambda rp: estimate_replay_length(rp, args.start, args.end))
+        shuffled_switches = count_version_switches(replay_paths_to_process, replay_versions)
+        replay_paths_to_process = [rp for group in version_groups for rp in group]
+        logger.info(f"Scheduled {len(replay_paths_to_process)} replay(s) in {len(version_groups)} game version group(s): "
+                    f"{count_version_switches(replay_paths_to_process, replay_versions)} version switch(es) in queue order, down from {shuffled_switches}.")
         
+        ledger.mark_queued([(match.group(1), rp) for rp in replay_paths_to_process if (match := re.search(r"^(\d+)_", rp.name))])
+
         stop_file_path = Path("STOP")
+        print("\nTo halt batch early, create a file named 'STOP' in the project directory.")
+
+        # Set processing mode
+        # 2 clients per replay for parallel, 1 for single-threaded.
+        jobs = max(1, args.jobs)
+        num_workers = jobs if args.single_thread else 2 * jobs
+        if args.single_thread:
+            logger.info(f"Running in single-threaded mode with {jobs} replay(s) at a time.")
+        else:
+            logger.info(f"Running in parallel mode with {jobs} replay(s) at a time.")
+
+        # Streaming mode: the smaller of the row and byte thresholds decides when a worker writes out its unit data.
+        spill_rows = None
+        if args.spill_rows or args.spill_mb:
+            thresholds = [args.spill_rows or DEFAULT_SPILL_ROWS]
+            if args.spill_mb:
+                thresholds.append(int(args.spill_mb * 2**20 // ROW_BYTES))
+            spill_rows = max(1, min(thresholds))
+            logger.info(f"Streaming unit data to disk every {spill_rows} rows.")
+        if args.units_profile == COMPACT:
+            logger.info("Writing units.parquet with the compact storage profile.")
+
+        # Each worker keeps its own game client alive between replays.
+        ports = allocate_ports(num_workers)
+        placements = tile_placements(num_workers)
 
         total_replays = len(replay_paths_to_process)
-        for i, rp in enumerate(replay_paths_to_process):
-            current_replay_number = i + 1
-            logger.info(f"Starting replay {current_replay_number}/{total_replays}")
-            if stop_file_path.exists():
-                logger.info("'STOP' file detected. Aborting batch process.")
-                stop_file_path.unlink() # Clean up the stop file
-                break # Exit the batch processing loop
-
-            try:
-                absolute_path = rp.resolve()
-                if not absolute_path.is_file():
-                    logger.error(f"Replay file not found at path: {absolute_path}")
-                    continue
-                
-                print("\nTo halt batch early, create a file named 'STOP' in the project directory.")
-                logger.info(f"Processing {absolute_path.name}...")
-
-                # Get game number from current replay filename
-                game_num_match = re.search(r"^(\d+)_", rp.name)
-                if not game_num_match:
-                    logger.warning(f"Could not extract game number from {rp.name}. Skipping.")
-                    continue
-                game_num = game_num_match.group(1)
-                game_output_dir = OUTPUT_DIR / game_num
-                game_output_dir.mkdir(parents=True, exist_ok=True)
-
-                # Set processing mode for the replay
-                # 2 for parallel, 1 for single-threaded.
-                num_processes = 1 if args.single_thread else 2
-                if args.single_thread:
-                    logger.info("Running in single-threaded mode.")
-                else:
-                    logger.info("Running in parallel mode.")
-
-                try:
-                    base_build, data_version = get_replay_version(absolute_path)
-                except Exception as e:
-                    logger.error(f"Could not get replay version for {absolute_path.name}: {e}")
+        pending_replays = iter(enumerate(replay_paths_to_process))
+        in_flight = {} # game_num -> (replay path, output dir, {player_id: result})
+        max_in_flight = jobs + 1 # Queue the next replay while the current ones finish, so no worker sits idle.
+        stopping = False
+        timeline = Timeline()
+
+        # Finished replays are consolidated and written in the background while the clients move on to the next ones.
+        writer = BackgroundStage("writer", max_workers=max(1, args.writers))
+        with writer, ClientWorkerPool(play_perspective, ports, placements, setup=setup_logging) as pool:
+            while True:
+                # Queue replays until the lookahead is full
+                while not stopping and len(in_flight) < max_in_flight:
+                    next_replay = next(pending_replays, None)
+                    if next_replay is None:
+                        stopping = True
+                        break
+                    i, rp = next_replay
+
+                    if stop_file_path.exists():
+                        logger.info("'STOP' file detected. Aborting batch process after the replays in progress.")
+                        stop_file_path.unlink() # Clean up the stop file
+                        stopping = True
+                        break
+
+                    current_replay_number = i + 1
+                    logger.info(f"Queueing replay {current_replay_number}/{total_replays}")
+                    try:
+                        absolute_path = rp.resolve()
+                        if not absolute_path.is_file():
+                            logger.error(f"Replay file not found at path: {absolute_path}")
+                            continue
+
+                        # Get game number from current replay filename
+                        game_num_match = re.search(r"^(\d+)_", rp.name)
+                        if not game_num_match:
+                            logger.warning(f"Could not extract game number from {rp.name}. Skipping.")
+                            continue
+                        game_num = game_num_match.group(1)
+                        game_output_dir = OUTPUT_DIR / game_num
+                        game_output_dir.mkdir(parents=True, exist_ok=True)
+
+                        base_build, data_version = replay_versions[rp]
+                        ledger.record(game_num, absolute_path, EXTRACTING, params=extraction_params)
+
+                        logger.info(f"Processing {absolute_path.name}...")
+                        # Jobs are hardcoded at 2, because there are 2 perspectives. Hypothetically for team games, this would still be true because vision is shared between team members.
+                        # It isn't exactly that simple though because you would have to work out which player_ids correspond to each team (maybe it's just 1 + 2 vs. 3 + 4).
+                        if spill_rows:
+                            (game_output_dir / STAGING_DIR_NAME).mkdir(exist_ok=True)
+                        for player_id in (1, 2):
+                            spill_path = game_output_dir / STAGING_DIR_NAME / f"units_p{player_id}.part.parquet" if spill_rows else None
+                            job_args = (absolute_path, player_id, args.start, args.end, args.interval, args.lazy_capture, spill_path, spill_rows)
+                            pool.submit((game_num, player_id), base_build, data_version, job_args)
+                        in_flight[game_num] = (rp, game_output_dir, {})
+                    except Exception as e:
+                        logger.error(f"Failed to queue replay {rp.name}. Error: {e}")
+                        failed_match = re.search(r"^(\d+)_", rp.name)
+                        if failed_match:
+                            ledger.record(failed_match.group(1), rp, FAILED, error=str(e))
+
+                if not in_flight:
+                    break
+
+                # Collect results, and hand a replay to the writer stage once both of its perspectives are done
+                job_id, result = pool.get_result()
+                game_num, player_id = job_id
+                finished_at = time.time()
+                timeline.record(game_num, f"extract p{player_id}", pool.started_at.pop(job_id, finished_at), finished_at)
+                rp, game_output_dir, perspective_results = in_flight[game_num]
+                perspective_results[player_id] = result
+                if len(perspective_results) < 2:
                     continue
+                del in_flight[game_num]
+
+                # Blocks only if the writer stage already has a full backlog.
+                results = [perspective_results[1], perspective_results[2]]
+                writer.submit(write_replay, rp, game_num, game_output_dir, results, spill_rows, args.units_profile, timeline, ledger, replay_index)
+
+            logger.info(f"Game client launches: {pool.client_launches} (expected {expected_client_launches(version_groups, num_workers)} with {num_workers} worker(s)).")
+
+        # The pool shuts down first and the writer stage then finishes the last replays, so the summary covers every replay.
+        timeline.log_summary("extract", "consolidate")
+        release_ports(ports)
 
-                # Prepare arguments for workers
-                ports = [5001, 5002]
-                placements = [(0, 0), (960, 0)]
-                tasks = [] # Tasks are hardcoded at 2, because there are 2 perspectives. Hypothetically for team games, this would still be true because vision is shared between team members.
-                           # It isn't exactly that simple though because you would have to work out which player_ids correspond to each team (maybe it's just 1 + 2 vs. 3 + 4).
-                for i in range(2):
-                    player_id = i + 1
-                    task_args = (
-                        absolute_path, player_id, ports[i], base_build, data_version, 
-                        args.start, args.end, args.interval, placements[i]
-                    )
-                    tasks.append(task_args)
-
-                # Run workers and collect results
-                with multiprocessing.Pool(processes=num_processes) as pool:
-                    results = pool.map(process_perspective_wrapper, tasks)
-
-                # Check for failures
-                if any(r is None for r in results):
-                    logger.error(f"A process failed for replay {rp.name}. Cleaning up output directory.")
-                    rm_failed_extraction(game_output_dir, logger)
-                    continue # Move to the next replay
-                else:
-                    # Consolidate successful results
-                    
-                    # Earlier check for None results passed, these asserts are always valid by definition of the if statement. They are included to make the linter happy.
-                    assert results[0] is not None
-                    assert results[1] is not None
-
-                    # Unpack results
-                    p1_units_df, p1_deaths_df, p1_resources_df, p1_upgrades_df = results[0]
-                    p2_units_df, p2_deaths_df, p2_resources_df, p2_upgrades_df = results[1]
-
-                    # A successful run can never have empty resource data (because 0 minerals != null minerals).
-                    if p1_resources_df.empty or p2_resources_df.empty:
-                        logger.error(f"A process for replay {rp.name} returned empty resource data. This is impossible. Cleaning up output directory.")
-                        rm_failed_extraction(game_output_dir, logger)
-                        continue # Move to the next replay
-
-                    # A successful run can never have empty unit data (because of starting workers and bases).
-                    if p1_units_df.empty or p2_units_df.empty:
-                        logger.error(f"A process for replay {rp.name} returned empty unit data. This is impossible. Cleaning up output directory.")
-                        rm_failed_extraction(game_output_dir, logger)
-                        continue # Move to the next replay
-
-                    logger.info(f"Consolidating data for {game_output_dir.name}...")
-
-                    # Consolidate Unit data
-                    p1_units_df["is_visible_to_player_1"] = True
-                    p2_units_df["is_visible_to_player_2"] = True
-                    
-                    combined_units_df = pd.concat([p1_units_df, p2_units_df], ignore_index=True)
-                    
-                    bool_cols = ["is_visible_to_player_1", "is_visible_to_player_2"]
-                    for col in bool_cols:
-                        combined_units_df[col] = combined_units_df[col].astype('boolean').fillna(False).astype(bool)
-                    # Handle situations where units leave vision between the logging intervals:
-                    combined_units_df.loc[combined_units_df["player_id"] == 1, "is_visible_to_player_1"] = True
-                    combined_units_df.loc[combined_units_df["player_id"] == 2, "is_visible_to_player_2"] = True
-                    # NB: This does not apply to neutral units in the same way.
-
-                    agg_dict = {col: 'first' for col in combined_units_df.columns if col not in bool_cols}
-                    for col in bool_cols:
-                        agg_dict[col] = 'max'
-                    
-                    final_units_df = combined_units_df.groupby(["timestamp", "unit_tag"], as_index=False).agg(agg_dict)
-                    final_units_df["is_ground_truth_for_player_1"] = final_units_df["player_id"] == 1
-                    final_units_df["is_ground_truth_for_player_2"] = final_units_df["player_id"] == 2
-                    final_units_df["is_neutral"] = ~final_units_df["player_id"].isin([1, 2])
-
-                    final_units_df = exh.optimize_unit_dtypes(final_units_df)
-                    final_units_path = game_output_dir / "units.parquet"
-                    final_units_df.to_parquet(final_units_path)
-                    logger.info(f"Successfully created consolidated units file: {final_units_path}")
-
-                    # Consolidate Death data
-                    if not p1_deaths_df.empty:
-                        p1_deaths_df["is_visible_to_player_1"] = True
-                    if not p2_deaths_df.empty:
-                        p2_deaths_df["is_visible_to_player_2"] = True
-
-                    death_dfs = [df for df in [p1_deaths_df, p2_deaths_df] if not df.empty]
-                    if death_dfs:
-                        combined_deaths_df = pd.concat(death_dfs, ignore_index=True)
-                        
-                        death_bool_cols = ["is_visible_to_player_1", "is_visible_to_player_2"]
-                        for col in death_bool_cols:
-                            if col not in combined_deaths_df.columns:
-                                combined_deaths_df[col] = False
-                            else:
-                                combined_deaths_df[col] = combined_deaths_df[col].astype('boolean').fillna(False).astype(bool)
-
-                        death_agg_dict = {col: 'first' for col in combined_deaths_df.columns if col not in death_bool_cols}
-                        for col in death_bool_cols:
-                            death_agg_dict[col] = 'max'
-
-                        final_deaths_df = combined_deaths_df.groupby(["timestamp", "unit_tag"], as_index=False).agg(death_agg_dict)
-                        
-                        final_deaths_df = exh.optimize_death_dtypes(final_deaths_df)
-                        final_deaths_path = game_output_dir / "deaths.parquet"
-                        final_deaths_df.to_parquet(final_deaths_path)
-                        logger.info(f"Successfully created consolidated deaths file: {final_deaths_path}")
-
-                    # Consolidate Resources data
-                    p1_resources_df.rename(columns={"minerals": "p1_minerals","vespene": "p1_vespene","supply_cap": "p1_supply_cap","supply_used": "p1_supply_used","supply_army": "p1_supply_army"}, inplace = True)
-                    p2_resources_df.rename(columns={"minerals": "p2_minerals","vespene": "p2_vespene","supply_cap": "p2_supply_cap","supply_used": "p2_supply_used","supply_army": "p2_supply_army"}, inplace = True)
-
-                    # Double supply values to make 0.5 supply values integers. Supply values can now become uint16_t.
-                    supply_cols = ['p1_supply_cap', 'p1_supply_used','p1_supply_army']
-                    p1_resources_df[supply_cols] = p1_resources_df[supply_cols] * 2
-                    supply_cols = ['p2_supply_cap', 'p2_supply_used','p2_supply_army']
-                    p2_resources_df[supply_cols] = p2_resources_df[supply_cols] * 2
-
-                    # Fill missing (in case of desync) then merge.
-                    combined_resources_df = pd.merge(p1_resources_df, p2_resources_df, on= 'timestamp', how= 'outer')
-                    combined_resources_df.sort_values(by='timestamp', inplace=True)
-                    combined_resources_df.ffill(inplace=True)
-
-                    # Optimize final DF and save.
-                    final_resources_df = exh.optimize_resource_dtypes(combined_resources_df)
-                    final_resources_path = game_output_dir / "resources.parquet"
-                    final_resources_df.to_parquet(final_resources_path)
-                    logger.info(f"Successfully created consolidated resources file: {final_resources_path}")
-
-                    # Optimize upgrade data and save.
-                    upgrade_dfs = [df for df in [p1_upgrades_df, p2_upgrades_df] if not df.empty]
-                    if upgrade_dfs:
-                        combined_upgrades_df = pd.concat(upgrade_dfs, ignore_index=True)
-                        combined_upgrades_df.sort_values(by='time_completed', inplace=True)
-                        final_upgrades_path = game_output_dir / "upgrades.parquet"
-                        final_upgrades_df = exh.optimize_upgrade_dtypes(combined_upgrades_df)
-                        final_upgrades_df.to_parquet(final_upgrades_path)
-                        logger.info(f"Successfully created upgrades file: {final_upgrades_path}")
-                    else:
-                        logger.info(f"No upgrades found in game {game_num}.")
-
-            except Exception as e:
-                # Log error for a single replay (e.g. client crash) and continue
-                logger.error(f"Failed to process replay {rp.name}. Error: {e}")
\ No newline at end of file
+    # Replays that failed before reaching the writer stage, or were left queued by a STOP
+    replay_index.set_extraction_status({game_num: entry.state for game_num, entry in ledger.entries.items()})
+    replay_index.close()
+    ledger.close()
@@ -1,44 +1,96 @@
-import mpyq
+import os
 import json
 from pathlib import Path
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 import re
+import pandas as pd
 from loguru import logger
 
-def get_replay_info(replay_path: Path, output_path: Path | None = None):
-    with replay_path.open("rb") as f:
-        replay_data = f.read()
-        replay_io = BytesIO()
-        replay_io.write(replay_data)
-        replay_io.seek(0)
-        archive = mpyq.MPQArchive(replay_io).extract()
-        metadata = json.loads(archive[b"replay.gamemetadata.json"].decode("utf-8")) # pyright: ignore[reportOptionalMemberAccess]
-
-        # Extract player names from the filename (so we don't need to load the replay)
-        replay_name_parts = replay_path.stem.split("_")
-        if len(replay_name_parts) >= 3: # Expecting at least GameNumber_Player1Name_Player2Name_Map
-            player1_name = replay_name_parts[1]
-            player2_name = replay_name_parts[2]
-
-            player_names_map = {
-                1: player1_name,
-                2: player2_name
-            }
-
-            for player_meta in metadata['Players']:
-                player_id = player_meta['PlayerID']
-                if player_id in player_names_map:
-                    player_meta['PlayerName'] = player_names_map[player_id]
-        else:
-            logger.warning(f"Could not parse player names from filename: {replay_path.name}. Expected format: GameNumber_Player1Name_Player2Name_MapName.SC2Replay")
+from internal.job_ledger import DONE, JobLedger, has_complete_output
+from internal.replay_archive import read_replay_metadata
+from internal.replay_index import DEFAULT_INDEX_PATH, ReplayIndex, index_row
+
+METADATA_TABLE_PATH = Path("OutputRaw") / "replay_metadata.parquet"
+LEDGER_PATH = Path("OutputRaw") / "extraction_ledger.sqlite" # Written by Replay-Extractor.py
+
+def get_replay_info(replay_path: Path, output_path: Path | None = None) -> dict:
+    # Only replay.gamemetadata.json is read and decompressed, not the whole archive.
+    metadata = read_replay_metadata(replay_path)
+
+    # Extract player names from the filename (so we don't need to load the replay)
+    replay_name_parts = replay_path.stem.split("_")
+    if len(replay_name_parts) >= 3: # Expecting at least GameNumber_Player1Name_Player2Name_Map
+        player1_name = replay_name_parts[1]
+        player2_name = replay_name_parts[2]
+
+        player_names_map = {
+            1: player1_name,
+            2: player2_name
+        }
 
-        if output_path:
-            with open(output_path, "w") as out_f:
-                json.dump(metadata, out_f, indent=4)
-            logger.info(f"Successfully wrote metadata to {output_path}")
+        for player_meta in metadata['Players']:
+            player_id = player_meta['PlayerID']
+            if player_id in player_names_map:
+                player_meta['PlayerName'] = player_names_map[player_id]
+    else:
+        logger.warning(f"Could not parse player names from filename: {replay_path.name}. Expected format: GameNumber_Player1Name_Player2Name_MapName.SC2Replay")
+
+    if output_path:
+        with open(output_path, "w") as out_f:
+            json.dump(metadata, out_f, indent=4)
+
+    return metadata
+
+def process_replay(replay_path: Path, output_path: Path | None):
+    """Pool job. Returns (replay_path, metadata, error), so a broken replay doesn't stop the batch."""
+    try:
+        return replay_path, get_replay_info(replay_path, output_path), None
+    except Exception as e:
+        return replay_path, None, str(e)
+
+def extraction_states(replay_ids: set[str]) -> dict[str, str]:
+    """
+    The extraction state of replays the index has none for: the extraction ledger's, or done if the replay has
+    complete output (extracted before the ledger existed, see has_complete_output). Replays with neither are left out.
+    """
+    states = {}
+    if LEDGER_PATH.is_file():
+        with JobLedger(LEDGER_PATH) as ledger:
+            states = {game_num: entry.state for game_num, entry in ledger.entries.items() if game_num in replay_ids}
+    for replay_id in replay_ids - states.keys():
+        if has_complete_output(Path("OutputRaw") / replay_id):
+            states[replay_id] = DONE
+    return states
+
+def metadata_row(replay_path: Path, metadata: dict) -> dict:
+    """Flattens a replay's metadata into one table row. Player fields become p{PlayerID}_{field} columns."""
+    match = re.search(r"^(\d+)_", replay_path.name)
+    row = {"replay_name": replay_path.name, "game_num": match.group(1) if match else None}
+    for key, value in metadata.items():
+        if key == "Players":
+            for player in value:
+                for field, field_value in player.items():
+                    if field != "PlayerID":
+                        row[f"p{player['PlayerID']}_{field}"] = field_value
         else:
-            print(json.dumps(metadata, indent=4))
+            row[key] = json.dumps(value) if isinstance(value, (dict, list)) else value
+    return row
+
+def write_metadata_table(rows: list[dict], table_path: Path, existing_df: pd.DataFrame | None = None):
+    """Writes (or updates) the consolidated metadata table. New rows replace existing rows of the same replay."""
+    table_df = pd.DataFrame(rows)
+    if existing_df is not None and not existing_df.empty:
+        existing_df = existing_df[~existing_df["replay_name"].isin(table_df["replay_name"])]
+        table_df = pd.concat([existing_df, table_df], ignore_index=True)
+    table_df = table_df.sort_values("replay_name", ignore_index=True)
+
+    # Write next to the table and rename, so an interrupted write never leaves a broken table behind.
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = table_path.with_suffix(".parquet.tmp")
+    table_df.to_parquet(temp_path, index=False)
+    temp_path.replace(table_path)
+    logger.info(f"Wrote metadata table with {len(table_df)} replay(s) to {table_path}")
 
 if __name__ == "__main__":
     logger.add("replay_metadata.log", level="INFO", rotation="5 MB", retention=5, format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}", enqueue=True)
@@ -49,6 +101,9 @@ if __name__ == "__main__":
     parser.add_argument("replay", nargs='?', default=None, type=str, help="The replay number, filename, or full path. If omitted, all new replays will be processed.")
     parser.add_argument("--no-file", help="Do not write output to a file, print to console instead.", action="store_true")
     parser.add_argument("--regen", help="Force regeneration of metadata for all specified replays, even if it already exists.", action="store_true")
+    parser.add_argument("--table", help=f"Also write all metadata to a single Parquet table ({METADATA_TABLE_PATH}).", action="store_true")
+    parser.add_argument("--table-only", help="Only write the Parquet table, not the per-replay _info.json files.", action="store_true")
+    parser.add_argument("-w", "--workers", help="The number of processes that read replays in parallel. Defaults to the number of CPUs.", default=os.cpu_count() or 1, type=int)
     args = parser.parse_args()
 
     replay_paths_to_process = []
@@ -97,33 +152,83 @@ if __name__ == "__main__":
     else:
         logger.info(f"Found {len(replay_paths_to_process)} replay(s) to process.")
         skipped_count = 0
-        
+        write_table = args.table or args.table_only
+
+        # Replays already in the table and the index only need to be read again if their _info.json is missing (or with --regen).
+        replay_index = ReplayIndex(DEFAULT_INDEX_PATH) if not args.no_file else None
+        indexed_replays = replay_index.indexed_metadata() if replay_index is not None else set()
+        existing_table_df = None
+        tabled_replays = set()
+        if write_table and METADATA_TABLE_PATH.is_file():
+            existing_table_df = pd.read_parquet(METADATA_TABLE_PATH)
+            tabled_replays = set(existing_table_df["replay_name"])
+
+        jobs = []
         for rp in replay_paths_to_process:
-            try:
-                absolute_path = rp.resolve()
-                if not absolute_path.is_file():
-                    logger.error(f"Replay file not found at path: {absolute_path}")
-                    continue
-                
-                output_path = None
-                if not args.no_file:
-                    match = re.search(r"^(\d+)_", absolute_path.name)
-                    if match:
-                        game_num = match.group(1)
-                        output_dir = Path("OutputRaw") / game_num
-                        output_dir.mkdir(parents=True, exist_ok=True)
-                        output_path = output_dir / f"{game_num}_info.json"
-
-                if not args.regen and output_path and output_path.is_file():
-                    logger.debug(f"Metadata for {absolute_path.name} already exists, skipping.")
-                    skipped_count += 1
-                    continue
-
-                logger.info(f"Processing {absolute_path.name}...")
-                get_replay_info(absolute_path, output_path)
-
-            except Exception as e:
-                logger.error(f"Failed to process replay {rp.name}. Error: {e}")
-        
+            absolute_path = rp.resolve()
+            if not absolute_path.is_file():
+                logger.error(f"Replay file not found at path: {absolute_path}")
+                continue
+
+            output_path = None
+            match = re.search(r"^(\d+)_", absolute_path.name)
+            if not args.no_file and not args.table_only:
+                if match:
+                    game_num = match.group(1)
+                    output_dir = Path("OutputRaw") / game_num
+                    output_dir.mkdir(parents=True, exist_ok=True)
+                    output_path = output_dir / f"{game_num}_info.json"
+
+            needs_json = args.no_file or (output_path is not None and not output_path.is_file())
+            needs_table = write_table and absolute_path.name not in tabled_replays
+            needs_index = replay_index is not None and match is not None and match.group(1) not in indexed_replays
+            if not args.regen and not needs_json and not needs_table and not needs_index:
+                logger.debug(f"Metadata for {absolute_path.name} already exists, skipping.")
+                skipped_count += 1
+                continue
+
+            jobs.append((absolute_path, output_path if (args.regen or needs_json) else None))
+
+        rows = []
+        index_rows = []
+        workers = max(1, min(args.workers, len(jobs)))
+        logger.info(f"Reading metadata of {len(jobs)} replay(s) with {workers} process(es)...")
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(process_replay, *zip(*jobs), chunksize=max(1, len(jobs) // (workers * 8)))
+        else:
+            executor = None
+            results = (process_replay(*job) for job in jobs)
+
+        for (replay_path, output_path), (_, metadata, error) in zip(jobs, results):
+            if error is not None:
+                logger.error(f"Failed to process replay {replay_path.name}. Error: {error}")
+                continue
+            if args.no_file:
+                print(json.dumps(metadata, indent=4))
+            elif output_path:
+                logger.info(f"Successfully wrote metadata to {output_path}")
+            if write_table:
+                rows.append(metadata_row(replay_path, metadata))
+            if replay_index is not None and (match := re.search(r"^(\d+)_", replay_path.name)):
+                index_rows.append(index_row(match.group(1), metadata, replay_path))
+
+        if executor is not None:
+            executor.shutdown()
+
+        if write_table and rows:
+            write_metadata_table(rows, METADATA_TABLE_PATH, existing_table_df)
+
+        if replay_index is not None:
+            if index_rows:
+                replay_index.add_metadata(index_rows)
+                logger.info(f"Updated the replay index ({DEFAULT_INDEX_PATH}) with {len(index_rows)} replay(s).")
+            # Replays indexed before they were extracted, or extracted before the index existed, get their status here
+            states = extraction_states(replay_index.without_extraction_status())
+            if states:
+                replay_index.set_extraction_status(states)
+                logger.info(f"Recorded the extraction status of {len(states)} replay(s) in the replay index.")
+            replay_index.close()
+
         if skipped_count > 0:
             logger.info(f"Skipped {skipped_count} replays that were already processed.")
@@ -1,11 +1,18 @@
 import argparse
-import pandas as pd
 import importlib
 import sys
+import time
 from pathlib import Path
 from datetime import datetime
+import pandas as pd
+from sklearn.metrics import accuracy_score
 from sklearn.model_selection import GroupShuffleSplit
+from lightgbm import LGBMClassifier
 from loguru import logger
+from internal.dataset_cache import DEFAULT_CACHE_SIZE_MB, DEFAULT_DATASET_CACHE_DIR, DatasetCache
+from internal.feature_store import read_features
+from internal.model_artifact import ARTIFACT_SUFFIX, write_artifact
+from internal.model_search import booster_params, cross_validate, fit_on_dataset, search_candidates
 
 log_dir = Path("logs")
 
@@ -13,22 +20,150 @@ log_dir = Path("logs")
 MODEL_SCRIPTS_DIR = Path(__file__).parent / 'ModelScripts'
 sys.path.append(str(MODEL_SCRIPTS_DIR))
 
+DATASET_CACHE_DIR = Path(__file__).parent / DEFAULT_DATASET_CACHE_DIR # Next to OutputModels/, wherever the script is run from
+
+# How the rows are split, part of the dataset cache key
+HOLDOUT_SPLIT = "GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42) on replay_id"
+CV_SPLIT = "all rows"
+
+def load_features(features_path):
+    """The feature file as a DataFrame, or None (logged) if it doesn't exist."""
+    logger.info(f"Loading data from: {features_path}")
+    try:
+        return read_features(features_path) # Parquet keeps the categorical columns as categories
+    except FileNotFoundError:
+        logger.error(f"File not found: {features_path}")
+        return None
+
+def open_cache_entry(args, cache, model_script, split: str):
+    """The dataset cache key of this run and its cached entry (None on a miss, or without a cache)."""
+    if cache is None:
+        return None, None
+    key = cache.key(args.features_path, model_script, split, booster_params(model_script.get_model())[0])
+    cached = cache.load(key)
+    if cached is not None:
+        logger.info(f"Loaded the prepared and binned features from the dataset cache ({cache.path(key)}).")
+        evict_cache_entries(cache, key)
+    return key, cached
+
+def store_cache_entry(cache, key: str, *args, **kwargs):
+    """Bins and caches the training rows (see DatasetCache.store), then evicts old entries if the cache is too large."""
+    cached = cache.store(key, *args, **kwargs)
+    logger.debug(f"Cached the binned features in: {cache.path(key)}")
+    evict_cache_entries(cache, key)
+    return cached
+
+def evict_cache_entries(cache, key: str):
+    for path in cache.evict(keep=key):
+        logger.info(f"Evicted {path.name} from the dataset cache.")
+
+def save_model(args, model, feature_columns: list[str], metadata: dict) -> Path:
+    """Saves a fitted model to OutputModels/ in the --save-format, with the training metadata if it's an artifact."""
+    output_models_dir = Path(__file__).parent / "OutputModels"
+    output_models_dir.mkdir(exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    suffix = ARTIFACT_SUFFIX if args.save_format == "artifact" else ".txt"
+    model_filename = f"{args.model_script_name}_{timestamp}{suffix}"
+    model_path = output_models_dir / model_filename
+
+    logger.debug(f"Saving model to: {model_path}")
+    if args.save_format == "artifact":
+        metadata = {
+            "model_script": args.model_script_name,
+            "features_path": str(args.features_path),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            **metadata,
+            "params": model.get_params(),
+        }
+        write_artifact(model_path, model.booster_, feature_columns, metadata, prediction_only=args.prediction_only)
+    else:
+        model.booster_.save_model(model_path)
+    logger.success(f"Model saved to: {model_path}")
+    return model_path
+
+def run_cross_validation(args, model_script, cache):
+    """
+    --cv / --search: cross-validates the model script's model (and with --search, each candidate of its search space)
+    with GroupKFold on replay_id, prints the results table, and with --save refits the best parameters on all the data.
+    """
+    folds = args.cv or 5
+    key, cached = open_cache_entry(args, cache, model_script, CV_SPLIT)
+    if cached is None:
+        df = load_features(args.features_path)
+        if df is None:
+            return
+        X, y = model_script.prepare_data(df)
+        groups = df['replay_id']
+        if cache is not None:
+            cached = store_cache_entry(cache, key, X, y, X, y, groups, booster_params(model_script.get_model())[0])
+    if cached is not None:
+        X, y, groups = cached.X, cached.y, cached.groups
+    candidates = None
+    if args.search:
+        candidates = search_candidates(model_script.get_search_space(), args.trials)
+        logger.info(f"Searching {len(candidates)} parameter combinations with {folds}-fold cross-validation...")
+    else:
+        logger.info(f"Running {folds}-fold cross-validation...")
+
+    start = time.perf_counter()
+    try:
+        results = cross_validate(model_script.get_model(), X, y, groups, folds, candidates, args.early_stopping, args.workers,
+                                 cached.dataset if cached is not None else None)
+    except ValueError as e:
+        logger.error(f"Cross-validation failed: {e}")
+        return
+    logger.info(f"Cross-validation finished in {time.perf_counter() - start:.1f}s.")
+
+    print(f"--- {folds}-Fold Cross-Validation (grouped by replay_id) ---")
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(results.to_string(float_format=lambda value: f"{value:.4f}"))
+    if args.results:
+        results.to_csv(args.results, index=False)
+        logger.info(f"Results saved to: {args.results}")
+
+    if args.visualize:
+        logger.warning("--visualize needs a test split and is skipped with --cv and --search.")
+    if args.save:
+        best = results.to_dict("records")[0] # Keeps the integer parameters integers
+        params = {name: best[name] for name in (candidates[0] if candidates else {})}
+        if args.early_stopping:
+            params["n_estimators"] = max(1, round(best["best_iteration"]))
+        model = model_script.get_model()
+        model.set_params(**params)
+        logger.info(f"Training the final model on all {len(X)} rows with {params or 'the model script parameters'}...")
+        if cached is not None:
+            model = fit_on_dataset(model, cached.dataset, cached.classes)
+        else:
+            model.fit(X, y)
+        save_model(args, model, list(X.columns), {
+            "train_rows": len(X),
+            "cv_folds": folds,
+            "cv_accuracy": float(best["accuracy_mean"]),
+            "cv_accuracy_std": float(best["accuracy_std"]),
+            "cv_log_loss": float(best["log_loss_mean"]),
+        })
+    logger.success("Cross-validation complete.")
+
 def main():
     parser = argparse.ArgumentParser(description="Train and evaluate a machine learning model.")
-    parser.add_argument("features_csv_path", type=str, help="Absolute path to the input CSV file containing engineered features.")
+    parser.add_argument("features_path", type=str, help="Path to the engineered features file (.parquet from Feature-Engineer.py, or a .csv export).")
     parser.add_argument("model_script_name", type=str, help="Name of the model script to use from the ModelScripts/ directory (without .py).")
     parser.add_argument("--visualize", "-v", action="store_true", help="Generate and save visualizations of the results.")
     parser.add_argument("--save", "-s", action="store_true", help="Save the trained model to the OutputModels/ directory.")
+    parser.add_argument("--save-format", choices=["artifact", "text"], default="artifact", help=f"Save the model as a compressed model artifact ({ARTIFACT_SUFFIX}, the default) or as LightGBM text (.txt).")
+    parser.add_argument("--prediction-only", action="store_true", help="Leave the per-node training statistics (split gains, node counts) out of the saved artifact: smaller and faster to load, same predictions.")
+    parser.add_argument("--cv", type=int, default=None, metavar="K", help="Evaluate with K-fold cross-validation grouped by replay_id instead of a single train/test split.")
+    parser.add_argument("--search", action="store_true", help="Cross-validate each combination of the model script's search space (--cv folds, 5 by default) and print the results table.")
+    parser.add_argument("--trials", type=int, default=None, help="With --search, cross-validate this many randomly drawn combinations instead of all of them.")
+    parser.add_argument("--early-stopping", type=int, default=None, metavar="ROUNDS", help="With --cv or --search, stop each fold once the log loss on a fifth of its training replays hasn't improved for this many rounds.")
+    parser.add_argument("--workers", type=int, default=None, help="With --cv or --search, folds trained in parallel (default: one per CPU). The CPUs are shared between them.")
+    parser.add_argument("--results", type=str, default=None, help="With --cv or --search, also save the results table to this CSV file.")
+    parser.add_argument("--no-cache", action="store_true", help="Read, prepare and bin the features instead of using the dataset cache (the cache is left untouched).")
+    parser.add_argument("--dataset-cache", type=str, default=str(DATASET_CACHE_DIR), help="Directory of the dataset cache (default: DatasetCache/ next to this script).")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_CACHE_SIZE_MB, help="Size of the dataset cache above which the least recently used entries are deleted.")
     args = parser.parse_args()
 
-    # Load data
-    logger.info(f"Loading data from: {args.features_csv_path}")
-    try:
-        df = pd.read_csv(args.features_csv_path)
-    except FileNotFoundError:
-        logger.error(f"File not found: {args.features_csv_path}")
-        return
-
     # Load ModelScript
     logger.info(f"Loading model script: {args.model_script_name}")
     try:
@@ -39,48 +174,72 @@ def main():
         logger.error(f"Could not load ModelScript from 'ModelScripts/{args.model_script_name}.py'. Error: {e}")
         return
 
-    # Split data using GroupShuffleSplit, grouping by replay number. (found to perform better when both perspectives are being trained on)
-    logger.debug("Splitting data into training and testing sets based on replay_id...")
-    gss = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
-    
-    groups = df['replay_id']
-    train_idx, test_idx = next(gss.split(df, groups=groups))
-    
-    train_df = df.iloc[train_idx]
-    test_df = df.iloc[test_idx]
+    # The dataset cache keeps the binned LightGBM Dataset, so it is only used for LightGBM models
+    cache = None
+    if not args.no_cache and isinstance(model_script.get_model(), LGBMClassifier):
+        cache = DatasetCache(args.dataset_cache, args.cache_size_mb << 20)
 
-    # Prepare Data
-    logger.debug("Preparing training data...")
-    X_train, y_train = model_script.prepare_data(train_df)
+    try:
+        if args.cv is not None or args.search:
+            run_cross_validation(args, model_script, cache)
+            return
+        key, cached = open_cache_entry(args, cache, model_script, HOLDOUT_SPLIT)
+    except FileNotFoundError:
+        logger.error(f"File not found: {args.features_path}")
+        return
+
+    if cached is not None:
+        X_test, y_test = cached.X, cached.y
+        train_rows = cached.dataset.num_data()
+    else:
+        # Load data
+        df = load_features(args.features_path)
+        if df is None:
+            return
+
+        # Split data using GroupShuffleSplit, grouping by replay number. (found to perform better when both perspectives are being trained on)
+        logger.debug("Splitting data into training and testing sets based on replay_id...")
+        gss = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
 
-    logger.debug("Preparing testing data...")
-    X_test, y_test = model_script.prepare_data(test_df)
+        groups = df['replay_id']
+        train_idx, test_idx = next(gss.split(df, groups=groups))
 
+        train_df = df.iloc[train_idx]
+        test_df = df.iloc[test_idx]
+
+        # Prepare Data
+        logger.debug("Preparing training data...")
+        X_train, y_train = model_script.prepare_data(train_df)
+
+        logger.debug("Preparing testing data...")
+        X_test, y_test = model_script.prepare_data(test_df)
+        train_rows = len(X_train)
+
+        if cache is not None:
+            cached = store_cache_entry(cache, key, X_train, y_train, X_test, y_test, test_df['replay_id'], booster_params(model_script.get_model())[0],
+                                       {"train_idx": train_idx, "test_idx": test_idx})
 
     # Train the model
     logger.debug("Instantiating model...")
     model = model_script.get_model()
 
     logger.info("Training model...")
-    model.fit(X_train, y_train)
+    if cached is not None:
+        model = fit_on_dataset(model, cached.dataset, cached.classes) # Same model as model.fit, on the cached bins
+    else:
+        model.fit(X_train, y_train)
 
     # Evaluate the model
     logger.info("Evaluating model on the test set...")
     model_script.evaluate_model(model, X_test, y_test)
 
     # Save model
-    #TODO Look into compressing the model files.
     if args.save:
-        output_models_dir = Path(__file__).parent / "OutputModels"
-        output_models_dir.mkdir(exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        model_filename = f"{args.model_script_name}_{timestamp}.txt"
-        model_path = output_models_dir / model_filename
-        
-        logger.debug(f"Saving model to: {model_path}")
-        model.booster_.save_model(model_path)
-        logger.success(f"Model saved to: {model_path}")
+        save_model(args, model, list(X_test.columns), {
+            "train_rows": train_rows,
+            "test_rows": len(X_test),
+            "test_accuracy": float(accuracy_score(y_test, model.predict(X_test))),
+        })
 
     # Visualize results (optional)
     if args.visualize:
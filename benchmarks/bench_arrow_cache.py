@@ -0,0 +1,134 @@
+"""
+Benchmark for reading units tables through the memory-mapped Arrow cache (internal/arrow_cache.py).
+
+Writes --replays synthetic units.parquet files (consolidated and stored like Replay-Extractor.py's, from
+bench_consolidation's perspectives), converts them to the Arrow cache, and checks that both paths return the same
+values. Then, each in a fresh process, it loads the units of every replay through a ReplayBundle and through an
+ArrowReplayBundle (columns a feature script would use, all replays kept in memory like a process_corpus batch), and
+computes a few per-player aggregates on them. Reports the load and compute times and how much the process's memory
+grew: its resident set and the part of it that isn't backed by a file (what decompressing and converting allocate,
+as opposed to mapped pages the OS can drop and re-read).
+
+Usage (from the project root):
+    py -m benchmarks.bench_arrow_cache [--replays N] [--steps N] [--units N] [--dir PATH]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import psutil
+
+import internal.extractor_helper as exh
+from benchmarks.bench_consolidation import make_perspectives
+from internal.arrow_cache import ArrowReplayBundle, ArrowTableCache
+from internal.consolidation import consolidate_units
+from internal.replay_bundle import ReplayBundle
+
+COLUMNS = ["timestamp", "unit_tag", "player_id", "position_x", "position_y", "health", "shield", "resource_remaining"]
+
+def make_units_output(directory: Path, replays: int, steps: int, units: int) -> list[str]:
+    replay_ids = []
+    for i in range(replays):
+        replay_id = str(4300000 + i)
+        (p1_units, _), (p2_units, _) = make_perspectives(steps, units, seed=i)
+        (directory / replay_id).mkdir(parents=True, exist_ok=True)
+        exh.optimize_unit_dtypes(consolidate_units(p1_units, p2_units)).to_parquet(directory / replay_id / "units.parquet")
+        replay_ids.append(replay_id)
+    return replay_ids
+
+def bundles(mode: str, raw_output_dir: Path, cache_dir: Path, replay_ids: list[str]) -> list[ReplayBundle]:
+    tables = {"units": COLUMNS}
+    if mode == "arrow":
+        arrow_cache = ArrowTableCache(cache_dir)
+        return [ArrowReplayBundle(arrow_cache, raw_output_dir / replay_id, replay_id, tables) for replay_id in replay_ids]
+    return [ReplayBundle(raw_output_dir / replay_id, replay_id, tables) for replay_id in replay_ids]
+
+def player_aggregates(units: pd.DataFrame) -> np.ndarray:
+    """Per-player row counts, mean health plus shield and mean position, the kind of math a feature script does."""
+    player = units["player_id"].to_numpy(dtype=np.int64)
+    hit_points = units["health"].to_numpy(dtype=np.float64) + units["shield"].to_numpy(dtype=np.float64)
+    x, y = units["position_x"].to_numpy(dtype=np.float64), units["position_y"].to_numpy(dtype=np.float64)
+    counts = np.bincount(player, minlength=17)
+    totals = [np.bincount(player, weights=values, minlength=17) for values in (hit_points, x, y)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.stack([counts, *(total / counts for total in totals)])[:, [1, 2]]
+
+def unbacked_memory(info) -> int:
+    if hasattr(info, "shared"):
+        return info.rss - info.shared # Linux: shared counts the resident file-backed pages
+    return getattr(info, "private", info.rss) # Windows: private bytes
+
+def child(mode: str, root: Path, replay_ids: list[str]) -> dict:
+    """Runs one mode in this (fresh) process and returns its times and memory growth."""
+    process = psutil.Process()
+    before = process.memory_info()
+    start = time.perf_counter()
+    frames = [bundle["units"] for bundle in bundles(mode, root / "OutputRaw", root / "ArrowCache", replay_ids)]
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    aggregates = [player_aggregates(frame) for frame in frames]
+    compute_time = time.perf_counter() - start
+    after = process.memory_info()
+    return {
+        "load": load_time, "compute": compute_time, "rows": sum(len(frame) for frame in frames),
+        "rss": after.rss - before.rss, "anonymous": unbacked_memory(after) - unbacked_memory(before),
+        "checksum": float(np.nansum([np.nansum(a) for a in aggregates])),
+    }
+
+def run_child(mode: str, root: Path, replay_ids: list[str]) -> dict:
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_arrow_cache", "--child", mode, "--dir", str(root)],
+                            input=json.dumps(replay_ids), capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def run(replays: int, steps: int, units: int, directory: str | None):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(directory or temp_dir)
+        raw_output_dir = root / "OutputRaw"
+        start = time.perf_counter()
+        replay_ids = make_units_output(raw_output_dir, replays, steps, units)
+        print(f"Wrote {replays} synthetic units tables in {time.perf_counter() - start:.1f}s")
+
+        arrow_cache = ArrowTableCache(root / "ArrowCache")
+        start = time.perf_counter()
+        for replay_id in replay_ids:
+            arrow_cache.open(replay_id, "units", raw_output_dir / replay_id / "units.parquet")
+        convert_time = time.perf_counter() - start
+        parquet_size = sum((raw_output_dir / replay_id / "units.parquet").stat().st_size for replay_id in replay_ids)
+        arrow_size = sum(arrow_cache.path(replay_id, "units").stat().st_size for replay_id in replay_ids)
+
+        for expected, actual in zip(bundles("parquet", raw_output_dir, root / "ArrowCache", replay_ids), bundles("arrow", raw_output_dir, root / "ArrowCache", replay_ids)):
+            pd.testing.assert_frame_equal(actual["units"], expected["units"], check_dtype=False)
+            for name, column in actual["units"].items():
+                if column.notna().all() and column.dtype.kind in "iuf":
+                    assert not column.to_numpy().flags.writeable, f"{name} was copied" # A read-only view of the mapped file
+        print("Both paths return the same values, columns without missing values are views of the mapped file.")
+
+        results = {mode: run_child(mode, root, replay_ids) for mode in ("parquet", "arrow")}
+        assert results["parquet"]["checksum"] == results["arrow"]["checksum"], "aggregates differ"
+
+    rows = results["parquet"]["rows"]
+    print(f"{rows} units rows ({rows // replays} per replay), {parquet_size / 2**20:.0f} MB of Parquet, "
+          f"{arrow_size / 2**20:.0f} MB of Arrow cache (converted in {convert_time:.1f}s)")
+    print(f"{'':<32}{'Parquet':>12}{'Arrow cache':>14}")
+    for name, key, scale, unit in [("load", "load", 1, "s"), ("per-player aggregates", "compute", 1, "s"),
+                                   ("resident memory growth", "rss", 2**-20, "MB"), ("  not backed by a file", "anonymous", 2**-20, "MB")]:
+        before, after = results["parquet"][key] * scale, results["arrow"][key] * scale
+        print(f"{name:<32}{before:>10.2f}{unit:<2}{after:>12.2f}{unit:<2}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare loading units tables from Parquet and from the memory-mapped Arrow cache.")
+    parser.add_argument("--replays", type=int, default=20, help="Number of synthetic replays.")
+    parser.add_argument("--steps", type=int, default=1000, help="Game steps per replay (units are recorded every step).")
+    parser.add_argument("--units", type=int, default=200, help="Units alive on each step.")
+    parser.add_argument("--dir", default=None, help="Directory to write the replays and the cache to (defaults to a temporary directory).")
+    parser.add_argument("--child", choices=["parquet", "arrow"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(args.child, Path(args.dir), json.loads(sys.stdin.read()))))
+    else:
+        run(args.replays, args.steps, args.units, args.dir)
@@ -0,0 +1,115 @@
+"""
+Benchmarks the persistent ClientWorkerPool against launching a fresh client pool per replay, using a fake game client
+that simulates startup cost and replay steps (no StarCraft II installation needed).
+
+Usage (from the project root):
+    py -m benchmarks.bench_client_pool [--replays N] [--versions N] [--startup SECONDS] [--steps N]
+"""
+import argparse
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+
+from internal.client_pool import ClientWorkerPool, PersistentClient
+
+STEP_TIME = 0.001
+
+class FakeController:
+    """Stands in for sc2.controller.Controller."""
+    def __init__(self, launch_id):
+        self.launch_id = launch_id
+        self.replays_played = 0
+
+    async def ping(self):
+        return None
+
+    async def start_replay(self, replay_path, realtime, observed_id=0):
+        self.replays_played += 1
+
+class FakeSC2Process:
+    """Stands in for sc2.sc2process.SC2Process. Entering it costs `startup` seconds, like launching the real client."""
+    startup = 1.0
+    launched = 0
+
+    def __init__(self, port=None, base_build=None, data_hash=None, placement=None):
+        self.base_build = base_build
+
+    async def __aenter__(self):
+        await asyncio.sleep(FakeSC2Process.startup)
+        FakeSC2Process.launched += 1
+        return FakeController(f"{os.getpid()}-{FakeSC2Process.launched}")
+
+    async def __aexit__(self, *args):
+        await asyncio.sleep(0.05)
+
+async def fake_play(controller, replay_id, observed_id, steps, fail=False):
+    """Stands in for play_perspective: starts the replay and steps through it."""
+    await controller.start_replay(replay_id, realtime=False, observed_id=observed_id)
+    if fail:
+        raise ConnectionError("Simulated client crash")
+    for _ in range(steps):
+        await asyncio.sleep(STEP_TIME)
+    return controller.launch_id
+
+def set_startup(startup):
+    FakeSC2Process.startup = startup
+
+def fresh_client_perspective(args):
+    """The previous model: launch a client, play one perspective, shut the client down."""
+    base_build, replay_id, observed_id, steps, startup = args
+    set_startup(startup)
+
+    async def run():
+        client = PersistentClient(port=0, process_factory=FakeSC2Process)
+        try:
+            controller = await client.ensure(base_build, "hash")
+            return await fake_play(controller, replay_id, observed_id, steps)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+def run_fresh(replays, steps, startup):
+    start = time.perf_counter()
+    for replay_id, base_build in replays:
+        with multiprocessing.Pool(processes=2) as pool:
+            pool.map(fresh_client_perspective, [(base_build, replay_id, p, steps, startup) for p in (1, 2)])
+    return time.perf_counter() - start
+
+def run_persistent(replays, steps, startup, crash_every=0):
+    start = time.perf_counter()
+    launch_ids = set()
+    failures = 0
+    with ClientWorkerPool(fake_play, ports=[0, 0], process_factory=FakeSC2Process,
+                          setup=functools.partial(set_startup, startup)) as pool:
+        for n, (replay_id, base_build) in enumerate(replays):
+            for player_id in (1, 2):
+                fail = bool(crash_every) and n % crash_every == 0 and player_id == 1
+                pool.submit((replay_id, player_id), base_build, "hash", (replay_id, player_id, steps, fail))
+        for _ in range(2 * len(replays)):
+            _, result = pool.get_result()
+            if result is None:
+                failures += 1
+            else:
+                launch_ids.add(result)
+    return time.perf_counter() - start, len(launch_ids), failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the persistent client worker pool with a fake game client.")
+    parser.add_argument("--replays", type=int, default=12, help="Number of replays to process.")
+    parser.add_argument("--versions", type=int, default=2, help="Number of distinct game versions among the replays (grouped in order).")
+    parser.add_argument("--startup", type=float, default=1.0, help="Simulated client startup time in seconds.")
+    parser.add_argument("--steps", type=int, default=200, help="Simulated game steps per replay.")
+    parser.add_argument("--crash-every", type=int, default=0, help="Make player 1's job crash on every Nth replay (0 disables).")
+    args = parser.parse_args()
+
+    per_version = -(-args.replays // args.versions)
+    replays = [(f"replay-{i}", 80000 + i // per_version) for i in range(args.replays)]
+
+    fresh_time = run_fresh(replays, args.steps, args.startup)
+    persistent_time, clients_used, failures = run_persistent(replays, args.steps, args.startup, args.crash_every)
+
+    print(f"{'mode':<12} {'time (s)':>10}")
+    print(f"{'fresh':<12} {fresh_time:>10.2f}  ({2 * len(replays)} client launches)")
+    print(f"{'persistent':<12} {persistent_time:>10.2f}  ({clients_used} clients used, {failures} failed jobs)")
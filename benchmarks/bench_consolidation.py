@@ -0,0 +1,184 @@
+"""
+Parity check and micro-benchmark for the sort-merge perspective consolidation.
+
+Builds two synthetic perspectives of a game (own units, partly visible enemy units, neutral units with some missing
+resource values, snapshots whose values differ between perspectives, per-perspective unit type categories) and checks
+that internal.consolidation produces byte-identical units and deaths Parquet output to the previous
+groupby().agg('first'/'max') consolidation. Edge cases (tiny frames, one side without deaths, tags too wide to pack) are checked first, then
+both implementations are timed on the full-size frames.
+
+Usage (from the project root):
+    py -m benchmarks.bench_consolidation [--steps N] [--units N] [--seed N]
+"""
+import argparse
+import io
+import time
+import numpy as np
+import pandas as pd
+
+import internal.extractor_helper as exh
+from internal.consolidation import consolidate_units, consolidate_deaths
+
+TYPE_NAMES = ["SCV", "MARINE", "MARAUDER", "ZERGLING", "ROACH", "PROBE", "STALKER", "MINERALFIELD", "VESPENEGEYSER"]
+
+def groupby_consolidate_units(p1_units_df, p2_units_df):
+    """The previous consolidation (concat + groupby), kept as the parity reference."""
+    p1_units_df = p1_units_df.copy()
+    p2_units_df = p2_units_df.copy()
+    p1_units_df["is_visible_to_player_1"] = True
+    p2_units_df["is_visible_to_player_2"] = True
+
+    combined_units_df = pd.concat([p1_units_df, p2_units_df], ignore_index=True)
+
+    bool_cols = ["is_visible_to_player_1", "is_visible_to_player_2"]
+    for col in bool_cols:
+        combined_units_df[col] = combined_units_df[col].astype('boolean').fillna(False).astype(bool)
+    combined_units_df.loc[combined_units_df["player_id"] == 1, "is_visible_to_player_1"] = True
+    combined_units_df.loc[combined_units_df["player_id"] == 2, "is_visible_to_player_2"] = True
+
+    agg_dict = {col: 'first' for col in combined_units_df.columns if col not in bool_cols}
+    for col in bool_cols:
+        agg_dict[col] = 'max'
+
+    final_units_df = combined_units_df.groupby(["timestamp", "unit_tag"], as_index=False).agg(agg_dict)
+    final_units_df["is_ground_truth_for_player_1"] = final_units_df["player_id"] == 1
+    final_units_df["is_ground_truth_for_player_2"] = final_units_df["player_id"] == 2
+    final_units_df["is_neutral"] = ~final_units_df["player_id"].isin([1, 2])
+    return final_units_df
+
+def groupby_consolidate_deaths(p1_deaths_df, p2_deaths_df):
+    """The previous death consolidation, kept as the parity reference."""
+    p1_deaths_df = p1_deaths_df.copy()
+    p2_deaths_df = p2_deaths_df.copy()
+    if not p1_deaths_df.empty:
+        p1_deaths_df["is_visible_to_player_1"] = True
+    if not p2_deaths_df.empty:
+        p2_deaths_df["is_visible_to_player_2"] = True
+
+    death_dfs = [df for df in [p1_deaths_df, p2_deaths_df] if not df.empty]
+    if not death_dfs:
+        return pd.DataFrame()
+    combined_deaths_df = pd.concat(death_dfs, ignore_index=True)
+
+    death_bool_cols = ["is_visible_to_player_1", "is_visible_to_player_2"]
+    for col in death_bool_cols:
+        if col not in combined_deaths_df.columns:
+            combined_deaths_df[col] = False
+        else:
+            combined_deaths_df[col] = combined_deaths_df[col].astype('boolean').fillna(False).astype(bool)
+
+    death_agg_dict = {col: 'first' for col in combined_deaths_df.columns if col not in death_bool_cols}
+    for col in death_bool_cols:
+        death_agg_dict[col] = 'max'
+
+    return combined_deaths_df.groupby(["timestamp", "unit_tag"], as_index=False).agg(death_agg_dict)
+
+def make_perspectives(steps: int, units: int, seed: int = 0, tag_stride: int = 1):
+    """Generates ((p1 units, p1 deaths), (p2 units, p2 deaths)) frames shaped like ObserverBot's output."""
+    rng = np.random.default_rng(seed)
+    tags = 4295000000 + np.arange(units, dtype=np.uint64) * np.uint64(tag_stride)
+    owners = rng.choice(np.array([1, 2, 16], dtype=np.uint8), size=units, p=[0.4, 0.4, 0.2])
+    types = np.where(owners == 16, rng.integers(7, 9, units), rng.integers(0, 7, units))
+    timestamps = np.arange(steps) * 20 / 22.4
+    x = rng.random(units) * 150
+    y = rng.random(units) * 150
+
+    perspectives = []
+    for player in (1, 2):
+        seen_by_chance = rng.random((steps, units)) < 0.3
+        visible = (owners == player) | ((owners == 16) & (rng.random((steps, units)) < 0.8)) | seen_by_chance
+        # Rows within a step come out in staging (unit arrival) order, not sorted by tag.
+        order = rng.permutation(units)
+        step_idx, unit_idx = np.nonzero(visible[:, order])
+        unit_idx = order[unit_idx]
+        rows = len(step_idx)
+
+        is_snapshot = (owners[unit_idx] != player) & (rng.random(rows) < 0.2)
+        health = np.where(is_snapshot, rng.integers(1, 45, rows), 45).astype(np.float64)
+        resources = np.where(owners[unit_idx] == 16, 1800.0 - step_idx, np.nan)
+        resources[rng.random(rows) < 0.05] = np.nan # Some missing values, filled from the other perspective
+        categories = list(rng.permutation(TYPE_NAMES)) # Each perspective interns types in its own order
+
+        units_df = pd.DataFrame({
+            "timestamp": timestamps[step_idx],
+            "unit_tag": tags[unit_idx],
+            "unit_type": pd.Categorical(np.array(TYPE_NAMES)[types[unit_idx]], categories=categories),
+            "player_id": owners[unit_idx],
+            "position_x": x[unit_idx] + step_idx * 0.01,
+            "position_y": y[unit_idx],
+            "is_snapshot": is_snapshot,
+            "health": health,
+            "shield": np.zeros(rows),
+            "energy": np.zeros(rows),
+            "build_progress": np.ones(rows),
+            "resource_remaining": resources,
+        })
+
+        dying = rng.choice(units, size=units // 4, replace=False)
+        seen = dying[rng.random(len(dying)) < 0.6]
+        deaths_df = pd.DataFrame({
+            "timestamp": timestamps[(seen * 7919) % steps],
+            "unit_tag": tags[seen].astype(np.int64),
+            "unit_type": [TYPE_NAMES[t] for t in types[seen]],
+            "player_id": owners[seen].astype(np.int64),
+            "position_x": x[seen],
+            "position_y": y[seen],
+        })
+        perspectives.append((units_df, deaths_df))
+    return perspectives
+
+def parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer)
+    return buffer.getvalue()
+
+def check_parity(perspectives, label: str):
+    (p1_units, p1_deaths), (p2_units, p2_deaths) = perspectives
+    expected = parquet_bytes(exh.optimize_unit_dtypes(groupby_consolidate_units(p1_units, p2_units)))
+    actual = parquet_bytes(exh.optimize_unit_dtypes(consolidate_units(p1_units, p2_units)))
+    assert actual == expected, f"units output differs ({label})"
+
+    for p1, p2 in ((p1_deaths, p2_deaths), (p1_deaths, pd.DataFrame()), (p1_deaths.iloc[:0], p2_deaths)):
+        expected_df = groupby_consolidate_deaths(p1, p2)
+        actual_df = consolidate_deaths(p1, p2)
+        if expected_df.empty:
+            assert actual_df.empty, f"deaths output differs ({label})"
+            continue
+        expected_df = exh.optimize_death_dtypes(expected_df)
+        actual_df = exh.optimize_death_dtypes(actual_df)[expected_df.columns] # Column order of the old code depends on which side saw deaths
+        assert parquet_bytes(actual_df) == parquet_bytes(expected_df), f"deaths output differs ({label})"
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def run(steps: int, units: int, seed: int):
+    for small_seed in range(5):
+        check_parity(make_perspectives(12, 40, small_seed), f"small game, seed {small_seed}")
+    check_parity(make_perspectives(12, 40, tag_stride=2**28), "tags wider than 32 bits") # Two-key sort fallback
+    print("Parity check passed on small games.")
+
+    perspectives = make_perspectives(steps, units, seed)
+    (p1_units, p1_deaths), (p2_units, p2_deaths) = perspectives
+    print(f"Perspective rows: {len(p1_units):,} + {len(p2_units):,}")
+
+    groupby_time, expected_df = time_call(groupby_consolidate_units, p1_units, p2_units)
+    merge_time, actual_df = time_call(consolidate_units, p1_units, p2_units)
+    assert parquet_bytes(exh.optimize_unit_dtypes(actual_df)) == parquet_bytes(exh.optimize_unit_dtypes(expected_df)), "units output differs (full game)"
+    print(f"Parity check passed on the full game ({len(actual_df):,} consolidated rows).")
+
+    death_groupby_time, _ = time_call(groupby_consolidate_deaths, p1_deaths, p2_deaths)
+    death_merge_time, _ = time_call(consolidate_deaths, p1_deaths, p2_deaths)
+
+    print(f"{'':<10}{'groupby':>12}{'sort-merge':>12}{'speedup':>10}")
+    print(f"{'units':<10}{groupby_time:>11.3f}s{merge_time:>11.3f}s{groupby_time / merge_time:>9.1f}x")
+    print(f"{'deaths':<10}{death_groupby_time:>11.3f}s{death_merge_time:>11.3f}s{death_groupby_time / death_merge_time:>9.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark sort-merge consolidation against the previous groupby.")
+    parser.add_argument("--steps", type=int, default=4000, help="Number of captured steps in the synthetic game.")
+    parser.add_argument("--units", type=int, default=500, help="Number of units on the map.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic game.")
+    args = parser.parse_args()
+    run(args.steps, args.units, args.seed)
@@ -0,0 +1,89 @@
+"""
+Benchmark for reading replays from a compacted corpus dataset (internal/corpus_dataset.py) instead of OutputRaw.
+
+Writes a directory of synthetic extracted replays (an _info.json and a resources.parquet each, like
+bench_corpus_features), compacts it with compact_corpus, and compares for both layouts: selecting the replays at
+least --min-d seconds long (one _info.json read per replay, against a filter pushed down to the metadata table),
+loading the SimpleFeatures resources columns of every selected replay in batches, and loading single replays.
+Fails if the two layouts return different replays or rows.
+
+Usage (from the project root):
+    py -m benchmarks.bench_corpus_dataset [--replays N] [--minutes N] [--min-d SECONDS] [--batch N] [--dir PATH]
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+
+from benchmarks.bench_corpus_features import make_raw_output
+from internal.corpus_dataset import CorpusDataset, compact_corpus
+from internal.replay_bundle import load_corpus_tables, read_replay_table
+
+RESOURCE_COLUMNS = ["timestamp", "p1_minerals", "p1_vespene", "p1_supply_used", "p1_supply_army", "p2_minerals", "p2_vespene", "p2_supply_used", "p2_supply_army"]
+TIME_WINDOW = (None, 240)
+
+def select_raw(raw_output_dir: Path, min_d: int) -> list[str]:
+    """Feature-Engineer.py's selection from OutputRaw: every replay's _info.json is opened to check its duration."""
+    selected = []
+    for replay_path in sorted(entry for entry in raw_output_dir.iterdir() if entry.is_dir()):
+        with open(next(replay_path.glob("*_info.json"))) as f:
+            if json.load(f).get("Duration", 0) >= min_d:
+                selected.append(replay_path.name)
+    return selected
+
+def select_dataset(dataset_dir: Path, min_d: int) -> CorpusDataset:
+    return CorpusDataset(dataset_dir, filters=[("Duration", ">=", min_d)])
+
+def load_raw(raw_output_dir: Path, batches: list[list[str]]) -> list[pd.DataFrame]:
+    tables = {"resources": RESOURCE_COLUMNS}
+    return [load_corpus_tables({replay_id: raw_output_dir / replay_id for replay_id in batch}, tables, TIME_WINDOW)["resources"] for batch in batches]
+
+def load_dataset(dataset: CorpusDataset, batches: list[list[str]]) -> list[pd.DataFrame]:
+    return [dataset.read_table("resources", batch, RESOURCE_COLUMNS, TIME_WINDOW) for batch in batches]
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def run(replays: int, minutes: float, min_d: int, batch: int, directory: str | None):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(directory or temp_dir)
+        raw_output_dir, dataset_dir = root / "OutputRaw", root / "OutputCorpus"
+        raw_output_dir.mkdir(parents=True, exist_ok=True)
+        make_raw_output(raw_output_dir, replays, minutes)
+        compact_time, _ = timed(compact_corpus, raw_output_dir, dataset_dir)
+        print(f"{replays} synthetic replays, compacted in {compact_time:.1f}s")
+
+        raw_select_time, raw_ids = timed(select_raw, raw_output_dir, min_d)
+        dataset_select_time, dataset = timed(select_dataset, dataset_dir, min_d)
+        assert sorted(dataset.replay_ids()) == raw_ids, "selected replays differ"
+
+        batches = [raw_ids[i:i + batch] for i in range(0, len(raw_ids), batch)]
+        raw_load_time, raw_frames = timed(load_raw, raw_output_dir, batches)
+        dataset_load_time, dataset_frames = timed(load_dataset, dataset, batches)
+        for expected, actual in zip(raw_frames, dataset_frames):
+            pd.testing.assert_frame_equal(actual, expected)
+
+        singles = raw_ids[:50]
+        raw_single_time, _ = timed(lambda: [read_replay_table(raw_output_dir / replay_id / "resources.parquet", RESOURCE_COLUMNS, "timestamp", TIME_WINDOW) for replay_id in singles])
+        dataset_single_time, _ = timed(lambda: [dataset.read_table("resources", [replay_id], RESOURCE_COLUMNS, TIME_WINDOW) for replay_id in singles])
+        print(f"Both layouts selected the same {len(raw_ids)} replays (>= {min_d}s) and returned identical rows.")
+
+    print(f"{'':<40}{'OutputRaw':>12}{'dataset':>12}{'speedup':>10}")
+    for name, before, after in [(f"select replays >= {min_d}s", raw_select_time, dataset_select_time),
+                                (f"load resources, batches of {batch}", raw_load_time, dataset_load_time),
+                                (f"load resources, {len(singles)} single replays", raw_single_time, dataset_single_time)]:
+        print(f"{name:<40}{before:>11.2f}s{after:>11.2f}s{before / after:>9.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare reading replays from OutputRaw and from a compacted corpus dataset.")
+    parser.add_argument("--replays", type=int, default=2000, help="Number of synthetic replays.")
+    parser.add_argument("--minutes", type=float, default=15, help="Maximum game length (games are 1/3 to 1x this long).")
+    parser.add_argument("--min-d", type=int, default=600, help="Select replays at least this many seconds long.")
+    parser.add_argument("--batch", type=int, default=500, help="Replays per batch when loading tables.")
+    parser.add_argument("--dir", default=None, help="Directory to write the replays and the dataset to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.replays, args.minutes, args.min_d, args.batch, args.dir)
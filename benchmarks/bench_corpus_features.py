@@ -0,0 +1,105 @@
+"""
+Parity check and throughput benchmark for the batch feature API (FeatureScriptBase.process_corpus).
+
+Writes a directory of synthetic extracted replays (an _info.json and a resources.parquet each) and runs SimpleFeatures
+over it the way Feature-Engineer.py does: one replay at a time through process_replay, and in batches through
+process_corpus. Fails unless both produce the same rows in the same order (compared after the dtype normalization the
+feature writer applies), then reports replays per second for each, end to end (loading included) and for the
+feature computation alone.
+
+Usage (from the project root):
+    py -m benchmarks.bench_corpus_features [--replays N] [--minutes N] [--batch N] [--dir PATH]
+"""
+import argparse
+import importlib.util
+import json
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from benchmarks.bench_time_series import make_resources
+from internal.feature_store import normalize_feature_frames
+
+RACES = ["Prot", "Terr", "Zerg"]
+
+def load_feature_engineer():
+    spec = importlib.util.spec_from_file_location("feature_engineer", "Feature-Engineer.py")
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logger.remove() # Feature-Engineer logs every replay
+    return module
+
+def make_raw_output(directory: Path, replays: int, minutes: float, seed: int = 0) -> list[str]:
+    """Writes `replays` replay directories like Replay-Extractor.py's output, with games of up to `minutes` minutes."""
+    rng = np.random.default_rng(seed)
+    replay_ids = []
+    for i in range(replays):
+        replay_id = str(4300000 + i)
+        replay_dir = directory / replay_id
+        replay_dir.mkdir(parents=True, exist_ok=True)
+        game_minutes = float(rng.uniform(minutes / 3, minutes))
+        winner = int(rng.integers(1, 3))
+        metadata = {
+            "Duration": int(game_minutes * 60),
+            "Players": [
+                {"PlayerID": player_id, "PlayerName": f"Bot{rng.integers(0, 50):02d}", "SelectedRace": str(rng.choice(RACES)),
+                 "Result": "Win" if player_id == winner else "Loss"}
+                for player_id in (1, 2)
+            ],
+        }
+        with open(replay_dir / f"{replay_id}_info.json", "w") as f:
+            json.dump(metadata, f)
+        make_resources(rng, game_minutes, 22.4).to_parquet(replay_dir / "resources.parquet")
+        replay_ids.append(replay_id)
+    return replay_ids
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def run(replays: int, minutes: float, batch: int, directory: str | None):
+    feature_engineer = load_feature_engineer()
+    script = feature_engineer.load_feature_script(Path("FeatureScripts") / "simple_features.py")
+    tables, window = script.required_tables(), script.time_window
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        raw_output_dir = Path(directory or temp_dir)
+        start = time.perf_counter()
+        replay_ids = make_raw_output(raw_output_dir, replays, minutes)
+        print(f"Wrote {replays} synthetic replays to {raw_output_dir} in {time.perf_counter() - start:.1f}s")
+        batches = [replay_ids[i:i + batch] for i in range(0, len(replay_ids), batch)]
+
+        # End to end, the way Feature-Engineer.py runs each API
+        per_replay_time, per_replay = timed(lambda: [feature_engineer.run_replay(script, "simple_features", raw_output_dir, replay_id, None) for replay_id in replay_ids])
+        corpus_time, corpus = timed(lambda: [feature_engineer.run_corpus(script, "simple_features", raw_output_dir, ids, None)[1] for ids in batches])
+
+        expected = normalize_feature_frames(per_replay)
+        actual = normalize_feature_frames(corpus)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+        print(f"process_corpus returned the same {len(actual)} rows as process_replay.")
+
+        # Feature computation alone, with the data already loaded
+        bundles = [feature_engineer.load_replay_bundle(raw_output_dir, replay_id, None, tables, window) for replay_id in replay_ids]
+        for bundle in bundles:
+            bundle["resources"]
+        corpora = [feature_engineer.load_corpus(raw_output_dir, ids, None, tables, window) for ids in batches]
+        replay_compute, _ = timed(lambda: [script.process_replay(bundle, bundle.replay_id) for bundle in bundles])
+        corpus_compute, _ = timed(lambda: [script.process_corpus(corpus) for corpus in corpora])
+
+    print(f"{'':<36}{'process_replay':>16}{'process_corpus':>16}{'speedup':>10}")
+    for name, before, after in [("end to end (replays/s)", per_replay_time, corpus_time), ("features only (replays/s)", replay_compute, corpus_compute)]:
+        print(f"{name:<36}{replays / before:>16.0f}{replays / after:>16.0f}{before / after:>9.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare process_replay and process_corpus for SimpleFeatures.")
+    parser.add_argument("--replays", type=int, default=1000, help="Number of synthetic replays.")
+    parser.add_argument("--minutes", type=float, default=15, help="Maximum game length (games are 1/3 to 1x this long).")
+    parser.add_argument("--batch", type=int, default=500, help="Replays per process_corpus batch.")
+    parser.add_argument("--dir", default=None, help="Directory to write the replays to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.replays, args.minutes, args.batch, args.dir)
@@ -0,0 +1,85 @@
+"""
+Time of Train-Model.py's data preparation and training with and without the dataset cache (internal/dataset_cache.py).
+
+Writes --rows synthetic SimpleFeatures-shaped rows (see bench_model_search) as a Parquet feature file and as a CSV
+export. For each file, runs the steps of a Train-Model.py run with the predict_winner model script three ways: without
+the cache (read the features, split them with GroupShuffleSplit, prepare_data, LGBMClassifier.fit), with a cache miss
+(the same, plus binning and storing the training rows), and with a cache hit (hash the file, load the binned
+Dataset and the test rows). Fails unless all three give the same test predictions, then reports the time until the
+data is ready to train on and the total time with training.
+
+Usage (from the project root):
+    py -m benchmarks.bench_dataset_cache [--rows N] [--repeat N] [--dir PATH]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from sklearn.model_selection import GroupShuffleSplit
+
+from benchmarks.bench_model_search import make_features
+from internal.dataset_cache import DatasetCache
+from internal.feature_store import read_features
+from internal.model_search import booster_params, fit_on_dataset
+
+sys.path.append(str(Path(__file__).parent.parent / "ModelScripts"))
+from predict_winner import ModelScript
+
+SPLIT = "GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42) on replay_id"
+
+def prepare(features_path, model_script):
+    df = read_features(features_path)
+    train_idx, test_idx = next(GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42).split(df, groups=df["replay_id"]))
+    X_train, y_train = model_script.prepare_data(df.iloc[train_idx])
+    X_test, y_test = model_script.prepare_data(df.iloc[test_idx])
+    return X_train, y_train, X_test, y_test, df["replay_id"].iloc[test_idx], {"train_idx": train_idx, "test_idx": test_idx}
+
+def run_uncached(features_path, model_script):
+    start = time.perf_counter()
+    X_train, y_train, X_test, _, _, _ = prepare(features_path, model_script)
+    ready = time.perf_counter() - start
+    model = model_script.get_model().fit(X_train, y_train)
+    return ready, time.perf_counter() - start, model.predict_proba(X_test)[:, 1]
+
+def run_cached(features_path, model_script, cache: DatasetCache):
+    start = time.perf_counter()
+    params = booster_params(model_script.get_model())[0]
+    key = cache.key(features_path, model_script, SPLIT, params)
+    cached = cache.load(key)
+    if cached is None:
+        X_train, y_train, X_test, y_test, groups, split = prepare(features_path, model_script)
+        cached = cache.store(key, X_train, y_train, X_test, y_test, groups, params, split)
+    ready = time.perf_counter() - start
+    model = fit_on_dataset(model_script.get_model(), cached.dataset, cached.classes)
+    return ready, time.perf_counter() - start, model.predict_proba(cached.X)[:, 1]
+
+def run(rows: int, repeat: int, directory: str | None):
+    model_script = ModelScript()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(directory or temp_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        df = make_features(rows)
+        paths = {"parquet": root / "features.parquet", "csv": root / "features.csv"}
+        df.to_parquet(paths["parquet"], index=False)
+        df.to_csv(paths["csv"], index=False)
+        print(f"{rows} rows, {df['replay_id'].nunique()} replays, best of {repeat} runs")
+        print(f"{'':<10}{'run':<12}{'data ready (s)':>16}{'total (s)':>12}")
+        for file_format, path in paths.items():
+            cache = DatasetCache(root / f"cache_{file_format}")
+            uncached = min((run_uncached(path, model_script) for _ in range(repeat)), key=lambda result: result[1])
+            miss = run_cached(path, model_script, cache)
+            hit = min((run_cached(path, model_script, cache) for _ in range(repeat)), key=lambda result: result[1])
+            assert np.array_equal(miss[2], uncached[2]) and np.array_equal(hit[2], uncached[2]), f"{file_format}: the cached runs predict differently"
+            for name, (ready, total, _) in [("no cache", uncached), ("cache miss", miss), ("cache hit", hit)]:
+                print(f"{file_format:<10}{name:<12}{ready:>16.3f}{total:>12.3f}")
+        print("The cached runs give the same test predictions as the uncached run.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Train-Model.py's data preparation with and without the dataset cache.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Synthetic feature rows (two per replay).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs without the cache and with a cache hit (the best is reported).")
+    parser.add_argument("--dir", default=None, help="Directory to write the feature files and the cache to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.rows, args.repeat, args.dir)
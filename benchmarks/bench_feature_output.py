@@ -0,0 +1,108 @@
+"""
+Benchmark for writing engineered features.
+
+Writes the same synthetic per-replay feature frames (shaped like SimpleFeatures output: two rows per replay, float
+features, a win flag and categorical race/bot columns) with the previous append-mode CSV writes and with the single
+open Parquet writer (internal.feature_store.FeatureWriter). Reports write time, read time and file size, and fails if
+the Parquet file doesn't read back the same values, or loses the categorical columns.
+
+Usage (from the project root):
+    py -m benchmarks.bench_feature_output [--rows N] [--rows-per-replay N] [--batch-rows N] [--dir PATH]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from internal.feature_store import FeatureWriter, read_features
+
+FLOAT_FEATURES = 16
+RACES = ["Protoss", "Terran", "Zerg", "Random"]
+
+def make_replay_frames(rows: int, rows_per_replay: int, seed: int = 0) -> list[pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    replays = rows // rows_per_replay
+    total = replays * rows_per_replay
+    bots = np.array([f"Bot{i:03d}" for i in range(200)], dtype=object)
+    columns = {"replay_id": np.repeat([f"{4300000 + replay}" for replay in range(replays)], rows_per_replay).astype(object)}
+    for i in range(FLOAT_FEATURES):
+        columns[f"feature_{i}"] = rng.normal(size=total) * 1000
+    columns["win"] = rng.random(total) < 0.5
+    columns["pov_race"] = rng.choice(np.array(RACES, dtype=object), total)
+    columns["enemy_race"] = rng.choice(np.array(RACES, dtype=object), total)
+    columns["pov_ID"] = rng.choice(bots, total)
+    columns["enemy_ID"] = rng.choice(bots, total)
+
+    categorical = ("pov_race", "enemy_race", "pov_ID", "enemy_ID") # Categories per replay, like the feature scripts set them
+    frames = []
+    for start in range(0, total, rows_per_replay):
+        frames.append(pd.DataFrame({
+            name: pd.Categorical(values[start:start + rows_per_replay]) if name in categorical else values[start:start + rows_per_replay]
+            for name, values in columns.items()
+        }))
+    return frames
+
+def write_csv_append(frames, path: Path):
+    """The previous Feature-Engineer.py output: one append-mode to_csv call per replay."""
+    is_first_write = True
+    for df in frames:
+        df.to_csv(path, mode="a", header=is_first_write, index=False)
+        is_first_write = False
+
+def write_parquet(frames, path: Path, batch_rows: int):
+    with FeatureWriter(path, batch_rows=batch_rows) as writer:
+        for df in frames:
+            writer.write(df)
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def run(rows: int, rows_per_replay: int, batch_rows: int, directory: str | None):
+    frames = make_replay_frames(rows, rows_per_replay)
+    total_rows = sum(len(df) for df in frames)
+    print(f"{len(frames)} replays, {total_rows} rows, {frames[0].shape[1]} columns")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        out_dir = Path(directory or temp_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        csv_path = out_dir / "features_bench.csv"
+        parquet_path = out_dir / "features_bench.parquet"
+        csv_path.unlink(missing_ok=True)
+
+        csv_write, _ = timed(write_csv_append, frames, csv_path)
+        parquet_write, _ = timed(write_parquet, frames, parquet_path, batch_rows)
+        csv_read, _ = timed(read_features, csv_path)
+        parquet_read, from_parquet = timed(read_features, parquet_path)
+
+        expected = pd.concat(frames, ignore_index=True)
+        categorical = [name for name in expected if isinstance(expected[name].dtype, pd.CategoricalDtype)]
+        assert all(isinstance(from_parquet[name].dtype, pd.CategoricalDtype) for name in categorical), "categorical columns not preserved"
+        for name in expected:
+            if name in categorical or expected[name].dtype == object:
+                assert (from_parquet[name].astype(str) == expected[name].astype(str)).all(), f"{name} differs"
+            else:
+                assert np.array_equal(from_parquet[name].to_numpy(), expected[name].to_numpy()), f"{name} differs"
+        print("Parquet output reads back identical values, categorical columns preserved.")
+
+        results = {
+            "append-mode CSV (before)": (csv_write, csv_read, csv_path.stat().st_size),
+            f"Parquet, {batch_rows}-row groups": (parquet_write, parquet_read, parquet_path.stat().st_size),
+        }
+        print(f"{'':<32}{'write':>10}{'read':>10}{'size':>12}")
+        for name, (write_s, read_s, size) in results.items():
+            print(f"{name:<32}{write_s:>9.2f}s{read_s:>9.3f}s{size / 2**20:>9.2f} MB")
+        print(f"Parquet vs CSV: write {csv_write / parquet_write:.1f}x faster, read {csv_read / parquet_read:.1f}x faster, "
+              f"{csv_path.stat().st_size / parquet_path.stat().st_size:.1f}x smaller")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark append-mode CSV against single-writer Parquet feature output.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Total feature rows to write.")
+    parser.add_argument("--rows-per-replay", type=int, default=2, help="Rows each replay's feature frame has (SimpleFeatures returns 2).")
+    parser.add_argument("--batch-rows", type=int, default=65_536, help="Rows per Parquet row group.")
+    parser.add_argument("--dir", default=None, help="Directory to write the files to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.rows, args.rows_per_replay, args.batch_rows, args.dir)
@@ -0,0 +1,136 @@
+"""
+Stub-bot harness for ObserverBot's lazy capture mode.
+
+Drives ObserverBot through a synthetic game (units moving, leaving and re-entering vision, dying while visible and
+while hidden) in both eager and lazy capture modes, checks that the units and deaths Parquet output is byte-identical,
+and reports the capture time of each mode.
+
+Usage (from the project root):
+    py -m benchmarks.bench_lazy_capture [--steps N] [--units N] [--interval N]
+"""
+import argparse
+import asyncio
+import importlib.util
+import io
+import random
+import time
+from types import SimpleNamespace
+import pandas as pd
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+from sc2.units import Units
+
+import internal.extractor_helper as exh
+
+def load_observer_bot():
+    """Imports ObserverBot from Replay-Extractor.py (the hyphenated filename can't be imported normally)."""
+    spec = importlib.util.spec_from_file_location("replay_extractor", "Replay-Extractor.py")
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.ObserverBot
+
+class StubUnit:
+    """Stands in for sc2.unit.Unit with the attributes the capture loop reads."""
+    def __init__(self, tag, type_id, owner_id, x, y, is_snapshot=False, health=45.0, minerals=0):
+        self._proto = SimpleNamespace(unit_type=type_id.value)
+        self.tag = tag
+        self.type_id = type_id
+        self.owner_id = owner_id
+        self.position = Point2((x, y))
+        self.is_snapshot = is_snapshot
+        self.health = health
+        self.shield = 0.0
+        self.energy = 0.0
+        self.build_progress = 1.0
+        self.is_mineral_field = minerals > 0
+        self.is_vespene_geyser = False
+        self.is_structure = False
+        self.mineral_contents = minerals
+        self.vespene_contents = 0
+
+def make_game(steps: int, units: int, seed: int = 0):
+    """Generates (visible units, destroyed tags) for every step of a synthetic game."""
+    rng = random.Random(seed)
+    type_ids = [UnitTypeId.SCV, UnitTypeId.MARINE, UnitTypeId.ZERGLING, UnitTypeId.STALKER, UnitTypeId.PROBE]
+    alive = {}
+    for i in range(units):
+        alive[4295000000 + i] = [rng.choice(type_ids), 1 + i % 2, rng.random() * 150, rng.random() * 150]
+    minerals = {4296000000 + i: [UnitTypeId.MINERALFIELD, 16, 20.0 + i, 30.0] for i in range(8)}
+    hidden = set()
+    next_tag = 4295000000 + units
+    game = []
+    for step in range(steps):
+        destroyed = []
+        for tag in rng.sample(sorted(alive), k=min(3, len(alive))):
+            roll = rng.random()
+            if roll < 0.3:
+                destroyed.append(tag) # Dies (possibly while hidden)
+                del alive[tag]
+                hidden.discard(tag)
+            elif roll < 0.7:
+                hidden.symmetric_difference_update({tag}) # Leaves or re-enters vision
+        for _ in range(len(destroyed)):
+            alive[next_tag] = [rng.choice(type_ids), 1 + next_tag % 2, rng.random() * 150, rng.random() * 150]
+            next_tag += 1
+        for state in alive.values():
+            state[2] += rng.uniform(-1, 1)
+            state[3] += rng.uniform(-1, 1)
+
+        visible = [StubUnit(tag, t, o, x, y, health=rng.choice([45.0, 40.0, 35.0]))
+                   for tag, (t, o, x, y) in alive.items() if tag not in hidden]
+        visible += [StubUnit(tag, t, o, x, y, minerals=1800 - step) for tag, (t, o, x, y) in minerals.items()]
+        game.append((visible, destroyed))
+    return game
+
+def run_bot(ObserverBot, game, interval: int, lazy_capture: bool):
+    class StubBot(ObserverBot):
+        time = 0.0 # Shadows ObserverAI.time, which reads from the game state.
+
+    bot = StubBot("stub.SC2Replay", observed_id=1, interval=interval, lazy_capture=lazy_capture)
+
+    async def play():
+        for iteration, (visible, destroyed) in enumerate(game):
+            bot.time = iteration / 22.4
+            # Destruction events are issued before on_step, like in sc2.main._play_replay.
+            for tag in destroyed:
+                await bot.on_unit_destroyed(tag)
+            bot.all_units = Units(visible, bot)
+            await bot.on_step(iteration)
+
+    start = time.perf_counter()
+    asyncio.run(play())
+    return bot, time.perf_counter() - start
+
+def parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer)
+    return buffer.getvalue()
+
+def outputs(bot) -> tuple[bytes, bytes]:
+    units_df = bot.unit_data.to_frame().sort_values(["timestamp", "unit_tag"], ignore_index=True)
+    deaths_df = pd.DataFrame(bot.death_data)
+    return parquet_bytes(exh.optimize_unit_dtypes(units_df)), parquet_bytes(exh.optimize_death_dtypes(deaths_df))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark ObserverBot's lazy capture mode with a stub bot.")
+    parser.add_argument("--steps", type=int, default=3000, help="Number of game steps to simulate.")
+    parser.add_argument("--units", type=int, default=200, help="Number of units alive on each step.")
+    parser.add_argument("--interval", type=int, default=20, help="Flush interval (in game steps).")
+    args = parser.parse_args()
+
+    ObserverBot = load_observer_bot()
+    game = make_game(args.steps, args.units)
+
+    eager_bot, eager_time = run_bot(ObserverBot, game, args.interval, lazy_capture=False)
+    lazy_bot, lazy_time = run_bot(ObserverBot, game, args.interval, lazy_capture=True)
+
+    eager_units, eager_deaths = outputs(eager_bot)
+    lazy_units, lazy_deaths = outputs(lazy_bot)
+    assert eager_units == lazy_units, "units.parquet output differs between eager and lazy capture"
+    assert eager_deaths == lazy_deaths, "deaths.parquet output differs between eager and lazy capture"
+
+    print(f"Output identical: {len(eager_bot.unit_data)} unit rows, {len(eager_bot.death_data)} deaths.")
+    print(f"{'capture':<8} {'time (s)':>10}")
+    print(f"{'eager':<8} {eager_time:>10.3f}")
+    print(f"{'lazy':<8} {lazy_time:>10.3f}")
@@ -0,0 +1,71 @@
+"""
+Size and load-time comparison of the LightGBM text model format and model artifacts (internal/model_artifact.py).
+
+Converts the checked-in OutputModels/predict_winner_20251118-210828.txt model (or --model) to a model artifact, with
+and without the training statistics (--prediction-only), and checks that every format loads to a booster with the
+same predictions, feature names and categories. Then reports the file sizes and the time to load each format
+(median of --repeat loads): the text model through Booster(model_file=...) as Train-Model.py's output was loaded
+before, and each file through the loader Predict.py uses.
+
+Usage (from the project root):
+    py -m benchmarks.bench_model_artifact [--model PATH] [--repeat N] [--dir PATH]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import lightgbm
+import numpy as np
+
+from internal.model_artifact import convert_text_model, load_booster, read_artifact
+
+DEFAULT_MODEL = Path("OutputModels") / "predict_winner_20251118-210828.txt"
+
+def median_time(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def run(model_path: Path, repeat: int, directory: str | None):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(directory or temp_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        artifact_path = convert_text_model(model_path, root / "model.lgbz")
+        prediction_only_path = convert_text_model(model_path, root / "model_prediction_only.lgbz", prediction_only=True)
+
+        reference, categories = load_booster(model_path)
+        rng = np.random.default_rng(0)
+        X = rng.uniform(-100, 1000, (5000, reference.num_feature()))
+        for i, name in enumerate(reference.feature_name()):
+            if name in categories:
+                X[:, i] = rng.integers(-1, len(categories[name]) + 1, len(X)) # Including unknown codes
+        expected = reference.predict(X)
+        for path in (artifact_path, prediction_only_path):
+            artifact = read_artifact(path)
+            assert np.array_equal(artifact.booster.predict(X), expected), f"{path.name} predicts differently"
+            assert artifact.feature_columns == reference.feature_name() and artifact.categories == categories
+        print(f"Every format loads to the same model ({reference.num_trees()} trees, same predictions on {len(X)} rows).")
+
+        rows = [
+            ("text, Booster(model_file)", model_path, lambda: lightgbm.Booster(model_file=str(model_path))),
+            ("text, Predict.py", model_path, lambda: load_booster(model_path)),
+            ("artifact", artifact_path, lambda: load_booster(artifact_path)),
+            ("artifact, prediction-only", prediction_only_path, lambda: load_booster(prediction_only_path)),
+        ]
+        results = [(name, path.stat().st_size, median_time(load, repeat)) for name, path, load in rows]
+
+    text_size, text_time = results[0][1], results[0][2]
+    print(f"{'':<30}{'size (KB)':>12}{'load (ms)':>12}{'size':>8}{'load':>8}")
+    for name, size, load_time in results:
+        print(f"{name:<30}{size / 1024:>12.1f}{load_time * 1e3:>12.2f}{size / text_size - 1:>+8.0%}{load_time / text_time - 1:>+8.0%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the size and load time of text models and model artifacts.")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="LightGBM text model to convert.")
+    parser.add_argument("--repeat", type=int, default=50, help="Loads per format.")
+    parser.add_argument("--dir", default=None, help="Directory to write the artifacts to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(Path(args.model), args.repeat, args.dir)
@@ -0,0 +1,101 @@
+"""
+Time of cross-validating a hyperparameter search with internal/model_search.py against fitting an LGBMClassifier per
+fold and trial.
+
+Generates --rows synthetic feature rows shaped like SimpleFeatures output (two rows per replay, player name and race
+categories, numeric features, a noisy win label). Then cross-validates --trials random combinations of the
+predict_winner search space with --folds GroupKFold folds, twice: the previous way (a new LGBMClassifier fitted on the
+fold's DataFrame rows for every fold of every trial, one after the other) and with cross_validate (one binned Dataset
+shared by every fit, --workers threads). Checks that both rank the trials alike, since the shared bins change the
+models slightly, and reports the time of each, with and without early stopping.
+
+Usage (from the project root):
+    py -m benchmarks.bench_model_search [--rows N] [--trials N] [--folds K] [--workers N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import lightgbm
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import GroupKFold
+
+from internal.model_search import cross_validate, early_stopping_split, search_candidates
+
+sys.path.append(str(Path(__file__).parent.parent / "ModelScripts"))
+from predict_winner import ModelScript
+
+RACES = ["Terran", "Protoss", "Zerg"]
+
+def make_features(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    replays = rows // 2
+    players = np.array([f"Bot{i}" for i in range(40)], dtype=object)
+    skill = rng.normal(size=len(players))
+    pov, enemy = rng.integers(0, len(players), replays), rng.integers(0, len(players), replays)
+    data = {"replay_id": np.repeat(np.arange(replays), 2).astype(str),
+            "pov_ID": np.column_stack([players[pov], players[enemy]]).ravel(),
+            "enemy_ID": np.column_stack([players[enemy], players[pov]]).ravel()}
+    race = rng.integers(0, 3, (replays, 2))
+    data["pov_race"] = np.array(RACES, dtype=object)[race.ravel()]
+    data["enemy_race"] = np.array(RACES, dtype=object)[race[:, ::-1].ravel()]
+    edge = np.column_stack([skill[pov] - skill[enemy], skill[enemy] - skill[pov]]).ravel()
+    for name in ["workers3", "army_supply3", "workers4", "army_supply4", "workers_delta_34", "army_supply_delta_34",
+                 "mpm_2_4", "vpm_2_4", "max_mineral_bank_4m", "max_vespene_bank_4m"]:
+        data[name] = rng.normal(50, 15, rows) + 5 * edge
+    for name in ["workers_adv3", "army_supply_adv3", "workers_adv4", "army_supply_adv4", "mpm_adv_2_4", "vpm_adv_2_4"]:
+        data[name] = rng.normal(0, 10, rows) + 4 * edge
+    win = np.column_stack([edge[::2] + rng.normal(0, 1, replays) > 0] * 2)
+    win[:, 1] = ~win[:, 0]
+    data["win"] = win.ravel()
+    return pd.DataFrame(data)
+
+def fit_per_fold(model_script, X, y, groups, folds: int, candidates: list[dict], early_stopping_rounds: int | None) -> pd.DataFrame:
+    """The previous way: an LGBMClassifier fitted on the fold's rows (binned again) for every fold of every trial."""
+    splits = list(GroupKFold(n_splits=folds).split(X, y, groups))
+    rows = []
+    for candidate in candidates:
+        accuracies = []
+        for train_idx, test_idx in splits:
+            model = model_script.get_model().set_params(verbose=-1, **candidate)
+            fit_args = {}
+            if early_stopping_rounds:
+                train_idx, valid_idx = early_stopping_split(train_idx, groups)
+                fit_args = {"eval_set": [(X.iloc[valid_idx], y.iloc[valid_idx])], "callbacks": [lightgbm.early_stopping(early_stopping_rounds, verbose=False)]}
+            model.fit(X.iloc[train_idx], y.iloc[train_idx], **fit_args)
+            accuracies.append((model.predict(X.iloc[test_idx]) == y.iloc[test_idx]).mean())
+        rows.append({**candidate, "accuracy_mean": np.mean(accuracies)})
+    return pd.DataFrame(rows)
+
+def run(rows: int, trials: int, folds: int, workers: int | None):
+    df = make_features(rows)
+    model_script = ModelScript()
+    X, y = model_script.prepare_data(df)
+    groups = df["replay_id"]
+    candidates = search_candidates(model_script.get_search_space(), trials)
+    print(f"{rows} rows, {groups.nunique()} replays, {len(candidates)} trials x {folds} folds")
+    print(f"{'':<24}{'per-fold fits (s)':>18}{'cross_validate (s)':>20}{'speedup':>9}")
+    for name, early_stopping_rounds in [("full rounds", None), ("early stopping 20", 20)]:
+        start = time.perf_counter()
+        before = fit_per_fold(model_script, X, y, groups, folds, candidates, early_stopping_rounds)
+        before_time = time.perf_counter() - start
+        start = time.perf_counter()
+        after = cross_validate(model_script.get_model(), X, y, groups, folds, candidates, early_stopping_rounds, workers)
+        after_time = time.perf_counter() - start
+
+        merged = before.merge(after, on=list(candidates[0]), suffixes=("_before", "_after"))
+        difference = (merged["accuracy_mean_before"] - merged["accuracy_mean_after"]).abs().max()
+        assert difference < 0.02, f"mean accuracies differ by up to {difference:.4f}"
+        print(f"{name:<24}{before_time:>18.2f}{after_time:>20.2f}{before_time / after_time:>8.1f}x")
+    best = after.to_dict("records")[0]
+    print(f"Best trial: {({name: best[name] for name in candidates[0]})}, accuracy {best['accuracy_mean']:.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cross-validated hyperparameter search on synthetic features.")
+    parser.add_argument("--rows", type=int, default=20_000, help="Synthetic feature rows (two per replay).")
+    parser.add_argument("--trials", type=int, default=8, help="Parameter combinations drawn from the search space.")
+    parser.add_argument("--folds", type=int, default=5, help="GroupKFold folds.")
+    parser.add_argument("--workers", type=int, default=None, help="Threads for cross_validate (default: one per CPU).")
+    args = parser.parse_args()
+    run(args.rows, args.trials, args.folds, args.workers)
@@ -0,0 +1,97 @@
+"""
+Latency and throughput of scoring games with a saved winner model through internal/model_predictor.py.
+
+Loads the checked-in OutputModels/predict_winner_20251118-210828.txt model (or --model) and generates --rows synthetic
+feature rows: categorical features drawn from the model's categories (plus some unknown names), numeric ones
+uniform over the ranges the model was trained on, with a few missing values. Checks that ModelPredictor gives the
+same predictions as Booster.predict on the DataFrame the model script prepares, in batches and row by row.
+
+Then reports the model load time (first parse and parse-cache hit), batch throughput, and single-game latency
+(median and 99th percentile over --games games) of the previous way (ModelScript.prepare_data and Booster.predict on
+a DataFrame) and of ModelPredictor.predict / predict_one.
+
+Usage (from the project root):
+    py -m benchmarks.bench_predict [--model PATH] [--rows N] [--games N] [--batch-rows N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from internal.model_predictor import ModelPredictor, load_predictor
+
+sys.path.append(str(Path(__file__).parent.parent / "ModelScripts"))
+from predict_winner import ModelScript
+
+DEFAULT_MODEL = Path("OutputModels") / "predict_winner_20251118-210828.txt"
+
+def make_features(predictor: ModelPredictor, rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    feature_infos = predictor.booster.dump_model(num_iteration=1)["feature_infos"]
+    data = {"replay_id": np.repeat(np.arange(rows // 2 + 1), 2)[:rows].astype(str), "win": rng.random(rows) < 0.5}
+    for name in predictor.feature_names:
+        categories = predictor.categories.get(name)
+        if categories is not None:
+            values = rng.choice(np.array([*categories, "UnknownBot"], dtype=object), rows)
+            data[name] = pd.Categorical(values)
+        else:
+            info = feature_infos.get(name, {"min_value": 0, "max_value": 1})
+            values = rng.uniform(info["min_value"], info["max_value"], rows)
+            values[rng.random(rows) < 0.01] = np.nan
+            data[name] = values
+    return pd.DataFrame(data)
+
+def latencies(function, rows: list) -> np.ndarray:
+    times = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        function(row)
+        times[i] = time.perf_counter() - start
+    return times
+
+def run(model_path: Path, rows: int, games: int, batch_rows: int):
+    start = time.perf_counter()
+    predictor = load_predictor(model_path)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    assert load_predictor(model_path) is predictor
+    cached_load_time = time.perf_counter() - start
+
+    df = make_features(predictor, rows)
+    model_script = ModelScript()
+    booster = predictor.booster
+
+    start = time.perf_counter()
+    expected = booster.predict(model_script.prepare_data(df)[0])
+    frame_time = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = predictor.predict(df, batch_rows)
+    predictor_time = time.perf_counter() - start
+    assert np.array_equal(actual, expected), "batch predictions differ"
+
+    records = df.iloc[:games].to_dict("records")
+    one_rows = [df.iloc[[i]] for i in range(min(games, len(df)))]
+    single = np.array([predictor.predict_one(record) for record in records])
+    assert np.array_equal(single, expected[:len(records)]), "single-game predictions differ"
+    print(f"Same predictions as Booster.predict on the model script's DataFrame ({rows} rows, {len(records)} single games).")
+
+    frame_latency = latencies(lambda row: booster.predict(model_script.prepare_data(row)[0]), one_rows)
+    predictor_latency = latencies(predictor.predict_one, records)
+
+    print(f"Model: {model_path.name}, {booster.num_trees()} trees, {len(predictor.feature_names)} features")
+    print(f"Load: {load_time * 1e3:.1f}ms, {cached_load_time * 1e6:.0f}us from the parse cache")
+    print(f"{'':<28}{'DataFrame':>14}{'ModelPredictor':>16}")
+    print(f"{'batch (rows/s)':<28}{rows / frame_time:>14,.0f}{rows / predictor_time:>16,.0f}")
+    for name, quantile in [("single game p50 (us)", 50), ("single game p99 (us)", 99)]:
+        print(f"{name:<28}{np.percentile(frame_latency, quantile) * 1e6:>14.1f}{np.percentile(predictor_latency, quantile) * 1e6:>16.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch and single-game scoring with a saved model.")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="Saved model to score with.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Synthetic feature rows for the batch scoring.")
+    parser.add_argument("--games", type=int, default=2_000, help="Games scored one at a time for the latency.")
+    parser.add_argument("--batch-rows", type=int, default=65_536, help="Rows per ModelPredictor.predict batch.")
+    args = parser.parse_args()
+    run(Path(args.model), args.rows, args.games, args.batch_rows)
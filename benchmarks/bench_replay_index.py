@@ -0,0 +1,118 @@
+"""
+Benchmark for selecting replays with the replay index (internal/replay_index.py).
+
+Fills an index with synthetic metadata of --replays replays (100,000 by default) and times typical Feature-Engineer.py
+selections on it: a duration range, a matchup, a player, a date range, and a stratified --limit sample. Each result is
+checked against the same filter applied with pandas to the rows that were indexed. For comparison, it also writes
+--json-replays replay directories with an _info.json each and times the previous selection (listing OutputRaw and
+reading every _info.json to check the duration), which grows linearly with the number of replays.
+
+Usage (from the project root):
+    py -m benchmarks.bench_replay_index [--replays N] [--json-replays N] [--dir PATH]
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from internal.replay_index import ReplayIndex, ReplayQuery, index_row
+
+RACES = ["Prot", "Terr", "Zerg"]
+MAPS = [f"Map{i:02d}LE" for i in range(12)]
+
+def make_metadata(rng, count: int) -> list[dict]:
+    players = [f"Bot{i:03d}" for i in range(300)]
+    metadata = []
+    for _ in range(count):
+        winner = int(rng.integers(1, 3))
+        metadata.append({
+            "Title": str(rng.choice(MAPS)), "GameVersion": "5.0.13.92440", "BaseBuild": "Base92440",
+            "Duration": int(rng.integers(60, 3600)),
+            "Players": [{"PlayerID": player_id, "PlayerName": str(rng.choice(players)), "SelectedRace": str(rng.choice(RACES)),
+                         "Result": "Win" if player_id == winner else "Loss"} for player_id in (1, 2)],
+        })
+    return metadata
+
+def fill_index(index: ReplayIndex, metadata: list[dict], rng) -> pd.DataFrame:
+    rows = [index_row(str(4_000_000 + i), info) for i, info in enumerate(metadata)]
+    days = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, len(rows)), unit="D")
+    for row, day in zip(rows, days):
+        row["replay_date"] = day.strftime("%Y-%m-%d %H:%M:%S")
+    index.add_metadata(rows)
+    index.set_extraction_status({row["replay_id"]: "done" for row in rows})
+    return pd.DataFrame(rows)
+
+def select_json(raw_output_dir: Path, min_d: int) -> list[str]:
+    """The previous Feature-Engineer.py selection: list OutputRaw, then read each _info.json."""
+    selected = []
+    for replay_path in raw_output_dir.iterdir():
+        if replay_path.is_dir():
+            with open(next(replay_path.glob("*_info.json"))) as f:
+                if json.load(f).get("Duration", 0) >= min_d:
+                    selected.append(replay_path.name)
+    return sorted(selected)
+
+def timed(function, *args, repeat: int = 5):
+    """Best of `repeat` runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run(replays: int, json_replays: int, directory: str | None):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(directory or temp_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        with ReplayIndex(root / "replay_index.sqlite") as index:
+            metadata = make_metadata(rng, replays)
+            start = time.perf_counter()
+            df = fill_index(index, metadata, rng)
+            print(f"Indexed {replays} replays in {time.perf_counter() - start:.1f}s")
+
+            player = df["p1_name"].iloc[0]
+            queries = {
+                "duration 10-20 min": (ReplayQuery(min_duration=600, max_duration=1200), (df["duration"] >= 600) & (df["duration"] <= 1200)),
+                "matchup PvZ, >= 5 min": (ReplayQuery(min_duration=300, matchups=["ZvP"]), (df["matchup"] == "PvZ") & (df["duration"] >= 300)),
+                f"player {player}": (ReplayQuery(players=[player]), (df["p1_name"] == player) | (df["p2_name"] == player)),
+                "January 2025": (ReplayQuery(since="2025-01-01", until="2025-01-31"), df["replay_date"].str[:10].between("2025-01-01", "2025-01-31")),
+            }
+            results = []
+            for name, (query, mask) in queries.items():
+                elapsed, selected = timed(index.select, query)
+                assert selected == sorted(df.loc[mask, "replay_id"]), f"{name}: selection differs"
+                results.append((name, len(selected), elapsed))
+            elapsed, sample = timed(index.sample, ReplayQuery(), 1000, "matchup", 0)
+            assert sample == index.sample(ReplayQuery(), 1000, "matchup", 0), "sample isn't reproducible"
+            proportions = df.set_index("replay_id").loc[sample, "matchup"].value_counts(normalize=True)
+            assert (proportions - df["matchup"].value_counts(normalize=True)).abs().max() < 0.01, "sample isn't stratified"
+            results.append(("stratified sample of 1000", len(sample), elapsed))
+
+        raw_output_dir = root / "OutputRaw"
+        for i, info in enumerate(make_metadata(rng, json_replays)):
+            replay_dir = raw_output_dir / str(4_000_000 + i)
+            replay_dir.mkdir(parents=True, exist_ok=True)
+            with open(replay_dir / f"{4_000_000 + i}_info.json", "w") as f:
+                json.dump(info, f)
+        json_time, _ = timed(select_json, raw_output_dir, 600, repeat=1)
+
+    print("Every selection matches the same filter applied with pandas.")
+    print(f"{'replay index query':<32}{'replays':>10}{'time':>12}")
+    for name, count, elapsed in results:
+        print(f"{name:<32}{count:>10}{elapsed * 1e3:>9.1f} ms")
+    print(f"Listing OutputRaw and reading {json_replays} _info.json files: {json_time:.2f}s "
+          f"({json_time / json_replays * 1e3:.3f} ms per replay, ~{json_time / json_replays * replays:.1f}s for {replays} replays)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark replay selection with the replay index.")
+    parser.add_argument("--replays", type=int, default=100_000, help="Number of replays in the index.")
+    parser.add_argument("--json-replays", type=int, default=2000, help="Number of _info.json files for the previous selection.")
+    parser.add_argument("--dir", default=None, help="Directory to write the index and the replay directories to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.replays, args.json_replays, args.dir)
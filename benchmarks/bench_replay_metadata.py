@@ -0,0 +1,76 @@
+"""
+Benchmark for replay metadata extraction on a directory of synthetic MPQ replays.
+
+Compares the previous approach (read the whole file into a BytesIO and extract() every archive member) against
+reading only replay.gamemetadata.json through a regular file handle and through mmap (internal.replay_archive), and
+then fans the mmap reader out over a process pool. Fails if any method returns different metadata.
+
+Usage (from the project root):
+    py -m benchmarks.bench_replay_metadata [--replays N] [--member-kb N] [--workers N] [--dir PATH]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import mpyq
+
+from benchmarks.synthetic_replays import make_replay_dir
+from internal.replay_archive import METADATA_MEMBER, read_replay_metadata
+
+def read_full_extract(replay_path) -> dict:
+    """The previous Replay-Metadata.py read: whole file copied into memory, every member decompressed."""
+    with open(replay_path, "rb") as f:
+        replay_io = BytesIO()
+        replay_io.write(f.read())
+        replay_io.seek(0)
+        archive = mpyq.MPQArchive(replay_io).extract()
+    return json.loads(archive[METADATA_MEMBER.encode()].decode("utf-8"))
+
+def read_member_buffered(replay_path) -> dict:
+    """Single member through a buffered file handle (no mmap)."""
+    with open(replay_path, "rb") as f:
+        data = mpyq.MPQArchive(f, listfile=False).read_file(METADATA_MEMBER)
+    return json.loads(data.decode("utf-8"))
+
+def time_serial(read, paths):
+    start = time.perf_counter()
+    results = [read(path) for path in paths]
+    return time.perf_counter() - start, results
+
+def time_pool(read, paths, workers: int):
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(read, paths, chunksize=max(1, len(paths) // (workers * 8))))
+    return time.perf_counter() - start, results
+
+def run(replays: int, member_kb: int, workers: int, directory: str | None):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        replay_dir = directory or temp_dir
+        start = time.perf_counter()
+        paths = make_replay_dir(replay_dir, replays, member_kb)
+        total_mb = sum(os.path.getsize(path) for path in paths) / 2**20
+        print(f"Wrote {replays} synthetic replays ({total_mb:.1f} MB) to {replay_dir} in {time.perf_counter() - start:.1f}s")
+
+        timings = {}
+        timings["full extract (before)"], expected = time_serial(read_full_extract, paths)
+        timings["single member, buffered"], buffered = time_serial(read_member_buffered, paths)
+        timings["single member, mmap"], mapped = time_serial(read_replay_metadata, paths)
+        timings[f"single member, mmap, {workers} processes"], pooled = time_pool(read_replay_metadata, paths, workers)
+        assert buffered == expected and mapped == expected and pooled == expected, "metadata differs between methods"
+        print("All methods returned identical metadata.")
+
+        baseline = timings["full extract (before)"]
+        for name, seconds in timings.items():
+            print(f"{name:<40}{seconds:>9.3f}s{replays / seconds:>12.0f} replays/s{baseline / seconds:>8.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark replay metadata extraction on synthetic MPQ replays.")
+    parser.add_argument("--replays", type=int, default=500, help="Number of synthetic replays to generate.")
+    parser.add_argument("--member-kb", type=int, default=128, help="Uncompressed size of each filler archive member (6 per replay).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the pool run.")
+    parser.add_argument("--dir", default=None, help="Directory to write the replays to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.replays, args.member_kb, args.workers, args.dir)
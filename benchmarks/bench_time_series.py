@@ -0,0 +1,100 @@
+"""
+Benchmark for time-series lookups in feature scripts.
+
+Builds synthetic resources tables shaped like the extractor's resources.parquet and compares the mask-and-iloc
+pattern SimpleFeatures used (df[df['timestamp'] <= t].iloc[-1] per query) with internal.time_series.TimeSeries
+(one sort check per replay, then searchsorted lookups). Two workloads: the SimpleFeatures queries (supply at 3 and
+4 minutes, collection rates between 2 and 4 minutes, max bank up to 4 minutes), and as-of values of four columns at
+every 10 seconds of the game. Fails if the two methods return different values.
+
+Usage (from the project root):
+    py -m benchmarks.bench_time_series [--replays N] [--minutes N] [--rows-per-second N]
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from internal.time_series import TimeSeries
+
+RESOURCE_COLUMNS = ("p1_minerals", "p1_vespene", "p1_supply_used", "p1_supply_army", "p2_minerals", "p2_vespene", "p2_supply_used", "p2_supply_army")
+
+def make_resources(rng, minutes: float, rows_per_second: float) -> pd.DataFrame:
+    """A resources table with the extractor's dtypes: banks rise and get spent, supply only grows."""
+    rows = int(minutes * 60 * rows_per_second)
+    df = pd.DataFrame({"timestamp": np.arange(rows, dtype=np.float64) / rows_per_second})
+    for player in ("p1", "p2"):
+        df[f"{player}_minerals"] = (np.abs(np.cumsum(rng.normal(1, 20, rows))) % 3000).astype(np.uint16)
+        df[f"{player}_vespene"] = (np.abs(np.cumsum(rng.normal(0.5, 10, rows))) % 2000).astype(np.uint16)
+        used = np.minimum(np.cumsum(rng.random(rows) < 0.01) + 24, 400)
+        df[f"{player}_supply_cap"] = np.minimum(used + 16, 400).astype(np.int64)
+        df[f"{player}_supply_used"] = np.minimum(used, 255).astype(np.uint8)
+        df[f"{player}_supply_army"] = (df[f"{player}_supply_used"] // 3).astype(np.uint8)
+    return df
+
+def simple_features_mask(df: pd.DataFrame) -> list[float]:
+    """The queries of SimpleFeatures, with its previous mask-and-iloc helpers."""
+    out = []
+    for t in (3*60, 4*60):
+        snapshot = df[df['timestamp'] <= t].iloc[-1]
+        out += [(snapshot['p1_supply_used'] - snapshot['p1_supply_army']) / 2, snapshot['p1_supply_army'] / 2,
+                (snapshot['p2_supply_used'] - snapshot['p2_supply_army']) / 2, snapshot['p2_supply_army'] / 2]
+    start_snapshot = df[df['timestamp'] <= 2*60].iloc[-1]
+    end_snapshot = df[df['timestamp'] <= 4*60].iloc[-1]
+    for column in ('p1_minerals', 'p1_vespene', 'p2_minerals', 'p2_vespene'):
+        out.append((int(end_snapshot[column]) - int(start_snapshot[column])) / 2)
+    df_filtered = df[df['timestamp'] <= 4*60]
+    out += [df_filtered[column].max() for column in ('p1_minerals', 'p1_vespene', 'p2_minerals', 'p2_vespene')]
+    return [float(value) for value in out]
+
+def simple_features_indexed(df: pd.DataFrame) -> list[float]:
+    ts = TimeSeries(df)
+    army1, used1 = ts.asof('p1_supply_army', [3*60, 4*60]), ts.asof('p1_supply_used', [3*60, 4*60])
+    army2, used2 = ts.asof('p2_supply_army', [3*60, 4*60]), ts.asof('p2_supply_used', [3*60, 4*60])
+    out = []
+    for i in range(2):
+        out += [(used1[i] - army1[i]) / 2, army1[i] / 2, (used2[i] - army2[i]) / 2, army2[i] / 2]
+    out += [ts.rate(column, 2*60, 4*60) for column in ('p1_minerals', 'p1_vespene', 'p2_minerals', 'p2_vespene')]
+    out += [ts.running_max(column, 4*60) for column in ('p1_minerals', 'p1_vespene', 'p2_minerals', 'p2_vespene')]
+    return [float(value) for value in out]
+
+def timeline_mask(df: pd.DataFrame, times) -> np.ndarray:
+    columns = ['p1_minerals', 'p2_minerals', 'p1_supply_used', 'p2_supply_used']
+    return np.array([[float(df[df['timestamp'] <= t].iloc[-1][column]) for column in columns] for t in times])
+
+def timeline_indexed(df: pd.DataFrame, times) -> np.ndarray:
+    ts = TimeSeries(df)
+    return np.column_stack([ts.asof(column, times) for column in ['p1_minerals', 'p2_minerals', 'p1_supply_used', 'p2_supply_used']])
+
+def timed(function, tables, *args):
+    start = time.perf_counter()
+    results = [function(df, *args) for df in tables]
+    return time.perf_counter() - start, results
+
+def run(replays: int, minutes: float, rows_per_second: float):
+    rng = np.random.default_rng(0)
+    tables = [make_resources(rng, minutes, rows_per_second) for _ in range(replays)]
+    print(f"{replays} replays, {len(tables[0])} resource rows each ({minutes} minutes)")
+
+    mask_time, mask_values = timed(simple_features_mask, tables)
+    indexed_time, indexed_values = timed(simple_features_indexed, tables)
+    assert mask_values == indexed_values, "SimpleFeatures queries differ"
+
+    times = np.arange(10, minutes * 60, 10)
+    timeline_mask_time, timeline_mask_values = timed(timeline_mask, tables, times)
+    timeline_indexed_time, timeline_indexed_values = timed(timeline_indexed, tables, times)
+    assert all(np.array_equal(a, b) for a, b in zip(timeline_mask_values, timeline_indexed_values)), "as-of timelines differ"
+    print("Both methods returned identical values.")
+
+    print(f"{'':<44}{'mask + iloc':>14}{'TimeSeries':>14}{'speedup':>10}")
+    for name, before, after in [("SimpleFeatures queries", mask_time, indexed_time),
+                                (f"as-of of 4 columns at {len(times)} times", timeline_mask_time, timeline_indexed_time)]:
+        print(f"{name:<44}{before / replays * 1e3:>11.2f} ms{after / replays * 1e3:>11.2f} ms{before / after:>9.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark mask-and-iloc lookups against the TimeSeries index.")
+    parser.add_argument("--replays", type=int, default=50, help="Number of synthetic resources tables.")
+    parser.add_argument("--minutes", type=float, default=15, help="Game length of each table.")
+    parser.add_argument("--rows-per-second", type=float, default=22.4, help="Resource rows per game second (22.4 is one per game loop).")
+    args = parser.parse_args()
+    run(args.replays, args.minutes, args.rows_per_second)
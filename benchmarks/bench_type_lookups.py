@@ -0,0 +1,134 @@
+"""
+Per-step cost of the capture loop's unit filter and unit rows, with and without the per-game unit type table
+(internal/extractor_helper.py UnitTypeTable).
+
+Builds python-sc2 Unit objects on synthetic raw unit protos and game data (a mix of units, structures, mineral fields
+and geysers, some of them snapshots), fresh ones for every step like the game loop does. Then runs the previous
+capture code (split_units and a filter, type_id.name, is_mineral_field / is_vespene_geyser) and the current one
+(filter_units and the table) on them, checks that they record the same rows, and reports the time per step.
+
+Usage (from the project root):
+    py -m benchmarks.bench_type_lookups [--steps N] [--units N]
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+from typing import Callable
+import numpy as np
+import pandas as pd
+from s2clientprotocol import raw_pb2, sc2api_pb2
+from sc2.data import Attribute
+from sc2.game_data import GameData
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.unit import Unit
+from sc2.units import Units
+
+import internal.extractor_helper as exh
+from internal.unit_recorder import UnitRecorder
+
+BASE_BUILD = 90000
+SNAPSHOT = 2 # raw_pb2.DisplayType.Snapshot
+MINERAL_TYPES = [UnitTypeId.MINERALFIELD, UnitTypeId.MINERALFIELD750, UnitTypeId.RICHMINERALFIELD]
+GEYSER_TYPES = [UnitTypeId.VESPENEGEYSER, UnitTypeId.SPACEPLATFORMGEYSER]
+STRUCTURE_TYPES = [UnitTypeId.COMMANDCENTER, UnitTypeId.SUPPLYDEPOT, UnitTypeId.BARRACKS, UnitTypeId.NEXUS, UnitTypeId.PYLON, UnitTypeId.HATCHERY]
+UNIT_TYPES = [UnitTypeId.SCV, UnitTypeId.MARINE, UnitTypeId.MARAUDER, UnitTypeId.PROBE, UnitTypeId.STALKER, UnitTypeId.ZEALOT,
+              UnitTypeId.DRONE, UnitTypeId.ZERGLING, UnitTypeId.ROACH, UnitTypeId.OVERLORD]
+
+def make_game_data() -> GameData:
+    data = sc2api_pb2.ResponseData()
+    for type_id in MINERAL_TYPES + GEYSER_TYPES + STRUCTURE_TYPES + UNIT_TYPES:
+        unit_type = data.units.add(unit_id=type_id.value, name=type_id.name.title(), available=True,
+                                   has_minerals=type_id in MINERAL_TYPES, has_vespene=type_id in GEYSER_TYPES)
+        if type_id not in UNIT_TYPES:
+            unit_type.attributes.append(Attribute.Structure.value)
+    return GameData(data)
+
+def make_protos(units: int, seed: int = 0) -> list:
+    """Raw unit protos for one step: mostly units, some structures, and resources (visible or remembered as snapshots)."""
+    rng = random.Random(seed)
+    protos = []
+    for i in range(units):
+        roll = rng.random()
+        if roll < 0.25:
+            type_id, owner = rng.choice(MINERAL_TYPES + GEYSER_TYPES), 16
+        elif roll < 0.4:
+            type_id, owner = rng.choice(STRUCTURE_TYPES), 1 + i % 2
+        else:
+            type_id, owner = rng.choice(UNIT_TYPES), 1 + i % 2
+        proto = raw_pb2.Unit(display_type=SNAPSHOT if rng.random() < 0.3 else 1, tag=4295000000 + i, unit_type=type_id.value,
+                             owner=owner, health=rng.random() * 100, shield=0.0, energy=0.0, build_progress=1.0,
+                             mineral_contents=1800 if type_id in MINERAL_TYPES else 0, vespene_contents=2250 if type_id in GEYSER_TYPES else 0)
+        proto.pos.x, proto.pos.y = rng.random() * 200, rng.random() * 200
+        protos.append(proto)
+    return protos
+
+def split_units(units: Units, predicate: Callable[[Unit], bool]) -> tuple[Units, Units]:
+    """The capture loop's previous split of a Units collection: (units matching predicate, the others)."""
+    true_list = []
+    false_list = []
+    for u in units:
+        true_list.append(u) if predicate(u) else false_list.append(u)
+    return (Units(true_list, units._bot_object), Units(false_list, units._bot_object))
+
+def capture_before(steps: list[list[Unit]], recorder: UnitRecorder) -> float:
+    """The capture loop as it was: Units filters and Unit's property chains for every unit."""
+    elapsed = 0.0
+    for iteration, all_units in enumerate(steps):
+        now = iteration / 22.4
+        start = time.perf_counter()
+        snapshots, real_units = split_units(all_units, lambda u: u.is_snapshot)
+        filtered_units = snapshots.filter(lambda u: not (u.is_snapshot and (u.is_mineral_field or u.is_vespene_geyser) and u.is_structure)) + real_units
+        for unit in filtered_units:
+            position = unit.position
+            recorder.stage((now, unit.tag, recorder.intern_type(unit.type_id.name), unit.owner_id, position.x, position.y, unit.is_snapshot,
+                            unit.health, unit.shield, unit.energy, unit.build_progress,
+                            unit.mineral_contents if unit.is_mineral_field else (unit.vespene_contents if unit.is_vespene_geyser else np.nan)))
+        recorder.flush()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+def capture_after(steps: list[list[Unit]], recorder: UnitRecorder, unit_types: exh.UnitTypeTable) -> float:
+    """The current capture loop: one filter pass and the unit type table."""
+    elapsed = 0.0
+    for iteration, all_units in enumerate(steps):
+        now = iteration / 22.4
+        start = time.perf_counter()
+        for unit in exh.filter_units(all_units, unit_types):
+            type_info = unit_types[unit]
+            resource_kind = type_info.resource_kind
+            position = unit.position
+            recorder.stage((now, unit.tag, recorder.intern_type(type_info.name), unit.owner_id, position.x, position.y, unit.is_snapshot,
+                            unit.health, unit.shield, unit.energy, unit.build_progress,
+                            unit.mineral_contents if resource_kind == exh.MINERALS else (unit.vespene_contents if resource_kind == exh.VESPENE else np.nan)))
+        recorder.flush()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+def fresh_units(bot, protos: list, steps: int) -> list[list[Unit]]:
+    """New Unit objects for every step (their cached properties are per object, like in a game)."""
+    return [Units([Unit(proto, bot, base_build=BASE_BUILD) for proto in protos], bot) for _ in range(steps)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the capture loop's unit type lookups with mocked units.")
+    parser.add_argument("--steps", type=int, default=500, help="Number of game steps.")
+    parser.add_argument("--units", type=int, default=300, help="Units (including resources) on each step.")
+    args = parser.parse_args()
+
+    game_data = make_game_data()
+    bot = SimpleNamespace(game_data=game_data, state=SimpleNamespace(game_loop=0))
+    protos = make_protos(args.units)
+
+    before_recorder, after_recorder = UnitRecorder(), UnitRecorder()
+    before_time = capture_before(fresh_units(bot, protos, args.steps), before_recorder)
+    start = time.perf_counter()
+    unit_types = exh.UnitTypeTable(game_data)
+    table_time = time.perf_counter() - start
+    after_time = capture_after(fresh_units(bot, protos, args.steps), after_recorder, unit_types)
+
+    pd.testing.assert_frame_equal(after_recorder.to_frame(), before_recorder.to_frame(), check_exact=True)
+    rows = len(after_recorder) // args.steps
+    print(f"Identical rows: {rows} of {args.units} units recorded per step, table built in {table_time * 1e3:.2f}ms")
+    print(f"{'capture':<10} {'per step (us)':>14} {'per unit (ns)':>14}")
+    for name, elapsed in [("before", before_time), ("after", after_time)]:
+        print(f"{name:<10} {elapsed / args.steps * 1e6:>14.1f} {elapsed / args.steps / args.units * 1e9:>14.0f}")
@@ -0,0 +1,123 @@
+"""
+Size and scan-time comparison of the standard and compact units.parquet storage profiles (internal/compact_units.py).
+
+Writes --replays synthetic units tables (consolidated from bench_consolidation's perspectives and stored like
+Replay-Extractor.py does) with both profiles, and checks that reading a compact file gives the standard table back:
+the same rows in the same order, with identical values except for positions, which may differ by the quantisation
+step. This is checked for whole tables, column subsets and time windows, and for a replay merged from spilled part
+files. Then reports the file sizes and the time to scan every table: all columns, a few columns, and the first
+four minutes.
+
+Usage (from the project root):
+    py -m benchmarks.bench_units_profile [--replays N] [--steps N] [--units N] [--dir PATH]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import internal.extractor_helper as exh
+from benchmarks.bench_consolidation import make_perspectives
+from internal.compact_units import COMPACT, POSITION_SCALE, STANDARD, write_compact_units
+from internal.consolidation import consolidate_units, merge_spilled_units
+from internal.replay_bundle import read_replay_table
+from internal.unit_recorder import SpilledUnits
+
+UNITS_ROW_GROUP_ROWS = 131_072 # As Replay-Extractor.py writes standard units files
+SCANS = {
+    "all columns": (None, None),
+    "timestamp, unit_tag, player_id, health": (["timestamp", "unit_tag", "player_id", "health"], None),
+    "all columns, first 4 minutes": (None, (None, 240)),
+}
+
+def assert_decoded(actual: pd.DataFrame, expected: pd.DataFrame, label: str):
+    """Compact-decoded units equal the standard ones, positions up to half a quantisation step."""
+    positions = [column for column in ("position_x", "position_y") if column in expected]
+    pd.testing.assert_frame_equal(actual.drop(columns=positions), expected.drop(columns=positions), check_exact=True, obj=label)
+    for column in positions:
+        error = np.abs(actual[column].to_numpy(dtype=np.float64) - expected[column].to_numpy(dtype=np.float64))
+        assert np.nanmax(error, initial=0) <= 0.5 / POSITION_SCALE + 1e-4, f"{label}: {column} off by {np.nanmax(error)}"
+        assert actual[column].isna().equals(expected[column].isna()), f"{label}: missing {column} values differ"
+
+def write_part(units_df: pd.DataFrame, path: Path, rows: int) -> SpilledUnits:
+    """Writes a perspective like UnitRecorder spills it: sorted by (timestamp, unit_tag), in row groups of `rows` rows."""
+    units_df = units_df.sort_values(["timestamp", "unit_tag"], kind="stable", ignore_index=True)
+    pq.write_table(pa.Table.from_pandas(units_df, preserve_index=False), path, row_group_size=rows)
+    return SpilledUnits(path, len(units_df), list(units_df["unit_type"].cat.categories))
+
+def check_spilled(root: Path, steps: int, units: int):
+    (p1_units, _), (p2_units, _) = make_perspectives(steps, units, seed=1000)
+    rows = max(1, len(p1_units) // 7)
+    parts = [write_part(p1_units, root / "units_p1.part.parquet", rows), write_part(p2_units, root / "units_p2.part.parquet", rows)]
+    paths = {}
+    for profile in (STANDARD, COMPACT):
+        paths[profile] = root / f"spilled_{profile}" / "units.parquet"
+        paths[profile].parent.mkdir(parents=True, exist_ok=True)
+        merge_spilled_units(*parts, paths[profile], batch_rows=rows, units_profile=profile)
+    assert_decoded(read_replay_table(paths[COMPACT]), read_replay_table(paths[STANDARD]), "spilled")
+
+def scan(paths: list[Path], columns, time_window) -> int:
+    return sum(len(read_replay_table(path, columns, "timestamp", time_window)) for path in paths)
+
+def timed(function, *args, repeat: int = 3):
+    """Best of `repeat` runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run(replays: int, steps: int, units: int, directory: str | None):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(directory or temp_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        paths = {STANDARD: [], COMPACT: []}
+        write_times = {STANDARD: 0.0, COMPACT: 0.0}
+        for i in range(replays):
+            (p1_units, _), (p2_units, _) = make_perspectives(steps, units, seed=i)
+            units_df = exh.optimize_unit_dtypes(consolidate_units(p1_units, p2_units))
+            for profile, write in [(STANDARD, lambda path: units_df.to_parquet(path, row_group_size=UNITS_ROW_GROUP_ROWS)),
+                                   (COMPACT, lambda path: write_compact_units(units_df, path))]:
+                path = root / profile / str(4300000 + i) / "units.parquet" # Compact files are only recognized by this name
+                path.parent.mkdir(parents=True, exist_ok=True)
+                start = time.perf_counter()
+                write(path)
+                write_times[profile] += time.perf_counter() - start
+                paths[profile].append(path)
+
+        for standard_path, compact_path in zip(paths[STANDARD], paths[COMPACT]):
+            for columns, time_window in [*SCANS.values(), (["unit_tag", "position_y", "is_neutral"], (95.5, 180))]:
+                expected = read_replay_table(standard_path, columns, "timestamp", time_window)
+                assert_decoded(read_replay_table(compact_path, columns, "timestamp", time_window), expected, f"{compact_path.parent.name} {columns} {time_window}")
+        check_spilled(root, steps // 4, units)
+        print(f"Compact files decode to the standard tables (positions within 1/{2 * POSITION_SCALE} of a map cell), also when merged from spilled parts.")
+
+        sizes = {profile: sum(path.stat().st_size for path in profile_paths) for profile, profile_paths in paths.items()}
+        results = []
+        for name, (columns, time_window) in SCANS.items():
+            standard_time, standard_rows = timed(scan, paths[STANDARD], columns, time_window)
+            compact_time, compact_rows = timed(scan, paths[COMPACT], columns, time_window)
+            assert standard_rows == compact_rows
+            results.append((f"scan {name}", standard_time, compact_time))
+        rows = scan(paths[STANDARD], ["player_id"], None)
+
+    print(f"{replays} units tables, {rows} rows ({rows // replays} per replay)")
+    print(f"{'':<48}{'standard':>12}{'compact':>12}{'change':>10}")
+    print(f"{'size':<48}{sizes[STANDARD] / 2**20:>10.2f}MB{sizes[COMPACT] / 2**20:>10.2f}MB{sizes[COMPACT] / sizes[STANDARD] - 1:>+10.0%}")
+    for name, before, after in [("write", write_times[STANDARD], write_times[COMPACT]), *results]:
+        print(f"{name:<48}{before:>11.2f}s{after:>11.2f}s{after / before - 1:>+10.0%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the standard and compact units.parquet storage profiles.")
+    parser.add_argument("--replays", type=int, default=10, help="Number of synthetic units tables.")
+    parser.add_argument("--steps", type=int, default=1000, help="Game steps per replay (units are recorded every step).")
+    parser.add_argument("--units", type=int, default=200, help="Units alive on each step.")
+    parser.add_argument("--dir", default=None, help="Directory to write the tables to (defaults to a temporary directory).")
+    args = parser.parse_args()
+    run(args.replays, args.steps, args.units, args.dir)
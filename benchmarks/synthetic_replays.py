@@ -0,0 +1,119 @@
+"""
+Writes synthetic StarCraft II replay files (MPQ archives) that mpyq can read, for benchmarks that don't need a real replay.
+
+The archives contain a replay.gamemetadata.json like a real replay's, plus filler members of a configurable size
+standing in for the event streams, so that reading the whole archive costs about as much as for a real replay.
+Only the subset of the MPQ format that mpyq reads is written (format version 0, one compressed sector per file).
+"""
+import json
+import random
+import struct
+import zlib
+from pathlib import Path
+import mpyq
+
+_HASH = mpyq.MPQArchive._hash
+_ENCRYPTION_TABLE = mpyq.MPQArchive.encryption_table
+
+MPQ_FILE_EXISTS = 0x80000000
+MPQ_FILE_SINGLE_UNIT = 0x01000000
+MPQ_FILE_COMPRESS = 0x00000200
+
+FILLER_MEMBERS = ("replay.game.events", "replay.tracker.events", "replay.message.events", "replay.details", "replay.initData", "replay.attributes.events")
+
+def _table_hash(name: str, hash_type: str) -> int:
+    return _HASH(mpyq.MPQArchive, name, hash_type)
+
+def _encrypt(data: bytes, key: int) -> bytes:
+    """Inverse of mpyq.MPQArchive._decrypt."""
+    seed1, seed2 = key, 0xEEEEEEEE
+    out = bytearray()
+    for (value,) in struct.iter_unpack("<I", data):
+        seed2 = (seed2 + _ENCRYPTION_TABLE[0x400 + (seed1 & 0xFF)]) & 0xFFFFFFFF
+        out += struct.pack("<I", (value ^ (seed1 + seed2)) & 0xFFFFFFFF)
+        seed1 = (((~seed1 << 0x15) + 0x11111111) | (seed1 >> 0x0B)) & 0xFFFFFFFF
+        seed2 = (value + seed2 + (seed2 << 5) + 3) & 0xFFFFFFFF
+    return bytes(out)
+
+def write_mpq(path, files: dict[str, bytes]):
+    """Writes an MPQ archive containing `files` (name -> contents), plus a (listfile)."""
+    files = dict(files)
+    files["(listfile)"] = "\r\n".join(files).encode()
+
+    header_size = 32
+    body = bytearray()
+    blocks = []
+    for name, data in files.items():
+        packed = b"\x02" + zlib.compress(data, 1) # Compression type 2 = zlib (fastest level, these are throwaway files)
+        flags = MPQ_FILE_EXISTS | MPQ_FILE_SINGLE_UNIT
+        if len(packed) < len(data):
+            flags |= MPQ_FILE_COMPRESS
+            stored = packed
+        else:
+            stored = data
+        blocks.append((header_size + len(body), len(stored), len(data), flags))
+        body += stored
+
+    hash_size = 1
+    while hash_size < 2 * len(files):
+        hash_size *= 2
+    empty = (0xFFFFFFFF, 0xFFFFFFFF, 0xFFFF, 0xFFFF, 0xFFFFFFFF)
+    hashes = [empty] * hash_size
+    for block_index, name in enumerate(files):
+        slot = _table_hash(name, "TABLE_OFFSET") & (hash_size - 1)
+        while hashes[slot] != empty:
+            slot = (slot + 1) & (hash_size - 1)
+        hashes[slot] = (_table_hash(name, "HASH_A"), _table_hash(name, "HASH_B"), 0, 0, block_index)
+
+    hash_data = b"".join(struct.pack("<2I2HI", *entry) for entry in hashes)
+    block_data = b"".join(struct.pack("<4I", *entry) for entry in blocks)
+    hash_offset = header_size + len(body)
+    block_offset = hash_offset + len(hash_data)
+    archive_size = block_offset + len(block_data)
+    header = struct.pack("<4s2I2H4I", b"MPQ\x1a", header_size, archive_size, 0, 3, hash_offset, block_offset, hash_size, len(blocks))
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.write(_encrypt(hash_data, _table_hash("(hash table)", "TABLE")))
+        f.write(_encrypt(block_data, _table_hash("(block table)", "TABLE")))
+
+def make_metadata(rng: random.Random) -> dict:
+    """A replay.gamemetadata.json payload shaped like AIArena replays."""
+    base_build = rng.choice([75689, 81009, 81102, 95248])
+    races = ["Prot", "Terr", "Zerg"]
+    results = rng.choice([("Win", "Loss"), ("Loss", "Win")])
+    return {
+        "Title": "Synthetic LE",
+        "IsNotAvailable": False,
+        "Players": [
+            {"PlayerID": player_id, "APM": rng.randint(50, 3000), "Result": result, "SelectedRace": rng.choice(races), "AssignedRace": rng.choice(races)}
+            for player_id, result in zip((1, 2), results)
+        ],
+        "GameVersion": f"5.0.{rng.randint(0, 14)}.{base_build}",
+        "DataBuild": str(base_build),
+        "BaseBuild": f"Base{base_build}",
+        "DataVersion": f"{rng.getrandbits(128):032X}",
+        "Duration": rng.randint(60, 2400),
+    }
+
+# Maps random bytes onto 16 values, so filler compresses about 2:1 like real event streams.
+_FILLER_ALPHABET = bytes(b"\x00\x01\x02\x03\x04\x05\x06\x07\x08\x10\x20\x40\x80\x0f\xf0\xff"[i % 16] for i in range(256))
+
+def _filler(rng: random.Random, size: int) -> bytes:
+    return rng.randbytes(size).translate(_FILLER_ALPHABET)
+
+def make_replay_dir(directory, count: int, member_kb: int = 256, seed: int = 0) -> list[Path]:
+    """Writes `count` synthetic replays named like AIArena downloads and returns their paths."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        files = {"replay.gamemetadata.json": json.dumps(make_metadata(rng)).encode("utf-8")}
+        for member in FILLER_MEMBERS:
+            files[member] = _filler(rng, member_kb * 1024)
+        path = directory / f"{4300000 + i}_BotA_BotB_SyntheticLE.SC2Replay"
+        write_mpq(path, files)
+        paths.append(path)
+    return paths
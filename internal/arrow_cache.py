@@ -0,0 +1,113 @@
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from internal.replay_bundle import TABLE_FILES, TIME_COLUMNS, ReplayBundle, read_replay_arrow
+
+DEFAULT_ARROW_CACHE_DIR = Path("ArrowCache")
+SOURCE_STAT_KEY = b"source_stat" # Size and modification time of the Parquet file a cached table was converted from
+
+def _source_stat(path: Path) -> bytes:
+    stat = path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}".encode()
+
+def _time_slice(table: pa.Table, time_column: str, time_window) -> pa.Table:
+    """The rows inside a (start, end) time window: a zero-copy slice if the time column is sorted, a filtered copy otherwise."""
+    start, end = time_window
+    times = table.column(time_column).to_numpy()
+    if len(times) > 1 and not (times[1:] >= times[:-1]).all():
+        mask = np.ones(len(times), dtype=bool)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times <= end
+        return table.filter(pa.array(mask))
+    first = np.searchsorted(times, start, side="left") if start is not None else 0
+    last = np.searchsorted(times, end, side="right") if end is not None else len(times)
+    return table.slice(first, max(0, last - first))
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts a table to a DataFrame without copying its numeric columns: integer and float columns without missing
+    values become read-only NumPy views of the table's buffers (plain float32, uint64, ... instead of the nullable
+    Float32 and UInt64 the Parquet files are read with). Bools without missing values become NumPy bools. Columns
+    with missing values and categoricals are converted like pd.read_parquet does.
+    """
+    columns, converted = {}, []
+    for name, column in zip(table.column_names, table.columns):
+        if column.null_count == 0 and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type)):
+            columns[name] = column.to_numpy() # Zero-copy for single-chunk numbers, bools are unpacked from bits
+        else:
+            converted.append(name)
+    if converted:
+        df = table.select(converted).to_pandas()
+        for name in converted:
+            columns[name] = df[name].array
+    return pd.DataFrame({name: columns[name] for name in table.column_names}, copy=False)
+
+class ArrowTableCache:
+    """
+    Uncompressed Arrow IPC copies of replays' Parquet tables, opened with a memory map.
+
+    Each table is converted the first time it is read and again whenever its Parquet file changes (its size and
+    modification time are kept in the cached file). Reading a cached table neither decompresses nor allocates: its
+    columns are views of the mapped file, and pages are only read from disk when a column is used. Tables are
+    stored in one record batch, so columns are contiguous and convert to NumPy without copying.
+    """
+
+    def __init__(self, directory=DEFAULT_ARROW_CACHE_DIR):
+        self.directory = Path(directory)
+
+    def path(self, replay_id: str, name: str) -> Path:
+        return self.directory / replay_id / f"{name}.arrow"
+
+    def _convert(self, source_path: Path, path: Path, source_stat: bytes):
+        table = read_replay_arrow(source_path).combine_chunks()
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), SOURCE_STAT_KEY: source_stat})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp") # Workers may convert the same table
+        with pa.OSFile(str(temp_path), "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+    def open(self, replay_id: str, name: str, source_path) -> pa.Table | None:
+        """The whole cached table, memory-mapped (converted from `source_path` first if needed). None if the Parquet file doesn't exist."""
+        source_path = Path(source_path)
+        if not source_path.exists():
+            return None
+        path = self.path(replay_id, name)
+        source_stat = _source_stat(source_path)
+        if path.exists():
+            table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+            if (table.schema.metadata or {}).get(SOURCE_STAT_KEY) == source_stat:
+                return table
+            del table # Unmap before replacing the stale file
+        self._convert(source_path, path, source_stat)
+        return ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+    def read_table(self, replay_id: str, name: str, source_path, columns: list[str] | None = None, time_window=None) -> pa.Table | None:
+        """Like read_replay_table, as a (zero-copy where possible) Arrow table: the given columns, and only the rows inside the time window."""
+        table = self.open(replay_id, name, source_path)
+        if table is None:
+            return None
+        if time_window is not None and any(bound is not None for bound in time_window):
+            table = _time_slice(table, TIME_COLUMNS[name], time_window)
+        return table.select(columns) if columns is not None else table
+
+    def to_frame(self, table: pa.Table) -> pd.DataFrame:
+        return table_to_frame(table)
+
+class ArrowReplayBundle(ReplayBundle):
+    """ReplayBundle whose tables are read from an ArrowTableCache instead of the replay's Parquet files."""
+
+    def __init__(self, arrow_cache: ArrowTableCache, replay_path, replay_id: str, tables: dict[str, list[str] | None], time_window=None, **values):
+        super().__init__(replay_path, replay_id, tables, time_window, **values)
+        self.arrow_cache = arrow_cache
+
+    def _read(self, name: str, columns: list[str] | None) -> pd.DataFrame | None:
+        table = self.arrow_cache.read_table(self.replay_id, name, self.replay_path / TABLE_FILES[name], columns, self.time_window)
+        return table_to_frame(table) if table is not None else None
@@ -0,0 +1,197 @@
+import asyncio
+import collections
+import multiprocessing
+import queue
+import time
+import portpicker
+from loguru import logger
+
+from sc2.sc2process import SC2Process
+
+def allocate_ports(count: int) -> list[int]:
+    """Picks `count` distinct free ports for game clients."""
+    ports = []
+    while len(ports) < count:
+        port = portpicker.pick_unused_port()
+        if port not in ports:
+            ports.append(port)
+    return ports
+
+def release_ports(ports):
+    for port in ports:
+        portpicker.return_port(port)
+
+def tile_placements(count: int, columns: int = 2, width: int = 960, height: int = 540) -> list[tuple[int, int]]:
+    """Returns window placements for `count` clients, filling rows of `columns` windows left to right."""
+    return [((i % columns) * width, (i // columns) * height) for i in range(count)]
+
+class PersistentClient:
+    """
+    Keeps a single game client alive across replays.
+    The client is only relaunched when the requested game version changes or after close() (e.g. following a crash).
+    """
+
+    def __init__(self, port: int, placement=None, process_factory=SC2Process):
+        self.port = port
+        self.placement = placement
+        self.process_factory = process_factory
+        self.version = None
+        self.controller = None
+        self.launches = 0
+        self._process = None
+
+    async def ensure(self, base_build, data_version):
+        """Returns a controller for a running client of the given version, launching one if needed."""
+        if self.controller is not None and self.version == (base_build, data_version):
+            return self.controller
+
+        await self.close()
+        logger.info(f"Launching game client on port {self.port} (base build {base_build}).")
+        self._process = self.process_factory(port=self.port, base_build=base_build, data_hash=data_version, placement=self.placement)
+        self.controller = await self._process.__aenter__()
+        await self.controller.ping()
+        self.version = (base_build, data_version)
+        self.launches += 1
+        return self.controller
+
+    async def close(self):
+        process = self._process
+        self._process = None
+        self.controller = None
+        self.version = None
+        if process is not None:
+            try:
+                await process.__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error while closing game client on port {self.port}: {e}")
+
+async def _worker_loop(index, port, placement, jobs, results, run_job, process_factory):
+    client = PersistentClient(port, placement, process_factory)
+    try:
+        while (job := jobs.get()) is not None:
+            job_id, base_build, data_version, job_args = job
+            results.put(("started", index, job_id, time.time()))
+            result = None
+            launches_before = client.launches
+            # A reused client gets one retry on a fresh launch, in case it was left in a bad state by the previous replay.
+            for _ in range(2):
+                launches = client.launches
+                try:
+                    controller = await client.ensure(base_build, data_version)
+                    result = await run_job(controller, *job_args)
+                    break
+                except Exception as e:
+                    logger.error(f"Job {job_id} failed on port {port}: {e}")
+                    await client.close()
+                    if client.launches != launches:
+                        break # The client was freshly launched for this attempt, so don't retry.
+            if client.launches != launches_before:
+                results.put(("launched", index, job_id, client.launches - launches_before))
+            results.put(("done", index, job_id, result))
+    finally:
+        await client.close()
+
+def client_worker(index, port, placement, jobs, results, run_job, process_factory=SC2Process, setup=None):
+    """Entry point of a pool worker process. Runs jobs from its queue until it receives None."""
+    if setup is not None:
+        setup()
+    asyncio.run(_worker_loop(index, port, placement, jobs, results, run_job, process_factory))
+
+class ClientWorkerPool:
+    """
+    A pool of long-lived worker processes that each own a PersistentClient.
+
+    Jobs are (job_id, base_build, data_version, job_args) and are run as `await run_job(controller, *job_args)` inside
+    a worker. A job whose worker crashes, or whose run_job raises, returns None as its result.
+
+    Submitted jobs wait in the pool and are handed, in submission order, to one idle worker at a time through that
+    worker's own queue. The pool therefore always knows which job each worker holds, even if the worker dies before
+    reporting that it started it. Jobs not handed to a worker by the time the pool closes are dropped.
+    """
+
+    def __init__(self, run_job, ports, placements=None, process_factory=SC2Process, setup=None):
+        self.run_job = run_job
+        self.ports = list(ports)
+        self.placements = list(placements) if placements is not None else [None] * len(self.ports)
+        self.process_factory = process_factory
+        self.setup = setup
+        self.results = multiprocessing.Queue()
+        self.workers = [None] * len(self.ports)
+        self._job_queues = [None] * len(self.ports)
+        self._queued = collections.deque() # Submitted jobs no worker holds yet
+        self._running = {} # worker index -> id of the job handed to it
+        self._finished = [] # (job_id, None) results of jobs whose worker died
+        self.started_at = {} # job id -> wall clock time a worker picked it up
+        self.client_launches = 0
+
+    def __enter__(self):
+        for index in range(len(self.workers)):
+            self._start_worker(index)
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _start_worker(self, index):
+        self._job_queues[index] = multiprocessing.Queue() # A fresh queue, so a job handed to a dead worker is never run twice
+        worker = multiprocessing.Process(
+            target=client_worker,
+            args=(index, self.ports[index], self.placements[index], self._job_queues[index], self.results, self.run_job, self.process_factory, self.setup),
+            daemon=True,
+        )
+        worker.start()
+        self.workers[index] = worker
+
+    def submit(self, job_id, base_build, data_version, job_args: tuple):
+        self._queued.append((job_id, base_build, data_version, job_args))
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hands the next queued jobs to the idle workers."""
+        for index in range(len(self.workers)):
+            if not self._queued:
+                return
+            if index not in self._running:
+                job = self._queued.popleft()
+                self._running[index] = job[0]
+                self._job_queues[index].put(job)
+
+    def _check_workers(self):
+        for index, worker in enumerate(self.workers):
+            if worker is not None and not worker.is_alive():
+                logger.critical(f"Worker {index} (port {self.ports[index]}) exited unexpectedly. Restarting it.")
+                if index in self._running:
+                    self._finished.append((self._running.pop(index), None))
+                self._start_worker(index)
+        self._dispatch()
+
+    def get_result(self, poll_interval: float = 1.0):
+        """Blocks until a job finishes and returns (job_id, result)."""
+        while True:
+            if self._finished:
+                return self._finished.pop(0)
+            try:
+                status, index, job_id, result = self.results.get(timeout=poll_interval)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if self._running.get(index) != job_id:
+                continue # Sent by a worker that was since found dead, and its job already returned None
+            if status == "started":
+                self.started_at[job_id] = result
+            elif status == "launched":
+                self.client_launches += result
+            else:
+                del self._running[index]
+                self._dispatch()
+                return job_id, result
+
+    def close(self):
+        for jobs in self._job_queues:
+            if jobs is not None:
+                jobs.put(None)
+        for worker in self.workers:
+            if worker is not None:
+                worker.join(timeout=30)
+                if worker.is_alive():
+                    worker.terminate()
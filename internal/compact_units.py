@@ -0,0 +1,199 @@
+import base64
+import json
+import math
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STANDARD = "standard"
+COMPACT = "compact"
+UNITS_PROFILES = (STANDARD, COMPACT)
+
+GAME_LOOPS_PER_SECOND = 22.4 # Timestamps are game_loop / 22.4 (BotAI.time)
+POSITION_SCALE = 256 # Quantisation steps per map cell, positions up to 255.996 fit in a uint16
+COMPACT_ROW_GROUP_ROWS = 131_072
+COMPACT_ZSTD_LEVEL = 6
+
+# Keys of the compact profile in the Parquet file's metadata
+PROFILE_KEY = b"sc2_units_profile"
+TAGS_KEY = b"sc2_unit_tags" # Every unit tag of the replay, sorted (base64 of little-endian uint64s), unit_id indexes it
+PANDAS_KEY = b"sc2_pandas" # pandas metadata of the decoded table
+
+# Standard column -> the column it is stored as
+ENCODED_COLUMNS = {"timestamp": "game_loop", "unit_tag": "unit_id", "position_x": "position_x_q", "position_y": "position_y_q"}
+POSITION_COLUMNS = ("position_x", "position_y")
+
+def _game_loops(df: pd.DataFrame) -> np.ndarray:
+    return np.rint(df["timestamp"].to_numpy(dtype=np.float64) * GAME_LOOPS_PER_SECOND).astype(np.uint32)
+
+def encode_units(df: pd.DataFrame, tags: np.ndarray) -> pa.Table:
+    """
+    Encodes a units DataFrame (as optimize_unit_dtypes returns it) with the compact profile: unit_tag becomes the
+    int32 index of the tag in `tags` (the replay's sorted unit tags), timestamp the integer game loop and positions
+    uint16 multiples of 1/POSITION_SCALE. Rows are sorted by unit, then game loop. Other columns are kept as they are.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    unit_tags = df["unit_tag"].to_numpy(dtype=np.uint64)
+    unit_ids = np.searchsorted(tags, unit_tags)
+    if len(unit_tags) and (unit_ids.max() >= len(tags) or not np.array_equal(tags[unit_ids], unit_tags)):
+        raise ValueError("The units table has unit tags that aren't in the replay's tag list.")
+    game_loops = _game_loops(df)
+
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name == "timestamp":
+            column = pa.array(game_loops)
+        elif name == "unit_tag":
+            column = pa.array(unit_ids.astype(np.int32))
+        elif name in POSITION_COLUMNS:
+            values = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(values)
+            quantised = np.clip(np.rint(np.where(missing, 0, values) * POSITION_SCALE), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+            column = pa.array(quantised, mask=missing if missing.any() else None)
+        columns.append(column)
+    encoded = pa.Table.from_arrays(columns, names=[ENCODED_COLUMNS.get(name, name) for name in table.column_names])
+    profile = {"profile": COMPACT, "version": 1, "game_loops_per_second": GAME_LOOPS_PER_SECOND, "position_scale": POSITION_SCALE,
+               "columns": table.column_names}
+    encoded = encoded.replace_schema_metadata({
+        PROFILE_KEY: json.dumps(profile).encode(),
+        TAGS_KEY: base64.b64encode(tags.astype("<u8").tobytes()),
+        PANDAS_KEY: table.schema.metadata[b"pandas"],
+    })
+    return encoded.take(np.lexsort((game_loops, unit_ids)))
+
+def _time_chunks(game_loops: np.ndarray, rows: int) -> list[tuple[int, int]]:
+    """Splits rows sorted by game loop into (start, stop) chunks of about `rows` rows that don't share a game loop."""
+    chunks, start = [], 0
+    while start < len(game_loops):
+        stop = min(start + rows, len(game_loops))
+        if stop < len(game_loops):
+            boundary = np.searchsorted(game_loops, game_loops[stop], side="left")
+            stop = boundary if boundary > start else np.searchsorted(game_loops, game_loops[stop], side="right")
+        chunks.append((start, int(stop)))
+        start = int(stop)
+    return chunks
+
+class CompactUnitsWriter:
+    """
+    Writes units.parquet with the compact profile (see encode_units): zstd compressed, delta encoded game loops and
+    unit IDs, dictionary encoding for the other columns and min/max statistics on every column.
+
+    Row groups hold disjoint ranges of game loops and are sorted by unit, then game loop, within. Sorting by unit
+    keeps each unit's values next to each other for the encodings, and the game loop ranges let readers skip the row
+    groups outside a time window, like the standard profile's timestamp statistics.
+    """
+
+    def __init__(self, path, tags: np.ndarray, row_group_rows: int = COMPACT_ROW_GROUP_ROWS):
+        self.path = path
+        self.tags = np.asarray(tags, dtype=np.uint64)
+        self.row_group_rows = row_group_rows
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, df: pd.DataFrame):
+        """Writes units rows later than every row written before (consolidated units are in timestamp order)."""
+        game_loops = _game_loops(df)
+        if len(game_loops) > 1 and not (game_loops[1:] >= game_loops[:-1]).all():
+            order = np.lexsort((df["unit_tag"].to_numpy(dtype=np.uint64), game_loops))
+            df, game_loops = df.take(order), game_loops[order]
+        for start, stop in _time_chunks(game_loops, self.row_group_rows):
+            table = encode_units(df.iloc[start:stop], self.tags)
+            if self._writer is None:
+                encodings = {ENCODED_COLUMNS["timestamp"]: "DELTA_BINARY_PACKED", ENCODED_COLUMNS["unit_tag"]: "DELTA_BINARY_PACKED"}
+                self._writer = pq.ParquetWriter(
+                    self.path, table.schema, compression="zstd", compression_level=COMPACT_ZSTD_LEVEL,
+                    use_dictionary=[name for name in table.column_names if name not in encodings], column_encoding=encodings,
+                    write_statistics=True,
+                )
+            self._writer.write_table(table, row_group_size=stop - start) # One row group per chunk
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+def write_compact_units(df: pd.DataFrame, path, row_group_rows: int = COMPACT_ROW_GROUP_ROWS):
+    """Writes a whole units table with the compact profile."""
+    with CompactUnitsWriter(path, np.unique(df["unit_tag"].to_numpy(dtype=np.uint64)), row_group_rows) as writer:
+        writer.write(df)
+
+def is_compact_units(path) -> bool:
+    return PROFILE_KEY in (pq.read_schema(path).metadata or {})
+
+def _loop_order(game_loops: np.ndarray, row_group_rows: list[int]) -> np.ndarray:
+    """
+    Stable order of the rows by game loop. Row groups don't share game loops, so each is sorted on its own, as 16-bit
+    offsets from its first game loop when they fit (NumPy radix sorts those).
+    """
+    parts, offset = [], 0
+    for rows in row_group_rows:
+        loops = game_loops[offset:offset + rows]
+        if rows and int(loops.max()) - int(loops.min()) < 2**16:
+            loops = (loops - loops.min()).astype(np.uint16)
+        parts.append(np.argsort(loops, kind="stable") + offset)
+        offset += rows
+    order = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+    sorted_loops = game_loops[order]
+    if len(order) > 1 and not (sorted_loops[1:] >= sorted_loops[:-1]).all():
+        order = np.argsort(game_loops, kind="stable") # Row groups written out of time order
+    return order
+
+def read_compact_units(path, columns: list[str] | None = None, time_window=None) -> pa.Table:
+    """
+    Reads a compact units file as the standard units table: the given standard columns (all of them if None), with
+    the timestamps, unit tags and (quantised) positions decoded, in the standard row order (timestamp, then unit_tag).
+    With a (start, end) time window, only the rows inside it; row groups whose game loops lie outside the window are
+    skipped without being read.
+    """
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.schema_arrow.metadata
+    profile = json.loads(metadata[PROFILE_KEY])
+    loops_per_second = profile["game_loops_per_second"]
+    names = profile["columns"] if columns is None else list(columns)
+    stored = [ENCODED_COLUMNS.get(name, name) for name in names]
+
+    start, end = time_window if time_window is not None else (None, None)
+    row_groups = list(range(parquet_file.num_row_groups))
+    if start is not None or end is not None:
+        loop_column = parquet_file.schema_arrow.get_field_index("game_loop")
+        first = math.floor(start * loops_per_second) - 1 if start is not None else -math.inf # Loose bounds, the exact window is applied below
+        last = math.ceil(end * loops_per_second) + 1 if end is not None else math.inf
+        kept = []
+        for i in row_groups:
+            statistics = parquet_file.metadata.row_group(i).column(loop_column).statistics
+            if statistics is None or not statistics.has_min_max or (statistics.max >= first and statistics.min <= last):
+                kept.append(i)
+        row_groups = kept
+    table = parquet_file.read_row_groups(row_groups, columns=list(dict.fromkeys(["game_loop", *stored])))
+
+    game_loops = table.column("game_loop").to_numpy()
+    order = _loop_order(game_loops, [parquet_file.metadata.row_group(i).num_rows for i in row_groups])
+    timestamps = (game_loops[order] / loops_per_second).astype(np.float32)
+    if start is not None or end is not None:
+        inside = np.ones(len(order), dtype=bool)
+        if start is not None:
+            inside &= timestamps.astype(np.float64) >= start
+        if end is not None:
+            inside &= timestamps.astype(np.float64) <= end
+        order, timestamps = order[inside], timestamps[inside]
+    table = table.take(order)
+
+    arrays = []
+    for name, stored_name in zip(names, stored):
+        column = table.column(stored_name)
+        if name == "timestamp":
+            column = pa.array(timestamps)
+        elif name == "unit_tag":
+            tags = np.frombuffer(base64.b64decode(metadata[TAGS_KEY]), dtype="<u8")
+            column = pa.array(tags[column.to_numpy()].astype(np.uint64))
+        elif name in POSITION_COLUMNS:
+            values = column.to_numpy(zero_copy_only=False).astype(np.float32) / np.float32(profile["position_scale"])
+            column = pa.array(values, mask=column.is_null().to_numpy(zero_copy_only=False) if column.null_count else None)
+        arrays.append(column)
+    return pa.Table.from_arrays(arrays, names=names).replace_schema_metadata({b"pandas": metadata[PANDAS_KEY]})
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+import internal.extractor_helper as exh
+from internal.compact_units import COMPACT, STANDARD, CompactUnitsWriter
+
+VISIBILITY_COLUMNS = ["is_visible_to_player_1", "is_visible_to_player_2"]
+
+def _concat_column(frames, name: str) -> tuple[pd.Series, bool]:
+    """
+    Concatenates one column of the non-empty frames (player 1 rows first). Like pd.concat, categoricals with the same
+    categories keep them. Otherwise they are unioned with sorted categories, and the returned flag says the unused
+    ones should be dropped after the merge (matching a concat to object followed by astype('category')).
+    """
+    parts = [df[name] if name in df.columns else pd.Series(np.nan, index=df.index) for df in frames if len(df)]
+    if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+        same_categories = all(part.dtype == parts[0].dtype for part in parts)
+        return pd.Series(union_categoricals(parts, sort_categories=not same_categories)), not same_categories
+    return pd.concat(parts, ignore_index=True), False
+
+def _take(series: pd.Series, indices: np.ndarray):
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    return values.take(indices)
+
+def _key_order(timestamps: np.ndarray, unit_tags: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the stable (timestamp, unit_tag) sort order of the rows and a mask of where a new key starts in that order.
+    When the tags fit in 32 bits (after subtracting the smallest), both keys are packed into a single int64 so only
+    one sort is needed.
+    """
+    rows = len(timestamps)
+    key_change = np.empty(rows, dtype=bool)
+    key_change[0] = True
+    tag_offsets = unit_tags - unit_tags.min()
+    if tag_offsets.max() < 2**32:
+        # Perspectives are already ordered by time, so deduplicating runs first makes the unique() call cheap.
+        run_starts = np.flatnonzero(np.r_[True, timestamps[1:] != timestamps[:-1]])
+        timestamp_ranks = np.searchsorted(np.unique(timestamps[run_starts]), timestamps).astype(np.int64)
+        keys = (timestamp_ranks << 32) | tag_offsets.astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=key_change[1:])
+    else:
+        order = np.lexsort((unit_tags, timestamps))
+        sorted_timestamps = timestamps[order]
+        sorted_tags = unit_tags[order]
+        np.logical_or(sorted_timestamps[1:] != sorted_timestamps[:-1], sorted_tags[1:] != sorted_tags[:-1], out=key_change[1:])
+    return order, key_change
+
+def merge_perspectives(p1_df: pd.DataFrame, p2_df: pd.DataFrame, owner_is_visible: bool = False) -> pd.DataFrame:
+    """
+    Sort-merge of both perspectives on (timestamp, unit_tag), returning one row per key in key order.
+
+    Each column takes its first non-null value (player 1's row before player 2's), and the visibility flags are ORed
+    across the matched rows. With `owner_is_visible`, a row is also visible to the player that owns the unit.
+    """
+    frames = (p1_df, p2_df)
+    sizes = [len(df) for df in frames]
+    if not any(sizes):
+        return pd.DataFrame()
+    columns = list(dict.fromkeys(col for df in frames if len(df) for col in df.columns if col not in VISIBILITY_COLUMNS))
+
+    timestamps = _concat_column(frames, "timestamp")[0].to_numpy()
+    unit_tags = _concat_column(frames, "unit_tag")[0].to_numpy()
+    rows = len(timestamps)
+
+    # Stable sort, so rows with the same key stay in (player 1, player 2) order.
+    order, key_change = _key_order(timestamps, unit_tags)
+    starts = np.flatnonzero(key_change)
+    first_rows = order[starts]
+
+    merged = {}
+    for col in columns:
+        values, prune_categories = _concat_column(frames, col)
+        missing = values.isna().to_numpy()
+        if not missing.any():
+            merged[col] = _take(values, first_rows)
+        else:
+            # First non-null position within each key group (falling back to the group's first row if all are null).
+            positions = np.where(missing[order], rows, np.arange(rows))
+            first_valid = np.minimum.reduceat(positions, starts)
+            first_valid = np.where(first_valid == rows, starts, first_valid)
+            merged[col] = _take(values, order[first_valid])
+        if prune_categories:
+            merged[col] = merged[col].remove_unused_categories()
+
+    owners = _concat_column(frames, "player_id")[0].to_numpy() if owner_is_visible else None
+    for player, col in enumerate(VISIBILITY_COLUMNS, start=1):
+        visible = np.zeros(rows, dtype=bool)
+        visible[sum(sizes[:player - 1]):sum(sizes[:player])] = True
+        if owners is not None:
+            visible |= owners == player
+        merged[col] = np.logical_or.reduceat(visible[order], starts)
+
+    return pd.DataFrame(merged, copy=False)
+
+def consolidate_units(p1_units_df: pd.DataFrame, p2_units_df: pd.DataFrame) -> pd.DataFrame:
+    """Merges both perspectives' unit snapshots into one row per (timestamp, unit_tag), with per-player visibility flags."""
+    # Units are always visible to their owner, even if they left vision between the logging intervals.
+    # NB: This does not apply to neutral units in the same way.
+    final_units_df = merge_perspectives(p1_units_df, p2_units_df, owner_is_visible=True)
+    final_units_df["is_ground_truth_for_player_1"] = final_units_df["player_id"] == 1
+    final_units_df["is_ground_truth_for_player_2"] = final_units_df["player_id"] == 2
+    final_units_df["is_neutral"] = ~final_units_df["player_id"].isin([1, 2])
+
+    return final_units_df
+
+def consolidate_deaths(p1_deaths_df: pd.DataFrame, p2_deaths_df: pd.DataFrame) -> pd.DataFrame:
+    """Merges both perspectives' death records into one row per (timestamp, unit_tag). Either side may be empty."""
+    return merge_perspectives(p1_deaths_df, p2_deaths_df)
+
+def _read_chunks(path, batch_rows: int):
+    """Yields DataFrames of about `batch_rows` rows from a sorted unit part file."""
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas()
+
+def _spilled_unit_tags(paths, batch_rows: int) -> np.ndarray:
+    """The sorted unique unit tags of spilled unit part files, read one tag column chunk at a time."""
+    tags = np.empty(0, dtype=np.uint64)
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=["unit_tag"]):
+            tags = np.union1d(tags, batch.column(0).to_numpy())
+    return tags
+
+def merge_spilled_units(p1_part, p2_part, output_path, batch_rows: int, units_profile: str = STANDARD) -> int:
+    """
+    Consolidates two spilled unit part files (each sorted by timestamp and unit_tag) into a units file, chunk by chunk.
+    Only about `batch_rows` rows per perspective are held in memory at once. Returns the number of rows written.
+    With the compact units profile, the replay's unit tags are collected in a first pass over the tag columns, and
+    each chunk is sorted by unit on its own.
+    """
+    unit_types = sorted(set(p1_part.type_names) | set(p2_part.type_names))
+    unit_tags = _spilled_unit_tags([p1_part.path, p2_part.path], batch_rows) if units_profile == COMPACT else None
+    readers = [_read_chunks(p1_part.path, batch_rows), _read_chunks(p2_part.path, batch_rows)]
+    buffers = [pd.DataFrame(), pd.DataFrame()]
+    exhausted = [False, False]
+    writer = None
+    rows_written = 0
+
+    def top_up(i, force=False):
+        while not exhausted[i] and (force or len(buffers[i]) < batch_rows):
+            chunk = next(readers[i], None)
+            if chunk is None:
+                exhausted[i] = True
+            else:
+                buffers[i] = pd.concat([buffers[i], chunk], ignore_index=True) if len(buffers[i]) else chunk
+            force = False
+
+    try:
+        while True:
+            for i in range(2):
+                top_up(i)
+
+            # Rows before the smallest last timestamp of a still-open reader can't get a duplicate (timestamp, unit_tag) later.
+            open_tails = [buffers[i]["timestamp"].iloc[-1] for i in range(2) if not exhausted[i]]
+            cutoff = min(open_tails) if open_tails else np.inf
+            take = [buffer["timestamp"] < cutoff if len(buffer) else None for buffer in buffers]
+            if not any(mask is not None and mask.any() for mask in take):
+                if not open_tails:
+                    break # Both readers exhausted and both buffers empty.
+                # Every row still buffered by the limiting reader is at the cutoff timestamp, so read past it.
+                for i in range(2):
+                    if not exhausted[i] and buffers[i]["timestamp"].iloc[-1] == cutoff:
+                        top_up(i, force=True)
+                continue
+
+            parts = [None, None]
+            for i in range(2):
+                if take[i] is not None:
+                    parts[i] = buffers[i][take[i]].copy()
+                    buffers[i] = buffers[i][~take[i]].reset_index(drop=True)
+            for i in range(2):
+                if parts[i] is None: # This perspective has no rows left, give it an empty frame with the right columns.
+                    parts[i] = parts[1 - i].iloc[:0].copy()
+
+            chunk_df = consolidate_units(parts[0], parts[1])
+            chunk_df = exh.optimize_unit_dtypes(chunk_df)
+            chunk_df["unit_type"] = chunk_df["unit_type"].cat.set_categories(unit_types) # Same (sorted) categories in every row group
+            if units_profile == COMPACT:
+                if writer is None:
+                    writer = CompactUnitsWriter(output_path, unit_tags)
+                writer.write(chunk_df)
+            else:
+                table = pa.Table.from_pandas(chunk_df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+            rows_written += len(chunk_df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return rows_written
@@ -0,0 +1,283 @@
+import json
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from loguru import logger
+
+from internal.feature_store import replay_input_hash
+from internal.replay_bundle import TABLE_FILES, TIME_COLUMNS, ReplayBundle, _time_filters, read_replay_arrow
+
+# A corpus dataset is a directory holding replays.parquet (one row per replay: its flattened metadata, the full
+# _info.json as JSON, which tables it has and the hash of its input files) and one hive-partitioned Parquet dataset per
+# table (<table>/<partition_by>=<value>/part-0.parquet). Table rows carry the replay's row of replays.parquet as an int32
+# replay_index: Parquet statistics of integers (unlike strings) let readers skip the row groups of other replays.
+REPLAYS_FILE = "replays.parquet"
+REPLAY_INDEX = "replay_index"
+PARTITION_KEYS = ("matchup", "map", "build")
+DEFAULT_DATASET_DIR = Path("OutputCorpus")
+DEFAULT_ROW_GROUP_ROWS = 131_072
+UNKNOWN_PARTITION = "unknown"
+
+def replay_partitions(metadata: dict) -> dict[str, str]:
+    """The values a replay can be partitioned by: race matchup (e.g. "PvZ"), map title and base build."""
+    races = sorted((player.get("AssignedRace") or player.get("SelectedRace") or "?")[0].upper() for player in metadata.get("Players", []))
+    return {
+        "matchup": "v".join(races) if races else UNKNOWN_PARTITION,
+        "map": str(metadata.get("Title") or UNKNOWN_PARTITION),
+        "build": str(metadata.get("BaseBuild") or UNKNOWN_PARTITION),
+    }
+
+def replay_metadata_row(replay_id: str, metadata: dict) -> dict:
+    """Flattens a replay's metadata like Replay-Metadata.py's table (player fields become p{PlayerID}_{field} columns)."""
+    row = {"replay_id": replay_id, **replay_partitions(metadata)}
+    for key, value in metadata.items():
+        if key == "Players":
+            for player in value:
+                for field, field_value in player.items():
+                    if field != "PlayerID":
+                        row[f"p{player.get('PlayerID')}_{field}"] = field_value
+        elif key not in row:
+            row[key] = json.dumps(value) if isinstance(value, (dict, list)) else value
+    row["info"] = json.dumps(metadata)
+    return row
+
+def _dataset_schema(schema: pa.Schema) -> pa.Schema:
+    """
+    A replay table's schema as stored in the dataset: int32 dictionary indices (replays' files use the narrowest width
+    for their own dictionary) and the replay_index column. The pandas metadata is kept, so columns are read back with
+    the same pandas dtypes as from the replay's own file, but without the replay's index.
+    """
+    fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type)) if pa.types.is_dictionary(field.type) else field
+              for field in schema if field.name != "replay_id" and not field.name.startswith("__index_level_")]
+    metadata = None
+    if schema.pandas_metadata is not None:
+        names = {field.name for field in fields}
+        pandas_metadata = dict(schema.pandas_metadata)
+        pandas_metadata["index_columns"] = []
+        pandas_metadata["columns"] = [column for column in pandas_metadata["columns"] if column["field_name"] in names]
+        metadata = {b"pandas": json.dumps(pandas_metadata).encode()}
+    return pa.schema([*fields, pa.field(REPLAY_INDEX, pa.int32())], metadata=metadata)
+
+def _conform(table: pa.Table, schema: pa.Schema, replay_index: int) -> pa.Table:
+    """Adds the replay_index column and casts a replay's table to the dataset's schema (missing columns become nulls)."""
+    table = table.drop_columns([name for name in table.column_names if name == "replay_id" or name.startswith("__index_level_")])
+    extra = set(table.column_names) - set(schema.names)
+    if extra:
+        raise ValueError(f"Table has columns the dataset doesn't: {sorted(extra)}")
+    table = table.append_column(REPLAY_INDEX, pa.array(np.full(len(table), replay_index, dtype=np.int32)))
+    for field in schema:
+        if field.name not in table.column_names:
+            table = table.append_column(field.name, pa.nulls(len(table), field.type))
+    return table.select(schema.names).cast(schema)
+
+class _PartitionWriter:
+    """Writes one table's replays of one partition to a Parquet file, buffered into row groups of `row_group_rows` rows."""
+
+    def __init__(self, path: Path, schema: pa.Schema, row_group_rows: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = pq.ParquetWriter(path, schema)
+        self.row_group_rows = row_group_rows
+        self.buffer = []
+        self.buffered_rows = 0
+
+    def write(self, table: pa.Table):
+        self.buffer.append(table)
+        self.buffered_rows += len(table)
+        if self.buffered_rows >= self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            # One dictionary per row group, rather than one per replay
+            self.writer.write_table(pa.concat_tables(self.buffer).unify_dictionaries().combine_chunks(), row_group_size=max(self.buffered_rows, 1))
+            self.buffer, self.buffered_rows = [], 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def _read_replay_info(replay_path: Path) -> dict | None:
+    info_paths = list(replay_path.glob("*_info.json"))
+    if not info_paths:
+        return None
+    with open(info_paths[0], "r") as f:
+        return json.load(f)
+
+def compact_corpus(raw_output_dir: Path, dataset_dir: Path, partition_by: str | None = "matchup", row_group_rows: int = DEFAULT_ROW_GROUP_ROWS) -> int:
+    """
+    Merges the per-replay outputs in `raw_output_dir` into a corpus dataset at `dataset_dir`, partitioned by one of
+    PARTITION_KEYS (or not at all). The dataset is written next to `dataset_dir` and replaces it once complete.
+    Replays without an _info.json, or whose tables can't be read, are left out. Returns the number of replays written.
+    """
+    if partition_by is not None and partition_by not in PARTITION_KEYS:
+        raise ValueError(f"Unknown partition key '{partition_by}', expected one of {', '.join(PARTITION_KEYS)}.")
+
+    rows = []
+    for replay_path in sorted(entry for entry in Path(raw_output_dir).iterdir() if entry.is_dir() and not entry.name.startswith(".")): # Not the extractor's staging directory
+        metadata = _read_replay_info(replay_path)
+        if metadata is None:
+            logger.warning(f"No _info.json file found for replay {replay_path.name}. Skipping.")
+            continue
+        rows.append(replay_metadata_row(replay_path.name, metadata))
+    # Replays of the same partition are written together, so replay_index is ascending within every file
+    rows.sort(key=lambda row: (row[partition_by] if partition_by else "", row["replay_id"]))
+
+    temp_dir = dataset_dir.with_name(dataset_dir.name + ".tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    schemas, writers, written = {}, {}, []
+    try:
+        for row in rows:
+            replay_id = row["replay_id"]
+            replay_path = Path(raw_output_dir) / replay_id
+            replay_index = len(written)
+            try:
+                # Every table is read before any is written, so a broken replay is left out entirely
+                tables = {}
+                for name, file_name in TABLE_FILES.items():
+                    path = replay_path / file_name
+                    if path.exists():
+                        table = read_replay_arrow(path)
+                        schema = schemas.setdefault(name, _dataset_schema(table.schema))
+                        tables[name] = _conform(table, schema, replay_index)
+                input_hash = replay_input_hash(replay_path)
+            except Exception as e:
+                logger.error(f"Failed to read replay {replay_id}, leaving it out of the dataset: {e}")
+                continue
+
+            partition = f"{partition_by}={quote(row[partition_by], safe='')}" if partition_by else "."
+            for name, table in tables.items():
+                key = (name, partition)
+                if key not in writers:
+                    writers[key] = _PartitionWriter(temp_dir / name / partition / "part-0.parquet", schemas[name], row_group_rows)
+                writers[key].write(table)
+            written.append({REPLAY_INDEX: replay_index, **row, "input_hash": input_hash,
+                            **{f"has_{name}": name in tables for name in TABLE_FILES}})
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if not written:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return 0
+
+    replays = pa.Table.from_pandas(pd.DataFrame(written), preserve_index=False)
+    replays = replays.replace_schema_metadata({"partition_by": partition_by or ""})
+    pq.write_table(replays, temp_dir / REPLAYS_FILE)
+
+    # Swap the complete dataset in, so an interrupted run never leaves a broken one behind
+    old_dir = dataset_dir.with_name(dataset_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if dataset_dir.exists():
+        dataset_dir.rename(old_dir)
+    temp_dir.rename(dataset_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(written)
+
+class CorpusDataset:
+    """
+    Reader for a corpus dataset written by compact_corpus (Corpus-Compactor.py).
+
+    The metadata table is read once, with `filters` (pyarrow filters on its columns, e.g. [("Duration", ">=", 300)])
+    pushed down to Parquet, so selecting replays doesn't read a file per replay. Table reads only open the partitions
+    and row groups holding the requested replays.
+    """
+
+    def __init__(self, path, filters: list | None = None):
+        self.path = Path(path)
+        self.filters = filters
+        table = pq.read_table(self.path / REPLAYS_FILE, filters=filters)
+        self.partition_by = (table.schema.metadata or {}).get(b"partition_by", b"").decode() or None
+        self.replays = table.to_pandas().set_index("replay_id", drop=False)
+        self._datasets = {}
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self.filters)) # Worker processes reopen the dataset
+
+    def replay_ids(self) -> list[str]:
+        return self.replays["replay_id"].tolist()
+
+    def metadata(self, replay_id: str) -> dict:
+        """The replay's metadata, as in its _info.json."""
+        return json.loads(self.replays.at[replay_id, "info"])
+
+    def has_table(self, replay_id: str, name: str) -> bool:
+        return bool(self.replays.at[replay_id, f"has_{name}"])
+
+    def input_hash(self, replay_id: str) -> str:
+        """Hash of the replay's files it was compacted from (the same hash the feature cache computes for them)."""
+        return self.replays.at[replay_id, "input_hash"]
+
+    def _dataset(self, name: str) -> ds.Dataset | None:
+        if name not in self._datasets:
+            table_dir = self.path / name
+            partitioning = ds.partitioning(pa.schema([(self.partition_by, pa.string())]), flavor="hive") if self.partition_by else None
+            dataset = None
+            if table_dir.exists():
+                dataset = ds.dataset(table_dir, format="parquet", partitioning=partitioning)
+                fragments = list(dataset.get_fragments())
+                for fragment in fragments:
+                    fragment.ensure_complete_metadata() # Parse each file's footer once, not on every read
+                dataset = ds.FileSystemDataset(fragments, dataset.schema, dataset.format, dataset.filesystem)
+            self._datasets[name] = dataset
+        return self._datasets[name]
+
+    def read_table(self, name: str, replay_ids: list[str], columns: list[str] | None = None, time_window=None) -> pd.DataFrame | None:
+        """
+        Reads the given columns of a table (every column if None) for the replays, as one DataFrame with a
+        categorical replay_id column (categories in the order of `replay_ids`) and rows grouped by replay in that
+        order. None if none of the replays have the table.
+        """
+        dataset = self._dataset(name)
+        replays = self.replays.loc[replay_ids]
+        replays = replays[replays[f"has_{name}"]]
+        if dataset is None or replays.empty:
+            return None
+
+        expression = ds.field(REPLAY_INDEX).isin(replays[REPLAY_INDEX].to_numpy())
+        if self.partition_by:
+            expression &= ds.field(self.partition_by).isin(replays[self.partition_by].unique().tolist())
+        time_filters = _time_filters(TIME_COLUMNS[name], time_window)
+        if time_filters:
+            expression &= pq.filters_to_expression(time_filters)
+        if columns is None:
+            columns = [field for field in dataset.schema.names if field not in (REPLAY_INDEX, self.partition_by)]
+        table = dataset.to_table(columns=[*[column for column in columns if column != "replay_id"], REPLAY_INDEX], filter=expression)
+
+        # Partitions come back in directory order, put the replays in the requested order
+        position = np.full(int(self.replays[REPLAY_INDEX].max()) + 1, -1, dtype=np.int32)
+        position[self.replays.loc[replay_ids, REPLAY_INDEX].to_numpy()] = np.arange(len(replay_ids), dtype=np.int32)
+        codes = position[table.column(REPLAY_INDEX).to_numpy()]
+        if len(codes) > 1 and (np.diff(codes) < 0).any():
+            order = np.argsort(codes, kind="stable")
+            table, codes = table.take(order), codes[order]
+        df = table.drop_columns([REPLAY_INDEX]).to_pandas()
+        df["replay_id"] = pd.Categorical.from_codes(codes, categories=list(replay_ids))
+        return df
+
+    def load_tables(self, replay_ids: list[str], tables: dict[str, list[str] | None], time_window=None) -> dict[str, pd.DataFrame | None]:
+        """Like replay_bundle.load_corpus_tables, from the dataset."""
+        return {name: self.read_table(name, replay_ids, columns, time_window) for name, columns in tables.items()}
+
+    def replay_bundle(self, replay_id: str, tables: dict[str, list[str] | None], time_window=None, **values) -> ReplayBundle:
+        return DatasetReplayBundle(self, replay_id, tables, time_window, **values)
+
+class DatasetReplayBundle(ReplayBundle):
+    """ReplayBundle whose tables are read from a corpus dataset instead of the replay's directory."""
+
+    def __init__(self, dataset: CorpusDataset, replay_id: str, tables: dict[str, list[str] | None], time_window=None, **values):
+        super().__init__(dataset.path / replay_id, replay_id, tables, time_window, **values)
+        self.dataset = dataset
+
+    def _read(self, name: str, columns: list[str] | None) -> pd.DataFrame | None:
+        df = self.dataset.read_table(name, [self.replay_id], columns, self.time_window)
+        if df is None:
+            return None
+        df = df.drop(columns="replay_id")
+        for column in df.select_dtypes("category"):
+            df[column] = df[column].cat.remove_unused_categories() # Only this replay's categories, like its own file
+        return df
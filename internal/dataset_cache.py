@@ -0,0 +1,152 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple
+import lightgbm
+import numpy as np
+import pandas as pd
+
+from internal.feature_store import read_features_head
+from internal.job_ledger import file_content_hash
+from internal.model_search import DATASET_PARAMS, encode_labels
+
+DEFAULT_DATASET_CACHE_DIR = Path("DatasetCache")
+DEFAULT_CACHE_SIZE_MB = 2048
+
+# Parameters that change the bins besides DATASET_PARAMS: the seed LightGBM samples the rows it bins from
+_BINNING_PARAMS = DATASET_PARAMS | {"random_state", "seed", "data_random_seed"}
+_TARGET_COLUMN = "_cache_target" # Added to the stored evaluation rows, next to the features
+_GROUP_COLUMN = "_cache_group"
+
+class CachedDataset(NamedTuple):
+    dataset: lightgbm.Dataset # The binned rows the model trains on, labels are indices into `classes`
+    classes: list
+    X: pd.DataFrame # The rows the model is evaluated on: the test rows of a train/test split, or every row for cross-validation
+    y: pd.Series
+    groups: pd.Series # replay_id of the rows of X
+    split: dict[str, np.ndarray] # train_idx and test_idx of a train/test split (positions in the feature file), empty otherwise
+
+def _entry_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.iterdir() if file.is_file())
+
+class DatasetCache:
+    """
+    Cache of the LightGBM Datasets Train-Model.py trains on, so repeated runs on the same feature file neither read
+    and prepare the features nor bin them again.
+
+    An entry holds the constructed Dataset (LightGBM's binary format), the prepared rows the model is evaluated on
+    (Parquet, categorical columns kept), and the train/test split indices. Entries are keyed by a hash of the feature
+    file's contents, the model script's prepare_data (its output columns and its source), the split and the binning
+    parameters, so changing the model's other hyperparameters reuses the entry. When the cache grows beyond
+    `max_bytes`, the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory=DEFAULT_DATASET_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_SIZE_MB << 20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, features_path, model_script, split: str, params: dict) -> str:
+        """The entry key of a feature file prepared by a model script, split with `split` and binned with the model's `params`."""
+        X_head, y_head = model_script.prepare_data(read_features_head(features_path))
+        try:
+            prepare_source = inspect.getsource(type(model_script).prepare_data)
+        except (OSError, TypeError): # No source (e.g. defined interactively), fall back to the columns alone
+            prepare_source = ""
+        key = {
+            "features": file_content_hash(features_path),
+            "columns": [[name, str(dtype)] for name, dtype in X_head.dtypes.items()],
+            "target": [str(y_head.name), str(y_head.dtype)],
+            "prepare_data": hashlib.sha256(prepare_source.encode()).hexdigest(),
+            "split": split,
+            "params": {name: params[name] for name in sorted(params) if name in _BINNING_PARAMS},
+            "lightgbm": lightgbm.__version__,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:32]
+
+    def load(self, key: str) -> CachedDataset | None:
+        """The cached entry, or None if there is none (or it can't be read, in which case it is deleted)."""
+        path = self.path(key)
+        manifest_path = path / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        try:
+            manifest = json.loads(manifest_path.read_text())
+            if manifest["key"] != key:
+                return None
+            dataset = lightgbm.Dataset(str(path / "dataset.bin"), params=manifest["dataset_params"])
+            dataset.pandas_categorical = manifest["pandas_categorical"] # Not kept in LightGBM's binary format
+            dataset.construct()
+            rows = pd.read_parquet(path / "rows.parquet")
+            split = dict(np.load(path / "split.npz")) if (path / "split.npz").exists() else {}
+        except (OSError, ValueError, KeyError, lightgbm.basic.LightGBMError):
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        os.utime(manifest_path) # Most recently used
+        y = rows.pop(_TARGET_COLUMN).rename(manifest["target"])
+        groups = rows.pop(_GROUP_COLUMN).rename("replay_id")
+        return CachedDataset(dataset, manifest["classes"], rows, y, groups, split)
+
+    def store(self, key: str, X_train: pd.DataFrame, y_train: pd.Series, X: pd.DataFrame, y: pd.Series, groups: pd.Series,
+              params: dict, split: dict[str, np.ndarray] | None = None) -> CachedDataset:
+        """
+        Bins the training rows into a Dataset with the model's `params` and caches it with the evaluation rows (X, y and
+        their replay_id groups) and the split indices. Returns the entry, with the Dataset already constructed.
+        """
+        labels, classes = encode_labels(y_train)
+        dataset_params = {**{name: value for name, value in params.items() if name in _BINNING_PARAMS}, "feature_pre_filter": False, "verbose": -1}
+        dataset = lightgbm.Dataset(X_train, labels, params=dataset_params, free_raw_data=False).construct()
+        classes = classes.tolist()
+        split = split or {}
+
+        path = self.path(key)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        shutil.rmtree(temp_path, ignore_errors=True)
+        temp_path.mkdir(parents=True)
+        dataset.save_binary(str(temp_path / "dataset.bin"))
+        rows = X.reset_index(drop=True).assign(**{_TARGET_COLUMN: y.to_numpy(), _GROUP_COLUMN: groups.astype(str).to_numpy()})
+        rows.to_parquet(temp_path / "rows.parquet", index=False)
+        if split:
+            np.savez(temp_path / "split.npz", **split)
+        (temp_path / "manifest.json").write_text(json.dumps({
+            "key": key,
+            "dataset_params": {**dataset_params, **dataset.get_params()}, # With the categorical columns LightGBM found, which the binary format doesn't record
+            "pandas_categorical": dataset.pandas_categorical,
+            "classes": classes,
+            "target": y.name,
+            "feature_columns": list(X_train.columns),
+            "train_rows": len(X_train),
+        }, default=str))
+        shutil.rmtree(path, ignore_errors=True) # A stale entry of the same key
+        os.replace(temp_path, path)
+        return CachedDataset(dataset, classes, X.reset_index(drop=True), y.reset_index(drop=True), groups.astype(str).reset_index(drop=True), split)
+
+    def evict(self, keep: str | None = None) -> list[Path]:
+        """
+        Deletes the least recently used entries until the cache is within max_bytes, except the entry of `keep` (the
+        one just used, even if it is larger than max_bytes on its own). Returns the deleted entries.
+        """
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.iterdir():
+            manifest_path = path / "manifest.json"
+            if path.is_dir() and manifest_path.exists():
+                entries.append((manifest_path.stat().st_mtime_ns, _entry_size(path), path))
+        total = sum(size for _, size, _ in entries)
+        keep_path = self.path(keep) if keep is not None else None
+        evicted = []
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted.append(path)
+        return evicted
@@ -3,3 +3,10 @@ class EssentialDataMissingError(KeyError):
     Raised when a replay bundle is missing an essential data key (e.g., 'units', 'resources'). Typically indicates a missing file.
     """
     pass
+
+class ModelArtifactError(ValueError):
+    """
+    Raised when a model artifact can't be read: not an artifact, an unsupported format version, or contents that fail the integrity check.
+    Also raised when a model file is neither an artifact nor a LightGBM text model.
+    """
+    pass
@@ -1,25 +1,86 @@
-from typing import Callable, Tuple
+import sys
+from typing import NamedTuple
 import pandas as pd
+from sc2.data import Attribute
+from sc2.ids.unit_typeid import UnitTypeId
 from sc2.unit import Unit
 from sc2.units import Units
 
-def resource_snap(u: Unit) -> bool:
-    return u.is_snapshot and ( u.is_mineral_field or u.is_vespene_geyser )
+# Resource kinds of a unit type (which contents column resource_remaining is read from)
+NO_RESOURCE = 0
+MINERALS = 1
+VESPENE = 2
 
-def split_units(units: Units, predicate: Callable[[Unit], bool]) -> Tuple[Units, Units]:
-    """Split a Units collection into two based on a boolean filter function.
-    
-    Returns:
-        A tuple of two Units objects: (true_units, false_units).
+class UnitTypeInfo(NamedTuple):
+    """Static data of a unit type that the capture loop needs for every unit."""
+    name: str # UnitTypeId name, as recorded in unit_type (interned)
+    is_resource: bool # Mineral field or vespene geyser
+    is_structure: bool
+    resource_kind: int # NO_RESOURCE, MINERALS or VESPENE
+
+def _type_info(name: str, has_minerals: bool, has_vespene: bool, is_structure: bool) -> UnitTypeInfo:
+    resource_kind = MINERALS if has_minerals else (VESPENE if has_vespene else NO_RESOURCE)
+    return UnitTypeInfo(sys.intern(name), resource_kind != NO_RESOURCE, bool(is_structure), resource_kind)
+
+class UnitTypeTable:
+    """
+    Lookup from a unit's raw type ID to its UnitTypeInfo, built once per game from the game data, so the capture
+    loop doesn't go through Unit's property chains (type_id, _type_data, attributes) for every unit on every step.
+    Types that aren't in the game data are added from the first unit seen with them.
     """
-    true_list = []
-    false_list = []
 
-    for u in units:
-        true_list.append(u) if predicate(u) else false_list.append(u)
+    __slots__ = ("types",)
+
+    def __init__(self, game_data=None):
+        self.types: dict[int, UnitTypeInfo] = {}
+        if game_data is not None:
+            for type_value, type_data in game_data.units.items():
+                try:
+                    name = UnitTypeId(type_value).name
+                except ValueError: # Unknown to python-sc2, Unit.type_id would fail on it as well
+                    continue
+                self.types[type_value] = _type_info(name, type_data.has_minerals, type_data.has_vespene, Attribute.Structure.value in type_data.attributes)
+
+    def __getitem__(self, unit: Unit) -> UnitTypeInfo:
+        info = self.types.get(unit._proto.unit_type)
+        return info if info is not None else self.add(unit)
 
+    def add(self, unit: Unit) -> UnitTypeInfo:
+        info = _type_info(unit.type_id.name, unit.is_mineral_field, unit.is_vespene_geyser, unit.is_structure)
+        self.types[unit._proto.unit_type] = info
+        return info
 
-    return (Units(true_list, units._bot_object), Units(false_list, units._bot_object))
+class UpgradeInfo(NamedTuple):
+    name: str
+    mineral_cost: int
+    vespene_cost: int
+    research_time: float # Game loops
+
+def upgrade_table(game_data) -> dict[int, UpgradeInfo]:
+    """Upgrade ID -> UpgradeInfo for every upgrade in the game data."""
+    return {upgrade_value: upgrade_info(upgrade_data) for upgrade_value, upgrade_data in game_data.upgrades.items()}
+
+def upgrade_info(upgrade_data) -> UpgradeInfo:
+    cost = upgrade_data.cost
+    return UpgradeInfo(upgrade_data.name, cost.minerals, cost.vespene, cost.time or 0)
+
+def filter_units(units: Units, unit_types: UnitTypeTable) -> list[Unit]:
+    """
+    The units the extractor records, in a single pass: every unit except snapshots of resource structures (mineral
+    fields and geysers remembered from the fog of war). Snapshots come first, then the other units, in their order
+    in `units`.
+    """
+    types = unit_types.types
+    snapshots, real_units = [], []
+    for u in units:
+        if u.is_snapshot:
+            info = types.get(u._proto.unit_type) or unit_types.add(u)
+            if not (info.is_resource and info.is_structure):
+                snapshots.append(u)
+        else:
+            real_units.append(u)
+    snapshots.extend(real_units)
+    return snapshots
 
 def optimize_unit_dtypes(dfI: pd.DataFrame) -> pd.DataFrame:
     """Optimizes unit DataFrame dtypes for smaller file size."""
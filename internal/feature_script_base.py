@@ -1,17 +1,46 @@
 from abc import ABC, abstractmethod
 import pandas as pd
 from internal.exceptions import EssentialDataMissingError
+from internal.replay_bundle import ESSENTIAL_TABLES, TABLE_FILES, TIME_COLUMNS
+from internal.time_series import TimeSeries
+
+class _BundleTable:
+    """Attribute that takes its table from the replay bundle on first access, so lazily loaded tables are only read if used."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance._bundle.get(self.name)
+        instance.__dict__[self.name] = value # Later reads (and assignments) skip the bundle
+        return value
 
 class FeatureScriptBase(ABC):
     """
     Abstract Base Class for feature engineering scripts.
     """
 
-    units: pd.DataFrame
-    deaths: pd.DataFrame | None
-    resources: pd.DataFrame
-    upgrades: pd.DataFrame | None
-    
+    # Optional declaration of the data the script reads, so only that is loaded: table name ("units", "resources",
+    # "deaths", "upgrades") -> list of columns, or None for every column. Tables that aren't listed aren't loaded.
+    # None (the default) loads every table with every column.
+    required_data: dict[str, list[str] | None] | None = None
+    # Optional (start, end) game time window in seconds (either may be None). Only rows inside it are loaded.
+    time_window: tuple[float | None, float | None] | None = None
+
+    units = _BundleTable() # pd.DataFrame
+    deaths = _BundleTable() # pd.DataFrame | None
+    resources = _BundleTable() # pd.DataFrame
+    upgrades = _BundleTable() # pd.DataFrame | None
+
+    @classmethod
+    def required_tables(cls) -> dict[str, list[str] | None]:
+        """The tables to load for this script, and the columns to read from each (None for all of them)."""
+        if cls.required_data is None:
+            return {name: None for name in TABLE_FILES}
+        return dict(cls.required_data)
+
     def _init_bundle(self, replay_bundle: dict):
         """Initializes the instance with the data bundle for a single replay."""
 
@@ -21,15 +50,26 @@ class FeatureScriptBase(ABC):
         self.p2_name = replay_bundle.get("p2_name")
         self.p1_id = replay_bundle.get("p1_id")
         self.p2_id = replay_bundle.get("p2_id")
-        
-        try:
-            self.units = replay_bundle["units"]
-            self.resources = replay_bundle["resources"]
-        except KeyError as e:
-            raise EssentialDataMissingError(f"Replay bundle is missing data: {e}.") from e
 
-        self.deaths = replay_bundle.get("deaths")
-        self.upgrades = replay_bundle.get("upgrades")
+        for name in TABLE_FILES:
+            self.__dict__.pop(name, None) # Forget the previous replay's tables
+        self._bundle = replay_bundle
+        self._time_series = {}
+
+        for name in ESSENTIAL_TABLES:
+            if name in self.required_tables() and name not in replay_bundle:
+                raise EssentialDataMissingError(f"Replay bundle is missing data: '{name}'.")
+
+    def time_series(self, table: str = "resources") -> TimeSeries | None:
+        """
+        Time index over one of the replay's tables ("resources", "units", "deaths" or "upgrades"), built once per replay.
+        Use it for as-of lookups, deltas, rates and running aggregates, e.g. self.time_series().asof("p1_minerals", [180, 240]).
+        None if the table is missing.
+        """
+        if table not in self._time_series:
+            df = getattr(self, table)
+            self._time_series[table] = TimeSeries(df, TIME_COLUMNS[table]) if df is not None else None
+        return self._time_series[table]
 
     @property
     def p1_race(self) -> str | None:
@@ -58,6 +98,22 @@ class FeatureScriptBase(ABC):
         except (KeyError, IndexError):
             return None
 
+    def process_corpus(self, corpus: dict) -> pd.DataFrame | None:
+        """
+        Optional batch API, processing many replays at once. Scripts that implement it are given batches of replays
+        instead of single replays by Feature-Engineer.py, so they can compute features with grouped, vectorised operations.
+
+        corpus["replays"] has one row per replay: replay_id, p1_name, p2_name, p1_id, p2_id, p1_race, p2_race, winner and
+        duration (corpus["metadata"] maps replay_id to the full metadata). corpus["units"], ["resources"], ["deaths"] and
+        ["upgrades"] are the declared tables (see required_data) of all the replays, concatenated and grouped by replay in
+        the order of corpus["replays"], with a categorical replay_id column. Must return a replay_id column.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def supports_corpus(cls) -> bool:
+        return cls.process_corpus is not FeatureScriptBase.process_corpus
+
     @abstractmethod
     def process_replay(self, replay_bundle: dict, replay_id: str) -> pd.DataFrame:
         """
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from internal.job_ledger import file_content_hash
+
+DEFAULT_BATCH_ROWS = 65_536
+
+def _stored_values(values: np.ndarray) -> np.ndarray:
+    """Converts one concatenated feature column to the type it is stored with."""
+    if values.dtype.kind == "b":
+        return values
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64, copy=False)
+    values = values.astype(object, copy=False)
+    values[pd.isna(values)] = None
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind in ("integer", "floating", "mixed-integer-float", "decimal", "empty"):
+        return np.array(values, dtype=np.float64) # None becomes NaN
+    return values # Text (stored as strings) or bools with missing values
+
+def normalize_feature_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates replays' feature frames with the dtypes they are stored with, so every replay's rows share one schema.
+    Numbers become float64 (a feature can be an int for one replay and a float for another), bools stay bools, and
+    text (including categoricals, whose categories differ per replay) becomes strings.
+    """
+    df = pd.concat(frames, ignore_index=True)
+    return pd.DataFrame({name: _stored_values(column.to_numpy()) for name, column in df.items()}, copy=False)
+
+class FeatureWriter:
+    """
+    Single open writer for engineered features.
+
+    Each replay's DataFrame is buffered, and every `batch_rows` rows the buffer is written as one Parquet row group.
+    Text columns are stored dictionary-encoded, so they are read back as pandas categoricals. Optionally writes the
+    same rows to a CSV file (through one open file handle) as an export.
+    """
+
+    def __init__(self, path, batch_rows: int = DEFAULT_BATCH_ROWS, csv_path=None):
+        self.path = Path(path)
+        self.csv_path = Path(csv_path) if csv_path is not None else None
+        self.batch_rows = batch_rows
+        self.rows_written = 0
+        self._buffer = []
+        self._buffered_rows = 0
+        self._writer = None
+        self._schema = None
+        self._csv_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        self._buffer.append(df)
+        self._buffered_rows += len(df)
+        if self._buffered_rows >= self.batch_rows:
+            self.flush()
+
+    def _to_table(self, batch_df: pd.DataFrame) -> pa.Table:
+        table = pa.Table.from_pandas(batch_df, preserve_index=False)
+        for i, field in enumerate(table.schema):
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+                column = table.column(i).cast(pa.string()).dictionary_encode()
+                table = table.set_column(i, pa.field(field.name, column.type), column)
+        return table
+
+    def _conform(self, table: pa.Table) -> pa.Table:
+        """Casts a later batch to the schema of the first one, with columns this batch doesn't have filled with nulls."""
+        new_columns = set(table.schema.names) - set(self._schema.names)
+        if new_columns:
+            raise ValueError(f"Feature columns {sorted(new_columns)} were not returned for the first replays written to {self.path}.")
+        columns = [table.column(field.name) if field.name in table.schema.names else pa.nulls(len(table), field.type) for field in self._schema]
+        return pa.Table.from_arrays(columns, schema=self._schema.remove_metadata()).cast(self._schema)
+
+    def flush(self):
+        """Writes the buffered replays as one row group."""
+        if not self._buffer:
+            return
+        batch_df = normalize_feature_frames(self._buffer)
+        self._buffer = []
+        self._buffered_rows = 0
+
+        table = self._to_table(batch_df)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        elif table.schema != self._schema:
+            table = self._conform(table)
+        self._writer.write_table(table)
+
+        if self.csv_path is not None:
+            batch_df = batch_df.reindex(columns=self._schema.names)
+            if self._csv_file is None:
+                self._csv_file = open(self.csv_path, "w", newline="")
+                batch_df.to_csv(self._csv_file, header=True, index=False)
+            else:
+                batch_df.to_csv(self._csv_file, header=False, index=False)
+
+        self.rows_written += len(batch_df)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+
+def read_features(path) -> pd.DataFrame:
+    """Loads a feature file written by Feature-Engineer.py (Parquet, with categoricals preserved, or a CSV export)."""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return pd.read_csv(path)
+    return pd.read_parquet(path)
+
+def read_features_head(path, rows: int = 1000) -> pd.DataFrame:
+    """The first rows of a feature file, read like read_features (without reading the rest of the file)."""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return pd.read_csv(path, nrows=rows)
+    parquet_file = pq.ParquetFile(path)
+    batch = next(parquet_file.iter_batches(batch_size=rows), None)
+    table = pa.Table.from_batches([batch]) if batch is not None else parquet_file.schema_arrow.empty_table()
+    return table.to_pandas()
+
+CACHE_REPLAY_COLUMN = "_cache_replay_id" # Added to cached rows, so a replay's rows can be found in its segment
+
+class CacheEntry(NamedTuple):
+    script_hash: str
+    input_hash: str
+    input_stat: str
+    segment: str | None
+    rows: int
+
+def replay_input_files(replay_path) -> list[Path]:
+    """The files Feature-Engineer.py loads for a replay: its metadata and Parquet files."""
+    replay_path = Path(replay_path)
+    return sorted([*replay_path.glob("*_info.json"), *replay_path.glob("*.parquet")])
+
+def replay_input_stat(replay_path) -> list:
+    return [[path.name, stat.st_size, stat.st_mtime_ns] for path in replay_input_files(replay_path) for stat in [path.stat()]]
+
+def replay_input_hash(replay_path) -> str:
+    digest = hashlib.sha256()
+    for path in replay_input_files(replay_path):
+        digest.update(f"{path.name}:{file_content_hash(path)}\n".encode())
+    return digest.hexdigest()
+
+class FeatureCache:
+    """
+    Per-replay cache of a feature script's output, keyed by (replay_id, feature script source hash, input files hash).
+
+    Rows are stored in append-only Parquet segments: each run writes the replays it computed to one new segment, and
+    a SQLite index maps every replay to the segment holding its current rows. Segments no longer referenced by the
+    index are deleted. Input files are only re-hashed if their size or modification time changed since they were indexed.
+    """
+
+    def __init__(self, directory, script_hash: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.script_hash = script_hash
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(self.directory / "index.sqlite", isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS replays (
+                replay_id TEXT PRIMARY KEY,
+                script_hash TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                input_stat TEXT NOT NULL,
+                segment TEXT,
+                rows INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        rows = self._connection.execute("SELECT replay_id, script_hash, input_hash, input_stat, segment, rows FROM replays").fetchall()
+        self.entries = {row[0]: CacheEntry(*row[1:]) for row in rows}
+        self._segment_path = None
+        self._segment_writer = None
+        self._pending = {} # replay_id -> index row, written when the segment is committed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def lookup(self, replay_id: str, replay_path=None, input_hash: str | None = None) -> bool:
+        """
+        True (a hit) if the replay's rows are cached for this feature script and unchanged input files. Pass the
+        input files' hash instead of the replay path if it is already known (e.g. recorded in a corpus dataset).
+        """
+        entry = self.entries.get(replay_id)
+        hit = False
+        if entry is not None and entry.script_hash == self.script_hash and input_hash is not None:
+            hit = entry.input_hash == input_hash
+        elif entry is not None and entry.script_hash == self.script_hash:
+            input_stat = replay_input_stat(replay_path)
+            if json.loads(entry.input_stat) == input_stat:
+                hit = True
+            elif entry.input_hash == replay_input_hash(replay_path):
+                hit = True # Touched but not changed, remember the new stat
+                self._pending[replay_id] = entry._replace(input_stat=json.dumps(input_stat))
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def add(self, replay_paths: dict, df: pd.DataFrame, input_hashes: dict | None = None):
+        """
+        Caches computed replays' rows (possibly none), given their replay paths by replay_id (or, with `input_hashes`,
+        their input files' hashes). With several replays, rows are assigned to them by the replay_id column. They are
+        only visible in the index after commit().
+        """
+        if len(replay_paths) == 1:
+            replay_column = np.full(len(df), next(iter(replay_paths)), dtype=object)
+        else:
+            replay_column = df["replay_id"].astype(str).to_numpy(dtype=object) if not df.empty else np.empty(0, dtype=object)
+        rows = pd.Series(replay_column, dtype=object).value_counts().to_dict()
+
+        segment = None
+        if not df.empty:
+            if self._segment_writer is None:
+                self._segment_path = self.directory / f"segment_{time.time_ns()}.parquet"
+                self._segment_writer = FeatureWriter(self._segment_path)
+            self._segment_writer.write(df.assign(**{CACHE_REPLAY_COLUMN: replay_column}))
+            segment = self._segment_path.name
+
+        for replay_id, replay_path in replay_paths.items():
+            if input_hashes is not None:
+                input_hash, input_stat = input_hashes[replay_id], "null" # No files to stat, lookups compare the hash
+            else:
+                input_hash, input_stat = replay_input_hash(replay_path), json.dumps(replay_input_stat(replay_path))
+            count = rows.get(replay_id, 0)
+            self._pending[replay_id] = CacheEntry(self.script_hash, input_hash, input_stat, segment if count else None, count)
+
+    def commit(self):
+        """Finishes the current segment and points the index at it in one transaction, then deletes unreferenced segments."""
+        if self._segment_writer is not None:
+            self._segment_writer.close()
+            self._segment_writer = None
+        now = time.time()
+        self._connection.execute("BEGIN")
+        for replay_id, entry in self._pending.items():
+            self._connection.execute(
+                "INSERT OR REPLACE INTO replays (replay_id, script_hash, input_hash, input_stat, segment, rows, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (replay_id, *entry, now),
+            )
+            self.entries[replay_id] = entry
+        self._connection.execute("COMMIT")
+        self._pending = {}
+
+        referenced = {entry.segment for entry in self.entries.values()}
+        for segment_path in self.directory.glob("segment_*.parquet"):
+            if segment_path.name not in referenced:
+                segment_path.unlink()
+
+    def cached_rows(self, replay_id: str) -> int:
+        entry = self.entries.get(replay_id)
+        return entry.rows if entry is not None and entry.script_hash == self.script_hash else 0
+
+    def read(self, replay_ids) -> pd.DataFrame:
+        """Returns the cached rows of the given replays (computed with this feature script), in the given order."""
+        by_segment = {}
+        for replay_id in replay_ids:
+            entry = self.entries.get(replay_id)
+            if entry is not None and entry.script_hash == self.script_hash and entry.segment is not None:
+                by_segment.setdefault(entry.segment, []).append(replay_id)
+        if not by_segment:
+            return pd.DataFrame()
+
+        tables = [pq.read_table(self.directory / segment, filters=[(CACHE_REPLAY_COLUMN, "in", ids)]) for segment, ids in by_segment.items()]
+        df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+        order = {replay_id: i for i, replay_id in enumerate(replay_ids)}
+        df = df.iloc[np.argsort(df[CACHE_REPLAY_COLUMN].astype(object).map(order).to_numpy(), kind="stable")]
+        return df.drop(columns=CACHE_REPLAY_COLUMN).reset_index(drop=True)
+
+    def close(self):
+        if self._segment_writer is not None: # Never committed, the segment isn't referenced by the index
+            self._segment_writer.close()
+            self._segment_writer = None
+            self._segment_path.unlink(missing_ok=True)
+        self._connection.close()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import pyarrow.parquet as pq
+
+# Replay states, in pipeline order. A replay is only finished once it is DONE with the current parameters.
+QUEUED = "queued"
+EXTRACTING = "extracting"
+CONSOLIDATING = "consolidating"
+DONE = "done"
+FAILED = "failed"
+STALE = "stale"
+
+# The files a published extraction consists of. Deaths and upgrades are only written if the game had any.
+OUTPUT_FILES = ("deaths.parquet", "resources.parquet", "upgrades.parquet", "units.parquet")
+REQUIRED_OUTPUT_FILES = ("resources.parquet", "units.parquet")
+
+def file_content_hash(path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def has_complete_output(game_output_dir) -> bool:
+    """
+    Whether a replay's output directory holds a whole extraction: every required file, and every file present readable
+    as Parquet. Output written before the ledger existed wasn't published atomically, so a crash may have left some
+    of its files missing or truncated.
+    """
+    game_output_dir = Path(game_output_dir)
+    for file_name in OUTPUT_FILES:
+        path = game_output_dir / file_name
+        if not path.is_file():
+            if file_name in REQUIRED_OUTPUT_FILES:
+                return False
+            continue
+        try:
+            pq.read_metadata(path)
+        except (OSError, ValueError): # Missing or broken footer (ArrowInvalid is a ValueError)
+            return False
+    return True
+
+class LedgerEntry:
+    """One replay's row in the ledger."""
+
+    __slots__ = ("game_num", "replay_name", "state", "content_hash", "size", "mtime_ns", "params", "updated_at", "error")
+
+    def __init__(self, game_num, replay_name, state, content_hash, size, mtime_ns, params, updated_at, error):
+        self.game_num = game_num
+        self.replay_name = replay_name
+        self.state = state
+        self.content_hash = content_hash
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.params = json.loads(params) if params is not None else None
+        self.updated_at = updated_at
+        self.error = error
+
+class JobLedger:
+    """
+    On-disk record of each replay's extraction state, its content hash and the extractor parameters it was run with.
+
+    Backed by SQLite, so every state change is a single atomic transaction and a crash never leaves a half written
+    record. All entries are loaded with one query at startup, which makes skip checks a dict lookup per replay instead
+    of a scan of the output directories. Safe to use from the writer threads.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS replays (
+                    game_num TEXT PRIMARY KEY,
+                    replay_name TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    content_hash TEXT,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    params TEXT,
+                    updated_at REAL NOT NULL,
+                    error TEXT
+                )"""
+            )
+        self.entries = self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _load(self) -> dict[str, LedgerEntry]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT game_num, replay_name, state, content_hash, size, mtime_ns, params, updated_at, error FROM replays"
+            ).fetchall()
+        return {row[0]: LedgerEntry(*row) for row in rows}
+
+    def is_finished(self, game_num: str, replay_path, params: dict) -> bool:
+        """
+        True if the replay is done with the same parameters and the same file content.
+        The file is only re-hashed if its size or modification time changed since it was recorded. If the content is
+        unchanged (the file was copied or restored), the new size and modification time are recorded, so it isn't
+        hashed again on the next run.
+        """
+        entry = self.entries.get(game_num)
+        if entry is None or entry.state != DONE:
+            return False
+        if entry.params is not None and entry.params != params:
+            return False
+        stat = Path(replay_path).stat()
+        if (entry.size, entry.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return True
+        if entry.content_hash is None:
+            return True
+        if entry.content_hash != file_content_hash(replay_path):
+            return False
+        with self._lock:
+            self._connection.execute("UPDATE replays SET size = ?, mtime_ns = ? WHERE game_num = ?", (stat.st_size, stat.st_mtime_ns, game_num))
+            entry.size, entry.mtime_ns = stat.st_size, stat.st_mtime_ns
+        return True
+
+    def is_stale(self, game_num: str, params: dict) -> bool:
+        """True if the replay was finished with different extractor parameters."""
+        entry = self.entries.get(game_num)
+        return entry is not None and entry.state in (DONE, STALE) and entry.params is not None and entry.params != params
+
+    def record(self, game_num: str, replay_path, state: str, params: dict | None = None, error: str | None = None):
+        """Sets a replay's state. Passing `params` also (re)records the replay file's size, modification time and hash."""
+        replay_path = Path(replay_path)
+        entry = self.entries.get(game_num)
+        if params is not None:
+            stat = replay_path.stat()
+            content = (file_content_hash(replay_path), stat.st_size, stat.st_mtime_ns, json.dumps(params, sort_keys=True))
+        elif entry is not None:
+            content = (entry.content_hash, entry.size, entry.mtime_ns, json.dumps(entry.params, sort_keys=True) if entry.params is not None else None)
+        else:
+            content = (None, None, None, None)
+        row = (game_num, replay_path.name, state, *content, time.time(), error)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO replays (game_num, replay_name, state, content_hash, size, mtime_ns, params, updated_at, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self.entries[game_num] = LedgerEntry(*row)
+
+    def mark_queued(self, replays):
+        """Sets (game_num, replay_path) pairs to QUEUED in a single transaction, keeping their recorded hash and parameters."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN")
+            for game_num, replay_path in replays:
+                self._connection.execute(
+                    "INSERT INTO replays (game_num, replay_name, state, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(game_num) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                    (game_num, Path(replay_path).name, QUEUED, now),
+                )
+                entry = self.entries.get(game_num)
+                if entry is None:
+                    self.entries[game_num] = LedgerEntry(game_num, Path(replay_path).name, QUEUED, None, None, None, None, now, None)
+                else:
+                    entry.state = QUEUED
+            self._connection.execute("COMMIT")
+
+    def mark_stale(self, game_num: str):
+        with self._lock:
+            self._connection.execute("UPDATE replays SET state = ?, updated_at = ? WHERE game_num = ?", (STALE, time.time(), game_num))
+            self.entries[game_num].state = STALE
+
+    def counts(self) -> dict[str, int]:
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry.state] = counts.get(entry.state, 0) + 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
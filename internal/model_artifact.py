@@ -0,0 +1,144 @@
+import hashlib
+import json
+import struct
+from pathlib import Path
+from typing import NamedTuple
+import lightgbm
+import pyarrow as pa
+
+from internal.exceptions import ModelArtifactError
+
+ARTIFACT_SUFFIX = ".lgbz"
+FORMAT_VERSION = 1
+ARTIFACT_ZSTD_LEVEL = 19 # Written once, read many times: the slowest level still decompresses in well under a millisecond
+
+# Magic, SHA-256 of the manifest and model text, manifest length. Followed by the manifest (JSON) and the zstd-compressed model text.
+_MAGIC = b"SC2LGBZ\x00"
+_HEADER = struct.Struct("<8s32sI")
+
+# Per-node statistics of the LightGBM text format that are only used for training analysis (gain importance, tree plots), not to predict
+TRAINING_STATISTICS = ("split_gain=", "internal_value=", "internal_weight=", "internal_count=", "leaf_weight=", "leaf_count=")
+
+class ModelArtifact(NamedTuple):
+    booster: lightgbm.Booster
+    feature_columns: list[str] # The columns ModelScript.prepare_data returns, in the model's feature order
+    categories: dict[str, list] # Categorical feature -> the categories it was trained with (category code = index)
+    metadata: dict # Training metadata (model script, features file, row counts, accuracy, parameters, ...)
+
+def _categorical_feature_indices(booster: lightgbm.Booster):
+    """The indices of a booster's categorical features, from the parameters saved with the model."""
+    try:
+        return booster._get_loaded_param().get("categorical_feature", []) # booster.params is only filled in by model_file loads
+    except AttributeError: # A LightGBM version without this private method: read the parameters section of the model text
+        prefix = "[categorical_feature: "
+        line = next((line for line in booster.model_to_string().split("\n") if line.startswith(prefix)), prefix + "]")
+        return line[len(prefix):-1]
+
+def model_categories(booster: lightgbm.Booster) -> dict[str, list]:
+    """The training categories of a booster's categorical features (LightGBM keeps them as pandas_categorical)."""
+    indices = _categorical_feature_indices(booster)
+    if isinstance(indices, str):
+        indices = [index for index in indices.split(",") if index]
+    categories = booster.pandas_categorical or []
+    if len(indices) != len(categories):
+        raise ModelArtifactError(f"The model has {len(indices)} categorical features but categories for {len(categories)}.")
+    feature_names = booster.feature_name()
+    return {feature_names[int(index)]: list(values) for index, values in zip(indices, categories)}
+
+def strip_training_statistics(model_text: str) -> str:
+    """
+    The model text without the per-node training statistics. Predictions are unchanged, but split gains and node
+    counts read back as zeros. tree_sizes is dropped as well, since the trees no longer have those sizes.
+    """
+    return "\n".join(line for line in model_text.split("\n") if not line.startswith(TRAINING_STATISTICS) and not line.startswith("tree_sizes="))
+
+def write_artifact(path, booster: lightgbm.Booster, feature_columns: list[str], metadata: dict | None = None, prediction_only: bool = False):
+    """
+    Writes a booster as a model artifact: one file with the zstd-compressed model text, and a manifest with the
+    feature columns, the category mappings and the training metadata. With prediction_only, the model text is written
+    without its training statistics (smaller and faster to load, same predictions).
+    """
+    feature_columns = list(feature_columns)
+    if feature_columns != booster.feature_name():
+        raise ModelArtifactError(f"The feature columns don't match the model's features: {feature_columns} != {booster.feature_name()}")
+    model_text = booster.model_to_string()
+    if prediction_only:
+        model_text = strip_training_statistics(model_text)
+    model_bytes = model_text.encode()
+    manifest = json.dumps({
+        "format_version": FORMAT_VERSION,
+        "model_bytes": len(model_bytes),
+        "prediction_only": prediction_only,
+        "lightgbm_version": lightgbm.__version__,
+        "feature_columns": feature_columns,
+        "categories": model_categories(booster),
+        "metadata": metadata or {},
+    }, default=str).encode() # Parameters may hold values JSON doesn't know
+    digest = hashlib.sha256(manifest + model_bytes).digest()
+    payload = pa.Codec("zstd", ARTIFACT_ZSTD_LEVEL).compress(model_bytes, asbytes=True)
+    path = Path(path)
+    temp_path = path.with_name(f"{path.name}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, digest, len(manifest)))
+        f.write(manifest)
+        f.write(payload)
+    temp_path.replace(path)
+
+def is_artifact(path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+def read_artifact(path) -> ModelArtifact:
+    """
+    Loads a model artifact: checks its contents against the stored digest and the manifest's feature columns against
+    the booster's, then parses the booster from the decompressed text in memory. Raises ModelArtifactError if any
+    check fails.
+    """
+    data = Path(path).read_bytes()
+    if len(data) < _HEADER.size or data[:len(_MAGIC)] != _MAGIC:
+        raise ModelArtifactError(f"{path} is not a model artifact.")
+    _, digest, manifest_length = _HEADER.unpack_from(data)
+    manifest_bytes = data[_HEADER.size:_HEADER.size + manifest_length]
+    try:
+        manifest = json.loads(manifest_bytes)
+        format_version = manifest["format_version"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ModelArtifactError(f"{path} is corrupt: {e}") from e
+    if format_version != FORMAT_VERSION:
+        raise ModelArtifactError(f"{path} has format version {format_version}, expected {FORMAT_VERSION}.")
+    try:
+        model_bytes = pa.Codec("zstd").decompress(data[_HEADER.size + manifest_length:], decompressed_size=manifest["model_bytes"], asbytes=True)
+    except (OSError, ValueError, KeyError) as e: # Corrupt zstd frame
+        raise ModelArtifactError(f"{path} is corrupt: {e}") from e
+    if hashlib.sha256(manifest_bytes + model_bytes).digest() != digest:
+        raise ModelArtifactError(f"{path} is corrupt: its contents don't match the stored digest.")
+
+    try:
+        booster = lightgbm.Booster(model_str=model_bytes.decode())
+    except (UnicodeDecodeError, lightgbm.basic.LightGBMError) as e:
+        raise ModelArtifactError(f"{path} is corrupt: {e}") from e
+    if manifest["feature_columns"] != booster.feature_name():
+        raise ModelArtifactError(f"{path}: the manifest's feature columns don't match the model's features.")
+    return ModelArtifact(booster, manifest["feature_columns"], manifest["categories"], manifest["metadata"])
+
+def load_booster(path) -> tuple[lightgbm.Booster, dict[str, list]]:
+    """
+    A booster and its categories from a model artifact or a LightGBM text model (read into memory, which parses faster
+    than model_file). Raises ModelArtifactError if the file can't be read as either.
+    """
+    try:
+        if is_artifact(path):
+            artifact = read_artifact(path)
+            return artifact.booster, artifact.categories
+        booster = lightgbm.Booster(model_str=Path(path).read_text())
+    except (OSError, UnicodeDecodeError, lightgbm.basic.LightGBMError) as e:
+        raise ModelArtifactError(f"{path} is neither a model artifact nor a LightGBM text model: {e}") from e
+    return booster, model_categories(booster)
+
+def convert_text_model(text_path, artifact_path=None, prediction_only: bool = False) -> Path:
+    """Converts a LightGBM text model (an older Train-Model.py --save) to a model artifact next to it, or at artifact_path."""
+    text_path = Path(text_path)
+    artifact_path = Path(artifact_path) if artifact_path is not None else text_path.with_suffix(ARTIFACT_SUFFIX)
+    booster, _ = load_booster(text_path)
+    write_artifact(artifact_path, booster, booster.feature_name(), {"converted_from": text_path.name}, prediction_only)
+    return artifact_path
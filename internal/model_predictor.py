@@ -0,0 +1,178 @@
+import ctypes
+from pathlib import Path
+from typing import Iterator, Mapping
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import lightgbm
+from lightgbm import basic as lightgbm_basic
+from loguru import logger
+
+from internal.model_artifact import load_booster
+
+DEFAULT_BATCH_ROWS = 65_536
+PREDICTION_COLUMN = "win_probability"
+ID_COLUMNS = ["replay_id", "pov_ID"] # Copied from the features to the predictions, when present
+
+# From LightGBM's c_api.h
+_C_API_PREDICT_NORMAL = 0
+_C_API_DTYPE_FLOAT64 = 1
+
+_PREDICTORS = {} # Parse cache: resolved model path -> ((size, mtime), ModelPredictor)
+
+def load_predictor(model_path) -> "ModelPredictor":
+    """The ModelPredictor of a saved model, parsed once per process (and again if the model file changes)."""
+    path = Path(model_path).resolve()
+    stat = path.stat()
+    file_stat = (stat.st_size, stat.st_mtime_ns)
+    cached = _PREDICTORS.get(path)
+    if cached is None or cached[0] != file_stat:
+        cached = _PREDICTORS[path] = (file_stat, ModelPredictor(path))
+    return cached[1]
+
+class ModelPredictor:
+    """
+    A model saved by Train-Model.py --save (a model artifact, or a LightGBM text model), ready to score feature rows.
+
+    Rows are encoded to the float64 matrix LightGBM predicts on without going through a pandas DataFrame per call:
+    numeric features are used as they are, and categorical ones are mapped to the category codes the model was
+    trained with (kept in the artifact's manifest, or as pandas_categorical in a text model). Unknown categories and missing values become NaN,
+    LightGBM's missing category. This is the encoding Booster.predict applies to a DataFrame with categorical
+    columns, so the predictions are the same.
+
+    predict() scores whole frames in batches. predict_one() scores a single game through LightGBM's single-row fast
+    path, whose prediction config and row buffer are kept between calls (not safe to share between threads).
+    """
+
+    def __init__(self, model_path):
+        self._fast_config = None # Set before loading, so __del__ works if the load fails
+        self.path = Path(model_path)
+        self.booster, categories = load_booster(self.path)
+        self.feature_names = self.booster.feature_name()
+        self.categories = {name: pd.Index(values) for name, values in categories.items()}
+        self._category_codes = {name: {value: float(code) for code, value in enumerate(values)} for name, values in self.categories.items()}
+        self._encoders = [(i, name, self._category_codes.get(name)) for i, name in enumerate(self.feature_names)]
+        self._outputs = self.booster.num_model_per_iteration()
+        self._row = np.full(len(self.feature_names), np.nan)
+        self._out = np.zeros(self._outputs)
+        self._fast_call = None
+
+    def __del__(self):
+        if self._fast_config is not None:
+            lightgbm_basic._LIB.LGBM_FastConfigFree(self._fast_config)
+            self._fast_config = None
+
+    def validate(self, columns):
+        """Raises a ValueError if any of the model's features isn't in `columns`."""
+        columns = set(columns)
+        missing = [name for name in self.feature_names if name not in columns]
+        if missing:
+            raise ValueError(f"The features are missing {len(missing)} of the model's {len(self.feature_names)} features: {', '.join(missing)}")
+
+    def encode(self, df: pd.DataFrame) -> np.ndarray:
+        """The model's features of `df` as a float64 matrix, in the model's feature order."""
+        self.validate(df.columns)
+        X = np.empty((len(df), len(self.feature_names)), dtype=np.float64)
+        for i, name in enumerate(self.feature_names):
+            categories = self.categories.get(name)
+            if categories is not None:
+                codes = categories.get_indexer(df[name]).astype(np.float64)
+                codes[codes < 0] = np.nan # Unknown or missing
+                X[:, i] = codes
+            else:
+                X[:, i] = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        return X
+
+    def predict(self, df: pd.DataFrame, batch_rows: int = DEFAULT_BATCH_ROWS) -> np.ndarray:
+        """Scores every row of `df`, `batch_rows` rows at a time (win probabilities for the binary winner models)."""
+        self.validate(df.columns)
+        if not len(df):
+            return np.empty(0) if self._outputs == 1 else np.empty((0, self._outputs))
+        batches = [self.booster.predict(self.encode(df.iloc[start:start + batch_rows])) for start in range(0, len(df), batch_rows)]
+        return np.concatenate(batches)
+
+    def _init_fast_predict(self):
+        """
+        Sets up LightGBM's single-row fast path, which is only reachable through LightGBM internals (requirements.txt
+        pins the version it was written for). If they changed, falls back to Booster.predict on the row.
+        """
+        try:
+            config = ctypes.c_void_p()
+            lightgbm_basic._safe_call(lightgbm_basic._LIB.LGBM_BoosterPredictForMatSingleRowFastInit(
+                self.booster._handle, ctypes.c_int(_C_API_PREDICT_NORMAL), ctypes.c_int(0), ctypes.c_int(-1),
+                ctypes.c_int(_C_API_DTYPE_FLOAT64), ctypes.c_int32(len(self.feature_names)), ctypes.c_char_p(b"num_threads=1"),
+                ctypes.byref(config)))
+            self._fast_config = config
+            out_length = ctypes.c_int64()
+            arguments = (config, self._row.ctypes.data_as(ctypes.c_void_p), ctypes.byref(out_length), self._out.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+            predict = lightgbm_basic._LIB.LGBM_BoosterPredictForMatSingleRowFast
+            fast_call = lambda: lightgbm_basic._safe_call(predict(*arguments))
+            fast_call() # On the current row, so a changed signature fails here rather than mid-game
+            self._fast_call = fast_call
+        except (AttributeError, TypeError, ctypes.ArgumentError, lightgbm_basic.LightGBMError) as e:
+            logger.warning(f"LightGBM {lightgbm.__version__}'s single-row fast path isn't available ({e!r}), predicting single games with Booster.predict.")
+            self._fast_call = self._predict_row
+
+    def _predict_row(self):
+        self._out[:] = self.booster.predict(self._row.reshape(1, -1)).reshape(-1)
+
+    def predict_one(self, features: Mapping):
+        """Scores a single game given as a mapping of feature name to value (a dict, a Series, ...)."""
+        if self._fast_call is None:
+            self._init_fast_predict()
+        row = self._row
+        try:
+            for i, name, category_codes in self._encoders:
+                value = features[name]
+                if category_codes is not None:
+                    row[i] = category_codes.get(value, np.nan)
+                else:
+                    row[i] = np.nan if value is None else value
+        except KeyError:
+            self.validate(features.keys())
+            raise
+        self._fast_call()
+        return float(self._out[0]) if self._outputs == 1 else self._out.copy()
+
+def iter_feature_batches(features_path, columns: list[str], batch_rows: int = DEFAULT_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """The given columns of a feature file (Parquet from Feature-Engineer.py, or a CSV export), `batch_rows` rows at a time."""
+    features_path = Path(features_path)
+    if features_path.suffix.lower() == ".csv":
+        for batch in pd.read_csv(features_path, usecols=lambda name: name in columns, chunksize=batch_rows):
+            yield batch
+        return
+    parquet_file = pq.ParquetFile(features_path)
+    present = [name for name in columns if name in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=present):
+        yield batch.to_pandas()
+
+def predict_file(predictor: ModelPredictor, features_path, output_path, batch_rows: int = DEFAULT_BATCH_ROWS) -> dict:
+    """
+    Scores a feature file batch by batch and writes the predictions to a Parquet file: the ID columns of the
+    features, then PREDICTION_COLUMN. Returns the number of rows scored and, if the features have a 'win' column,
+    the accuracy of the predictions.
+    """
+    rows, correct, labelled = 0, 0, 0
+    writer = None
+    try:
+        for batch in iter_feature_batches(features_path, [*ID_COLUMNS, "win", *predictor.feature_names], batch_rows):
+            predictions = predictor.predict(batch, batch_rows)
+            output = batch[[name for name in ID_COLUMNS if name in batch]].reset_index(drop=True)
+            output[PREDICTION_COLUMN] = predictions
+            if "win" in batch:
+                wins = batch["win"].to_numpy(dtype=np.float64, na_value=np.nan)
+                known = ~np.isnan(wins)
+                correct += int(((predictions[known] >= 0.5) == (wins[known] == 1)).sum())
+                labelled += int(known.sum())
+            table = pa.Table.from_pandas(output, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(batch)
+        if writer is None: # No rows
+            pq.write_table(pa.table({PREDICTION_COLUMN: pa.array([], pa.float64())}), output_path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return {"rows": rows, "accuracy": correct / labelled if labelled else None}
@@ -49,6 +49,26 @@ class ModelScriptBase(ABC):
         """
         pass
 
+    def get_search_space(self) -> dict[str, list]:
+        """
+        Returns the hyperparameters Train-Model.py --search tries, as a mapping of
+        model parameter name to candidate values. Every combination is
+        cross-validated unless --trials limits the search to a random sample.
+
+        Subclasses can override this to search other parameters of their model.
+        Parameters that change how the data is binned (max_bin, subsample_for_bin, ...)
+        can't be searched, since the trials share one binned dataset.
+
+        Returns:
+            A dictionary of parameter name to a list of values.
+        """
+        return {
+            "num_leaves": [7, 15, 31],
+            "learning_rate": [0.03, 0.1],
+            "min_child_samples": [5, 20, 50],
+            "colsample_bytree": [0.7, 1.0],
+        }
+
     def evaluate_model(self, model, X_test: pd.DataFrame, y_test: pd.Series):
         """
         Evaluates the trained model and prints a standardized report.
@@ -130,9 +150,9 @@ class ModelScriptBase(ABC):
         plt.close()
 
         # Decision tree plot of the first tree
-        if isinstance(model, lightgbm.LGBMClassifier):
+        if hasattr(model, 'booster_'): # An LGBMClassifier, or a model trained on a cached Dataset
             plt.figure(figsize=(20, 10))
-            lightgbm.plot_tree(model, ax=plt.gca(), show_info=['split_gain', 'internal_value', 'internal_count', 'leaf_count'])
+            lightgbm.plot_tree(model.booster_, ax=plt.gca(), show_info=['split_gain', 'internal_value', 'internal_count', 'leaf_count'])
             plt.title('Decision Tree')
             plt.tight_layout()
             plt.savefig(f"{output_folder}/decision_tree.png")
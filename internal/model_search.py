@@ -0,0 +1,207 @@
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import lightgbm
+import numpy as np
+import pandas as pd
+from sklearn.metrics import log_loss
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit
+from sklearn.utils.class_weight import compute_sample_weight
+
+# LGBMClassifier parameters that LightGBM applies when it bins the data. The folds and trials share one Dataset, so these are
+# fixed by the model script's model and can't be searched.
+DATASET_PARAMS = {"max_bin", "max_bin_by_feature", "min_data_in_bin", "subsample_for_bin", "bin_construct_sample_cnt",
+                  "categorical_feature", "feature_pre_filter", "linear_tree", "use_missing", "zero_as_missing"}
+# LGBMClassifier parameters that aren't LightGBM training parameters
+_ESTIMATOR_ONLY_PARAMS = {"n_estimators", "class_weight", "importance_type", "n_jobs"}
+# Share of a fold's training replays held out to choose its early stopping round
+EARLY_STOPPING_VALID_SIZE = 0.2
+
+def booster_params(model) -> tuple[dict, int]:
+    """The LightGBM training parameters and the number of boosting rounds of an (unfitted) LGBMClassifier."""
+    estimator_params = model.get_params()
+    params = {name: value for name, value in estimator_params.items() if name not in _ESTIMATOR_ONLY_PARAMS and value is not None}
+    params.setdefault("verbose", -1)
+    return params, estimator_params["n_estimators"]
+
+def _objective_params(params: dict, classes: int) -> dict:
+    """The parameters with the objective LGBMClassifier picks for this many classes, unless the model sets one."""
+    if classes > 2:
+        return {**params, "objective": params.get("objective", "multiclass"), "num_class": classes}
+    return {**params, "objective": params.get("objective", "binary")}
+
+class BoosterClassifier:
+    """
+    A classifier trained with lightgbm.train on an already binned Dataset (see fit_on_dataset), with the parts of the
+    LGBMClassifier interface that Train-Model.py and ModelScriptBase use: predict, predict_proba, classes_,
+    feature_importances_, booster_ and get_params.
+    """
+
+    def __init__(self, booster: lightgbm.Booster, classes, params: dict):
+        self.booster_ = booster
+        self.classes_ = np.asarray(classes)
+        self._params = params
+        self.feature_importances_ = booster.feature_importance(importance_type=params.get("importance_type", "split"))
+
+    def get_params(self, deep: bool = True) -> dict:
+        return dict(self._params)
+
+    def predict_proba(self, X) -> np.ndarray:
+        probabilities = self.booster_.predict(X)
+        return np.column_stack([1 - probabilities, probabilities]) if probabilities.ndim == 1 else probabilities
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def class_sample_weights(class_weight, labels: np.ndarray, classes) -> np.ndarray | None:
+    """
+    The row weights LGBMClassifier.fit derives from its class_weight ('balanced' or class -> weight) for rows whose
+    labels are indices into `classes`, or None if class_weight is None.
+    """
+    if class_weight is None:
+        return None
+    if isinstance(class_weight, dict):
+        index = {value: i for i, value in enumerate(np.asarray(classes).tolist())}
+        class_weight = {index[value]: weight for value, weight in class_weight.items()}
+    return compute_sample_weight(class_weight, labels)
+
+def _weighted(dataset: lightgbm.Dataset, weights: np.ndarray | None) -> lightgbm.Dataset:
+    """The (subset) Dataset with the row weights set. LightGBM only applies a subset's weights once it is constructed."""
+    if weights is not None:
+        dataset.construct().set_weight(weights)
+    return dataset
+
+def fit_on_dataset(model, dataset: lightgbm.Dataset, classes) -> BoosterClassifier:
+    """
+    Trains an (unfitted) LGBMClassifier's parameters on a binned Dataset whose labels are indices into `classes`. Gives
+    the same model as model.fit on the rows the Dataset was built from, without binning them again. A class_weight is
+    applied to a subset of all the rows, so the Dataset itself stays unweighted.
+    """
+    params, rounds = booster_params(model)
+    weights = class_sample_weights(model.get_params()["class_weight"], dataset.get_label().astype(int), classes)
+    if weights is not None:
+        dataset = _weighted(dataset.subset(np.arange(dataset.num_data())), weights)
+    booster = lightgbm.train(_objective_params(params, len(classes)), dataset, num_boost_round=rounds)
+    return BoosterClassifier(booster, classes, model.get_params())
+
+def search_candidates(search_space: dict[str, list], trials: int | None = None, seed: int = 42) -> list[dict]:
+    """The parameter combinations of a search space (parameter -> values): all of them, or `trials` of them drawn at random."""
+    names = list(search_space)
+    candidates = [dict(zip(names, values)) for values in itertools.product(*(search_space[name] for name in names))]
+    if trials is not None and trials < len(candidates):
+        candidates = random.Random(seed).sample(candidates, trials)
+    return candidates
+
+def encode_labels(y: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Class index of every row (like LGBMClassifier's label encoding) and the classes."""
+    classes, labels = np.unique(np.asarray(y), return_inverse=True)
+    if len(classes) < 2:
+        raise ValueError(f"The target has a single class: {classes[0]!r}")
+    return labels, classes
+
+def early_stopping_split(train_idx: np.ndarray, groups) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits the training rows of a fold into the rows it trains on and the rows of the replays its early stopping is
+    scored on, so the stopping round isn't chosen on the held-out fold.
+    """
+    splitter = GroupShuffleSplit(n_splits=1, test_size=EARLY_STOPPING_VALID_SIZE, random_state=42)
+    fit_idx, valid_idx = next(splitter.split(train_idx, groups=np.asarray(groups)[train_idx]))
+    return train_idx[fit_idx], train_idx[valid_idx]
+
+def _fit_fold(full: lightgbm.Dataset, X: pd.DataFrame, labels: np.ndarray, classes: np.ndarray, params: dict, rounds: int,
+              class_weight, train_idx: np.ndarray, valid_idx: np.ndarray | None, test_idx: np.ndarray,
+              early_stopping_rounds: int | None) -> dict:
+    """
+    Trains one fold of one trial on subsets of the shared Dataset, weighted by class_weight like LGBMClassifier.fit
+    weights the fold's rows, stopping early on the `valid_idx` rows, and scores it on the held-out replays.
+    """
+    start = time.perf_counter()
+    train_set = _weighted(full.subset(train_idx), class_sample_weights(class_weight, labels[train_idx], classes))
+    callbacks, valid_sets = [], []
+    if early_stopping_rounds:
+        valid_sets = [full.subset(valid_idx)] # Binned with the same bin mappers as the training rows
+        callbacks = [lightgbm.early_stopping(early_stopping_rounds, verbose=False)]
+    booster = lightgbm.train(params, train_set, num_boost_round=rounds, valid_sets=valid_sets, callbacks=callbacks)
+    best_iteration = booster.best_iteration or booster.current_iteration()
+    probabilities = booster.predict(X.iloc[test_idx], num_iteration=best_iteration, num_threads=params["num_threads"])
+    if probabilities.ndim == 1:
+        probabilities = np.column_stack([1 - probabilities, probabilities])
+    y_test = labels[test_idx]
+    return {
+        "accuracy": float((probabilities.argmax(axis=1) == y_test).mean()),
+        "log_loss": float(log_loss(y_test, probabilities, labels=np.arange(probabilities.shape[1]))),
+        "best_iteration": best_iteration,
+        "fit_seconds": time.perf_counter() - start,
+    }
+
+def cross_validate(model, X: pd.DataFrame, y: pd.Series, groups: pd.Series, folds: int = 5, candidates: list[dict] | None = None,
+                   early_stopping_rounds: int | None = None, workers: int | None = None, dataset: lightgbm.Dataset | None = None) -> pd.DataFrame:
+    """
+    Cross-validates an LGBMClassifier's parameters, and each of the candidate parameter overrides, with GroupKFold on
+    `groups` (the replay_id, so both perspectives of a replay are in the same fold).
+
+    The data is binned once into a LightGBM Dataset, and every fold of every trial trains on a subset of it, so the
+    bin mappers and category mappings are built once. The (trial, fold) fits run on `workers` threads (LightGBM
+    releases the GIL), each limited to its share of the CPUs so the threads don't oversubscribe them. With
+    early_stopping_rounds, each fold sets aside a fifth of its training replays and stops once their log loss hasn't
+    improved for that many rounds; the fold is still scored on its held-out replays alone. A class_weight (of the model
+    or a candidate) weights each fold's training rows as LGBMClassifier.fit would. Pass the binned rows of X as
+    `dataset` (labels encoded with encode_labels, built with feature_pre_filter off), e.g. from the dataset cache, to
+    skip the binning.
+
+    Returns one row per trial: its parameters, the mean and standard deviation of the held-out accuracy, the mean log
+    loss, the mean best iteration and the total fit time, best trials (highest accuracy, then lowest log loss) first.
+    """
+    candidates = candidates or [{}]
+    searched = DATASET_PARAMS.intersection(name for candidate in candidates for name in candidate)
+    if searched:
+        raise ValueError(f"Can't search parameters that change the binned Dataset: {', '.join(sorted(searched))}")
+    if not 2 <= folds <= groups.nunique():
+        raise ValueError(f"Need between 2 and {groups.nunique()} (the number of replays) folds, got {folds}.")
+
+    labels, classes = encode_labels(y)
+    base_params, base_rounds = booster_params(model)
+    base_params = _objective_params(base_params, len(classes))
+    base_class_weight = model.get_params()["class_weight"]
+
+    splits = []
+    for train_idx, test_idx in GroupKFold(n_splits=folds).split(X, labels, groups):
+        if early_stopping_rounds:
+            if groups.iloc[train_idx].nunique() < 2:
+                raise ValueError(f"Early stopping needs at least two training replays per fold, use fewer than {folds} folds.")
+            splits.append((*early_stopping_split(train_idx, groups), test_idx))
+        else:
+            splits.append((train_idx, None, test_idx))
+    tasks = [(trial, fold) for trial in range(len(candidates)) for fold in range(folds)]
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(tasks)))
+    threads_per_fit = max(1, cpus // workers)
+
+    full = dataset if dataset is not None else lightgbm.Dataset(X, labels, params={**base_params, "feature_pre_filter": False}, free_raw_data=False).construct()
+
+    def run(task):
+        trial, fold = task
+        candidate = dict(candidates[trial])
+        rounds = candidate.pop("n_estimators", base_rounds)
+        class_weight = candidate.pop("class_weight", base_class_weight)
+        params = {**base_params, **candidate, "num_threads": threads_per_fit}
+        return _fit_fold(full, X, labels, classes, params, rounds, class_weight, *splits[fold], early_stopping_rounds)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cv") as executor:
+        results = list(executor.map(run, tasks))
+
+    rows = []
+    for trial, candidate in enumerate(candidates):
+        fold_results = pd.DataFrame(results[trial * folds:(trial + 1) * folds])
+        rows.append({
+            **candidate,
+            "accuracy_mean": fold_results["accuracy"].mean(),
+            "accuracy_std": fold_results["accuracy"].std(ddof=0),
+            "log_loss_mean": fold_results["log_loss"].mean(),
+            "best_iteration": fold_results["best_iteration"].mean(),
+            "fit_seconds": fold_results["fit_seconds"].sum(),
+        })
+    table = pd.DataFrame(rows)
+    return table.sort_values(["accuracy_mean", "log_loss_mean"], ascending=[False, True], kind="stable").reset_index(drop=True)
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from loguru import logger
+
+class BackgroundStage:
+    """
+    Runs jobs on a small thread pool with a bounded backlog.
+
+    submit() only blocks when `max_pending` jobs are already queued or running, so the caller keeps going while earlier
+    jobs finish in the background, but can't run arbitrarily far ahead (each pending job holds its inputs in memory).
+    Exceptions are logged here, so jobs should do their own cleanup.
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, max_pending: int | None = None):
+        self.name = name
+        self.max_pending = max_pending or max_workers + 1
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, function, *args):
+        while True:
+            self._pending = deque(future for future in self._pending if not self._log_if_done(future))
+            if len(self._pending) < self.max_pending:
+                break
+            wait(self._pending, return_when=FIRST_COMPLETED)
+        self._pending.append(self._executor.submit(function, *args))
+
+    def _log_if_done(self, future) -> bool:
+        if not future.done():
+            return False
+        if future.exception() is not None:
+            logger.error(f"{self.name} job failed: {future.exception()}")
+        return True
+
+    def close(self):
+        """Waits for every submitted job to finish."""
+        self._executor.shutdown(wait=True)
+        for future in self._pending:
+            self._log_if_done(future)
+        self._pending.clear()
+
+def _merge_spans(spans) -> list[tuple[float, float]]:
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class Timeline:
+    """Records when each replay was in each pipeline stage (wall clock seconds), and logs how the stages overlapped."""
+
+    def __init__(self):
+        self.origin = time.time()
+        self.spans = [] # (label, stage, start, end)
+        self._lock = threading.Lock()
+
+    def record(self, label, stage: str, start: float, end: float):
+        with self._lock:
+            self.spans.append((label, stage, start, end))
+        logger.info(f"Timeline | {label} | {stage:<12} | +{start - self.origin:8.2f}s -> +{end - self.origin:8.2f}s ({end - start:.2f}s)")
+
+    def busy_time(self, stage: str) -> float:
+        return sum(end - start for start, end in _merge_spans((s, e) for _, st, s, e in self.spans if st.startswith(stage)))
+
+    def overlap(self, stage_a: str, stage_b: str) -> float:
+        """Seconds during which spans of both stages (matched by prefix) were running at the same time."""
+        spans_a = _merge_spans((s, e) for _, st, s, e in self.spans if st.startswith(stage_a))
+        spans_b = _merge_spans((s, e) for _, st, s, e in self.spans if st.startswith(stage_b))
+        total = 0.0
+        i = j = 0
+        while i < len(spans_a) and j < len(spans_b):
+            total += max(0.0, min(spans_a[i][1], spans_b[j][1]) - max(spans_a[i][0], spans_b[j][0]))
+            if spans_a[i][1] < spans_b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return total
+
+    def log_summary(self, stage_a: str, stage_b: str):
+        busy_b = self.busy_time(stage_b)
+        overlap = self.overlap(stage_a, stage_b)
+        share = f" ({overlap / busy_b:.0%})" if busy_b else ""
+        logger.info(f"Timeline summary: '{stage_b}' ran for {busy_b:.2f}s, {overlap:.2f}s{share} of it while '{stage_a}' was running. "
+                    f"Total wall time {time.time() - self.origin:.2f}s.")
@@ -0,0 +1,27 @@
+import json
+import mmap
+from pathlib import Path
+import mpyq
+
+METADATA_MEMBER = "replay.gamemetadata.json"
+
+def read_archive_member(replay_path: Path, member: str) -> bytes:
+    """
+    Reads and decompresses a single file from a replay's MPQ archive, without extracting the rest of the archive.
+    The replay is memory-mapped, so only the archive header, the hash/block tables and the member's sectors are read.
+    """
+    with open(replay_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        archive = mpyq.MPQArchive(mapped, listfile=False)
+        data = archive.read_file(member)
+    if data is None:
+        raise KeyError(f"{member} not found in {Path(replay_path).name}")
+    return data
+
+def read_replay_metadata(replay_path: Path) -> dict:
+    """Returns the parsed replay.gamemetadata.json of a replay."""
+    return json.loads(read_archive_member(replay_path, METADATA_MEMBER).decode("utf-8"))
+
+def read_replay_version(replay_path: Path) -> tuple[str, str]:
+    """Returns (base_build, data_version) of a replay, like sc2.main.get_replay_version but without a full extract."""
+    metadata = read_replay_metadata(replay_path)
+    return metadata["BaseBuild"], metadata["DataVersion"]
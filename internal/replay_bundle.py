@@ -0,0 +1,121 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from internal.compact_units import is_compact_units, read_compact_units
+
+# Tables of a replay bundle, the file each one is loaded from, and the column holding its game time.
+TABLE_FILES = {"units": "units.parquet", "resources": "resources.parquet", "deaths": "deaths.parquet", "upgrades": "upgrades.parquet"}
+TIME_COLUMNS = {"units": "timestamp", "resources": "timestamp", "deaths": "timestamp", "upgrades": "time_completed"}
+ESSENTIAL_TABLES = ("units", "resources")
+
+def _time_filters(time_column: str | None, time_window) -> list | None:
+    filters = []
+    if time_window is not None and time_column is not None:
+        start, end = time_window
+        if start is not None:
+            filters.append((time_column, ">=", start))
+        if end is not None:
+            filters.append((time_column, "<=", end))
+    return filters or None
+
+def _is_compact(path) -> bool:
+    """Only units files have a compact profile, other tables are read without looking at their metadata first."""
+    return Path(path).name == TABLE_FILES["units"] and is_compact_units(path)
+
+def read_replay_table(path, columns: list[str] | None = None, time_column: str | None = None, time_window=None) -> pd.DataFrame:
+    """
+    Reads only the given columns of a replay table, and with a (start, end) time window only the rows inside it.
+    Row groups whose timestamp statistics lie outside the window are skipped without being read. Units files written
+    with the compact profile (internal/compact_units.py) are decoded to the standard columns.
+    """
+    if _is_compact(path):
+        return read_compact_units(path, columns, time_window).to_pandas()
+    return pd.read_parquet(path, columns=columns, filters=_time_filters(time_column, time_window))
+
+def read_replay_arrow(path, columns: list[str] | None = None, time_column: str | None = None, time_window=None) -> pa.Table:
+    """read_replay_table as an Arrow table."""
+    if _is_compact(path):
+        return read_compact_units(path, columns, time_window)
+    return pq.read_table(path, columns=columns, filters=_time_filters(time_column, time_window))
+
+class ReplayBundle(dict):
+    """
+    Replay bundle whose tables are loaded on first access.
+
+    Behaves like the plain dict bundles feature scripts get (bundle["units"], bundle.get("deaths")). `tables` maps the
+    tables to load to the columns to read from them (None for every column); other tables are treated as missing.
+    Optional tables whose file doesn't exist are None, like before.
+    """
+
+    def __init__(self, replay_path, replay_id: str, tables: dict[str, list[str] | None], time_window=None, **values):
+        super().__init__(**values)
+        self.replay_path = Path(replay_path)
+        self.replay_id = replay_id
+        self.tables = tables
+        self.time_window = time_window
+
+    def __missing__(self, key):
+        if key not in self.tables:
+            raise KeyError(key)
+        value = self._load(key)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.tables
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def _read(self, name: str, columns: list[str] | None) -> pd.DataFrame | None:
+        """Reads a table's columns (all of them if None, never replay_id). None if the replay doesn't have the table."""
+        path = self.replay_path / TABLE_FILES[name]
+        if not path.exists():
+            return None
+        return read_replay_table(path, columns, TIME_COLUMNS[name], self.time_window)
+
+    def _load(self, name: str) -> pd.DataFrame | None:
+        columns = self.tables[name]
+        if columns is None:
+            df = self._read(name, None)
+            if df is not None:
+                df["replay_id"] = self.replay_id # Undeclared tables get the replay_id column they always had
+            return df
+
+        df = self._read(name, [column for column in columns if column != "replay_id"])
+        if df is not None and "replay_id" in columns:
+            df["replay_id"] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[self.replay_id]) # One category, no string per row
+        return df
+
+def load_corpus_tables(replay_paths: dict[str, Path], tables: dict[str, list[str] | None], time_window=None, arrow_cache=None) -> dict[str, pd.DataFrame | None]:
+    """
+    Loads the given tables of many replays, each concatenated into one DataFrame with a categorical replay_id column
+    (categories in the order of `replay_paths`). Rows stay grouped by replay, in the order of `replay_paths`.
+    Tables no replay has a file for are None. With an ArrowTableCache (internal/arrow_cache.py), tables are read
+    from its memory-mapped copies and converted like ArrowReplayBundle's.
+    """
+    replay_ids = pa.array(list(replay_paths), pa.string())
+    corpus = {}
+    for name, columns in tables.items():
+        read_columns = [column for column in columns if column != "replay_id"] if columns is not None else None
+        parts = []
+        for i, (replay_id, replay_path) in enumerate(replay_paths.items()):
+            path = Path(replay_path) / TABLE_FILES[name]
+            if not path.exists():
+                continue
+            if arrow_cache is not None:
+                table = arrow_cache.read_table(replay_id, name, path, read_columns, time_window)
+            else:
+                table = read_replay_arrow(path, read_columns, TIME_COLUMNS[name], time_window)
+            codes = pa.array(np.full(len(table), i, dtype=np.int32))
+            parts.append(table.append_column("replay_id", pa.DictionaryArray.from_arrays(codes, replay_ids)))
+        if not parts:
+            corpus[name] = None
+            continue
+        # The replays' files were written separately, so types can differ slightly (e.g. dictionary index widths)
+        table = pa.concat_tables(parts, promote_options="permissive")
+        corpus[name] = arrow_cache.to_frame(table.combine_chunks()) if arrow_cache is not None else table.to_pandas()
+    return corpus
@@ -0,0 +1,248 @@
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import NamedTuple
+
+from internal.corpus_dataset import replay_partitions
+
+DEFAULT_INDEX_PATH = Path("OutputRaw") / "replay_index.sqlite"
+STRATA = ("matchup", "map", "build")
+
+# Columns filled from a replay's metadata (Replay-Metadata.py). extraction_status is mirrored from the extraction ledger.
+METADATA_COLUMNS = ("replay_name", "replay_date", "duration", "map", "game_version", "build", "matchup",
+                    "p1_name", "p2_name", "p1_race", "p2_race", "p1_result", "p2_result", "winner")
+
+def index_row(replay_id: str, metadata: dict, replay_path=None) -> dict:
+    """A replay's row of the index. The replay date is the replay file's modification time (UTC), if it is given."""
+    players = {player.get("PlayerID"): player for player in metadata.get("Players", [])}
+    partitions = replay_partitions(metadata)
+    row = {
+        "replay_id": replay_id,
+        "replay_name": Path(replay_path).name if replay_path is not None else None,
+        "replay_date": datetime.fromtimestamp(Path(replay_path).stat().st_mtime, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") if replay_path is not None else None,
+        "duration": metadata.get("Duration"),
+        "map": metadata.get("Title"),
+        "game_version": metadata.get("GameVersion"),
+        "build": partitions["build"],
+        "matchup": partitions["matchup"],
+        "winner": next((player_id for player_id, player in players.items() if player.get("Result") == "Win"), None),
+    }
+    for player_id in (1, 2):
+        player = players.get(player_id, {})
+        row[f"p{player_id}_name"] = player.get("PlayerName")
+        row[f"p{player_id}_race"] = player.get("AssignedRace") or player.get("SelectedRace")
+        row[f"p{player_id}_result"] = player.get("Result")
+    return row
+
+def normalize_matchup(matchup: str) -> str:
+    """Matchups as the index stores them: ZvP, zvp and PvZ all become PvZ."""
+    return "v".join(sorted(race[:1].upper() for race in matchup.split("v")))
+
+class ReplayQuery(NamedTuple):
+    """A selection of replays. Every condition that is set must hold; lists match any of their values."""
+    min_duration: int | None = None
+    max_duration: int | None = None
+    matchups: list[str] | None = None
+    players: list[str] | None = None # Either player
+    maps: list[str] | None = None
+    since: str | None = None # Replay date, "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"
+    until: str | None = None
+    extraction_status: str | None = None
+
+    def where(self) -> tuple[str, list]:
+        conditions, params = [], []
+        if self.min_duration is not None:
+            conditions.append("duration >= ?")
+            params.append(self.min_duration)
+        if self.max_duration is not None:
+            conditions.append("duration <= ?")
+            params.append(self.max_duration)
+        if self.matchups:
+            conditions.append(f"matchup IN ({', '.join('?' * len(self.matchups))})")
+            params += [normalize_matchup(matchup) for matchup in self.matchups]
+        if self.players:
+            placeholders = ", ".join("?" * len(self.players))
+            conditions.append(f"(p1_name IN ({placeholders}) OR p2_name IN ({placeholders}))")
+            params += [*self.players, *self.players]
+        if self.maps:
+            conditions.append(f"map IN ({', '.join('?' * len(self.maps))})")
+            params += list(self.maps)
+        if self.since is not None:
+            conditions.append("replay_date >= ?")
+            params.append(self.since)
+        if self.until is not None:
+            if len(self.until) > 10:
+                conditions.append("replay_date <= ?")
+                params.append(self.until)
+            else:
+                conditions.append("replay_date < ?") # A date includes the whole day
+                params.append((date.fromisoformat(self.until) + timedelta(days=1)).isoformat())
+        if self.extraction_status is not None:
+            conditions.append("extraction_status = ?")
+            params.append(self.extraction_status)
+        return (" AND ".join(conditions) or "1"), params
+
+    def to_filters(self) -> list | None:
+        """The query as pyarrow filters on a corpus dataset's metadata table (which has no replay dates or extraction status)."""
+        if self.since is not None or self.until is not None:
+            raise ValueError("Replay dates can only be queried in the replay index.")
+        filters = []
+        if self.min_duration is not None:
+            filters.append(("Duration", ">=", self.min_duration))
+        if self.max_duration is not None:
+            filters.append(("Duration", "<=", self.max_duration))
+        if self.matchups:
+            filters.append(("matchup", "in", [normalize_matchup(matchup) for matchup in self.matchups]))
+        if self.maps:
+            filters.append(("map", "in", list(self.maps)))
+        if self.players:
+            return [[*filters, (f"p{player_id}_PlayerName", "in", list(self.players))] for player_id in (1, 2)] # Either player
+        return filters or None
+
+    def is_empty(self) -> bool:
+        return all(value is None or value == [] for value in self)
+
+def stratified_sample(replay_ids: list[str], strata: list | None, n: int, seed: int = 0) -> list[str]:
+    """
+    Seeded sample of `n` replays, with every stratum (e.g. matchup) represented in proportion to its size (remainders
+    go to the strata with the largest fractional share). The same inputs and seed always give the same sample.
+    The sample is returned in replay_id order.
+    """
+    if n >= len(replay_ids):
+        return sorted(replay_ids)
+    rng = random.Random(seed)
+    if strata is None:
+        return sorted(rng.sample(sorted(replay_ids), n))
+
+    groups = {}
+    for replay_id, stratum in zip(replay_ids, strata):
+        groups.setdefault("" if stratum is None else str(stratum), []).append(replay_id)
+    keys = sorted(groups)
+    shares = {key: n * len(groups[key]) / len(replay_ids) for key in keys}
+    counts = {key: int(shares[key]) for key in keys}
+    for key in sorted(keys, key=lambda key: (counts[key] - shares[key], key))[:n - sum(counts.values())]:
+        counts[key] += 1
+    sample = []
+    for key in keys:
+        sample += rng.sample(sorted(groups[key]), counts[key])
+    return sorted(sample)
+
+class ReplayIndex:
+    """
+    Persistent index of every known replay's metadata and extraction status, for selecting replays without reading
+    their _info.json files or listing OutputRaw.
+
+    Backed by SQLite with an index on each column queries filter on, so selections over 100k replays take
+    milliseconds. Replay-Metadata.py adds replays' metadata and Replay-Extractor.py records their extraction status,
+    each incrementally. Safe to use from the extractor's writer threads.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS replays (
+                    replay_id TEXT PRIMARY KEY,
+                    replay_name TEXT,
+                    replay_date TEXT,
+                    duration INTEGER,
+                    map TEXT,
+                    game_version TEXT,
+                    build TEXT,
+                    matchup TEXT,
+                    p1_name TEXT,
+                    p2_name TEXT,
+                    p1_race TEXT,
+                    p2_race TEXT,
+                    p1_result TEXT,
+                    p2_result TEXT,
+                    winner INTEGER,
+                    extraction_status TEXT,
+                    metadata_updated_at REAL,
+                    status_updated_at REAL
+                )"""
+            )
+            for column in ("duration", "matchup", "map", "build", "p1_name", "p2_name", "replay_date", "extraction_status"):
+                self._connection.execute(f"CREATE INDEX IF NOT EXISTS replays_{column} ON replays ({column})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_metadata(self, rows: list[dict]):
+        """Adds or updates replays' metadata (rows from index_row) in a single transaction, keeping their extraction status."""
+        columns = ("replay_id", *METADATA_COLUMNS, "metadata_updated_at")
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                f"INSERT INTO replays ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) ON CONFLICT(replay_id) DO UPDATE SET {updates}",
+                [tuple(row.get(column) for column in columns[:-1]) + (now,) for row in rows],
+            )
+            self._connection.execute("COMMIT")
+
+    def set_extraction_status(self, states: dict[str, str]):
+        """Records replays' extraction states (replay_id -> ledger state) in a single transaction."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT INTO replays (replay_id, extraction_status, status_updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(replay_id) DO UPDATE SET extraction_status = excluded.extraction_status, status_updated_at = excluded.status_updated_at "
+                "WHERE extraction_status IS NOT excluded.extraction_status",
+                [(replay_id, state, now) for replay_id, state in states.items()],
+            )
+            self._connection.execute("COMMIT")
+
+    def indexed_metadata(self) -> set[str]:
+        """The replays whose metadata is in the index."""
+        with self._lock:
+            return {row[0] for row in self._connection.execute("SELECT replay_id FROM replays WHERE metadata_updated_at IS NOT NULL")}
+
+    def without_extraction_status(self) -> set[str]:
+        """The replays with metadata but no extraction status (e.g. indexed before Replay-Extractor.py recorded any)."""
+        with self._lock:
+            return {row[0] for row in self._connection.execute("SELECT replay_id FROM replays WHERE metadata_updated_at IS NOT NULL AND extraction_status IS NULL")}
+
+    def counts(self) -> dict[str, int]:
+        """Number of replays with metadata, and per extraction status."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT COALESCE(extraction_status, 'not extracted'), COUNT(*) FROM replays WHERE metadata_updated_at IS NOT NULL GROUP BY 1"
+            ).fetchall()
+        return dict(rows)
+
+    def select(self, query: ReplayQuery = ReplayQuery(), columns: tuple[str, ...] = ("replay_id",)) -> list:
+        """
+        The replays (with metadata) matching the query, in replay_id order: a list of replay IDs, or of tuples if
+        several columns are asked for.
+        """
+        where, params = query.where()
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(columns)} FROM replays WHERE metadata_updated_at IS NOT NULL AND {where} ORDER BY replay_id", params
+            ).fetchall()
+        return [row[0] for row in rows] if len(columns) == 1 else rows
+
+    def sample(self, query: ReplayQuery, n: int, stratify_by: str | None = "matchup", seed: int = 0) -> list[str]:
+        """Seeded sample of `n` replays matching the query, stratified by one of STRATA (see stratified_sample)."""
+        if stratify_by is None:
+            return stratified_sample(self.select(query), None, n, seed)
+        if stratify_by not in STRATA:
+            raise ValueError(f"Unknown stratum '{stratify_by}', expected one of {', '.join(STRATA)}.")
+        rows = self.select(query, ("replay_id", stratify_by))
+        return stratified_sample([row[0] for row in rows], [row[1] for row in rows], n, seed)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
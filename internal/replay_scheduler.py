@@ -0,0 +1,65 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from loguru import logger
+
+from internal.replay_archive import read_replay_version
+
+def read_replay_versions(replay_paths: list[Path], max_workers: int | None = None) -> tuple[dict[Path, tuple[str, str]], dict[Path, str]]:
+    """
+    Reads the game version of every replay in parallel. Returns the versions of the replays whose version could be
+    read, and the error of each replay whose version couldn't.
+    """
+    def read(replay_path):
+        try:
+            return read_replay_version(replay_path), None
+        except Exception as e:
+            logger.error(f"Could not get replay version for {replay_path.name}: {e}")
+            return None, str(e)
+
+    versions, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for replay_path, (version, error) in zip(replay_paths, executor.map(read, replay_paths)):
+            if error is None:
+                versions[replay_path] = version
+            else:
+                errors[replay_path] = error
+    return versions, errors
+
+def group_by_version(replay_paths: list[Path], versions: dict, rng: random.Random | None = None) -> list[list[Path]]:
+    """
+    Groups replays by game version, in ascending build order, so that each client only switches version once per group.
+    Replays are shuffled within each group, so any prefix of a group is an unbiased sample of it. Replays without a
+    version in `versions` are left out.
+    """
+    rng = rng or random.Random()
+    groups = {}
+    for replay_path in replay_paths:
+        version = versions.get(replay_path)
+        if version is not None:
+            groups.setdefault(version, []).append(replay_path)
+
+    ordered_groups = []
+    for version in sorted(groups, key=lambda v: (str(v[0]), str(v[1]))):
+        group = groups[version]
+        rng.shuffle(group)
+        ordered_groups.append(group)
+    return ordered_groups
+
+def longest_first_blocks(group: list[Path], block_size: int, length) -> list[Path]:
+    """
+    A shuffled group's replays in consecutive blocks of `block_size`, each ordered longest first by `length`. The
+    blocks keep the group's random order, so a run stopped between blocks has still extracted an unbiased sample,
+    while each block (the last one in particular) ends with short replays that fill the gaps left by long ones.
+    """
+    return [replay_path for start in range(0, len(group), block_size)
+            for replay_path in sorted(group[start:start + block_size], key=length, reverse=True)]
+
+def count_version_switches(replay_paths: list[Path], versions: dict) -> int:
+    """Counts how many times consecutive replays in a processing order need a different game version."""
+    sequence = [versions[rp] for rp in replay_paths if versions.get(rp) is not None]
+    return sum(1 for previous, current in zip(sequence, sequence[1:]) if previous != current)
+
+def expected_client_launches(groups: list[list[Path]], num_workers: int, jobs_per_replay: int = 2) -> int:
+    """Client launches expected for grouped replays: every worker that picks up a job from a group launches that version once."""
+    return sum(min(num_workers, jobs_per_replay * len(group)) for group in groups)
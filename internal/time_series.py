@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+class TimeSeries:
+    """
+    Time index over one replay table, for as-of lookups, windowed deltas/rates and prefix aggregates.
+
+    The table's time column is sorted (if it isn't already) and columns are converted to float64 NumPy arrays once,
+    on first use, so every query is a searchsorted call and an array lookup instead of a boolean mask over the table.
+    Queries accept a single time or an array of times. Times before the first row give NaN.
+    """
+
+    def __init__(self, df: pd.DataFrame, time_column: str = "timestamp"):
+        times = df[time_column].to_numpy().astype(np.float64)
+        self._order = None
+        if len(times) > 1 and not (np.diff(times) >= 0).all():
+            self._order = np.argsort(times, kind="stable")
+            times = times[self._order]
+        self.times = times
+        self._df = df
+        self._columns = {}
+        self._prefix = {} # (column, aggregate) -> running aggregate over every row, built for queries with several times
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def column(self, name: str) -> np.ndarray:
+        """The column as float64 in time order (missing values are NaN)."""
+        values = self._columns.get(name)
+        if values is None:
+            column = self._df[name]
+            if isinstance(column.dtype, np.dtype):
+                values = column.to_numpy().astype(np.float64, copy=False) # NaN already is the missing value
+            else:
+                values = column.to_numpy(dtype=np.float64, na_value=np.nan) # Nullable extension dtypes
+            if self._order is not None:
+                values = values[self._order]
+            self._columns[name] = values
+        return values
+
+    def positions(self, times) -> np.ndarray:
+        """Index of the last row at or before each time (-1 if there is none)."""
+        return np.searchsorted(self.times, np.asarray(times, dtype=np.float64), side="right") - 1
+
+    def _at(self, values: np.ndarray, times):
+        positions = self.positions(times)
+        result = np.where(positions >= 0, values[np.maximum(positions, 0)] if len(values) else np.nan, np.nan)
+        return result if np.ndim(times) else result.item()
+
+    def asof(self, name: str, times):
+        """Value of the last row at or before each time."""
+        return self._at(self.column(name), times)
+
+    def delta(self, name: str, start, end):
+        """Change of the as-of value between start and end."""
+        return self.asof(name, end) - self.asof(name, start)
+
+    def rate(self, name: str, start, end, per: float = 60):
+        """Change of the as-of value between start and end, per `per` seconds (per minute by default)."""
+        return self.delta(name, start, end) / ((np.asarray(end, dtype=np.float64) - np.asarray(start, dtype=np.float64)) / per)
+
+    _REDUCERS = {"max": np.fmax, "min": np.fmin} # Skip NaN, like pandas (sums use nansum)
+
+    def _running(self, name: str, aggregate: str, times):
+        reducer = self._REDUCERS.get(aggregate)
+        if np.ndim(times) == 0 and (name, aggregate) not in self._prefix:
+            # A single time only needs that prefix reduced
+            position = int(self.positions(times))
+            if position < 0:
+                return np.nan
+            column = self.column(name)[:position + 1]
+            return float(np.nansum(column)) if aggregate == "sum" else float(reducer.reduce(column))
+
+        values = self._prefix.get((name, aggregate))
+        if values is None:
+            column = self.column(name)
+            values = np.nancumsum(column) if aggregate == "sum" else reducer.accumulate(column) if len(column) else column
+            self._prefix[(name, aggregate)] = values
+        return self._at(values, times)
+
+    def running_max(self, name: str, times):
+        """Maximum of the column over all rows at or before each time."""
+        return self._running(name, "max", times)
+
+    def running_min(self, name: str, times):
+        """Minimum of the column over all rows at or before each time."""
+        return self._running(name, "min", times)
+
+    def running_sum(self, name: str, times):
+        """Sum of the column over all rows at or before each time."""
+        return self._running(name, "sum", times)
+
+    def count(self, times):
+        """Number of rows at or before each time."""
+        result = self.positions(times) + 1
+        return result if np.ndim(times) else int(result)
+
+class GroupedTimeSeries:
+    """
+    Time index over a table holding many replays, for process_corpus: the same queries as TimeSeries, answered for every
+    replay at once. Groups are the categories of `group_column` (in category order), so results have one value per
+    category. Each query is one pass over the whole table, instead of one query per replay.
+    """
+
+    def __init__(self, df: pd.DataFrame, group_column: str = "replay_id", time_column: str = "timestamp"):
+        groups = df[group_column]
+        self.groups = groups.cat.categories
+        codes = groups.cat.codes.to_numpy().astype(np.int64)
+        times = df[time_column].to_numpy().astype(np.float64)
+        self._order = None
+        if len(times) > 1:
+            code_steps, time_steps = np.diff(codes), np.diff(times)
+            if not ((code_steps > 0) | ((code_steps == 0) & (time_steps >= 0))).all():
+                self._order = np.lexsort((times, codes)) # By group, then time
+                codes, times = codes[self._order], times[self._order]
+        self.codes = codes
+        self.times = times
+        self.sizes = np.bincount(codes, minlength=len(self.groups))
+        self.starts = np.cumsum(self.sizes) - self.sizes
+        self._df = df
+        self._columns = {}
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    column = TimeSeries.column
+
+    def positions(self, time: float) -> np.ndarray:
+        """Row index of each group's last row at or before the time (-1 if the group has none)."""
+        counts = np.bincount(self.codes, weights=self.times <= time, minlength=len(self.groups)).astype(np.int64)
+        return np.where(counts > 0, self.starts + counts - 1, -1)
+
+    def asof(self, name: str, time: float) -> np.ndarray:
+        """Each group's value of the last row at or before the time."""
+        positions = self.positions(time)
+        values = self.column(name)
+        if not len(values):
+            return np.full(len(self.groups), np.nan)
+        return np.where(positions >= 0, values[np.maximum(positions, 0)], np.nan)
+
+    def delta(self, name: str, start: float, end: float) -> np.ndarray:
+        return self.asof(name, end) - self.asof(name, start)
+
+    def rate(self, name: str, start: float, end: float, per: float = 60) -> np.ndarray:
+        return self.delta(name, start, end) / ((end - start) / per)
+
+    def _running(self, name: str, time: float, reducer) -> np.ndarray:
+        mask = self.times <= time
+        out = np.full(len(self.groups), np.nan)
+        reducer.at(out, self.codes[mask], self.column(name)[mask]) # fmax/fmin skip NaN, like pandas
+        return out
+
+    def running_max(self, name: str, time: float) -> np.ndarray:
+        """Each group's maximum over its rows at or before the time."""
+        return self._running(name, time, np.fmax)
+
+    def running_min(self, name: str, time: float) -> np.ndarray:
+        """Each group's minimum over its rows at or before the time."""
+        return self._running(name, time, np.fmin)
+
+    def running_sum(self, name: str, time: float) -> np.ndarray:
+        """Each group's sum over its rows at or before the time (NaN for groups without rows)."""
+        mask = self.times <= time
+        values = self.column(name)[mask]
+        sums = np.bincount(self.codes[mask], weights=np.nan_to_num(values), minlength=len(self.groups))
+        return np.where(np.bincount(self.codes[mask], minlength=len(self.groups)) > 0, sums, np.nan)
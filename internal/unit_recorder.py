@@ -0,0 +1,196 @@
+from array import array
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# (column name, array typecode, numpy dtype) for every captured unit column, in row order.
+UNIT_COLUMNS = (
+    ("timestamp", "d", np.float64),
+    ("unit_tag", "Q", np.uint64),
+    ("unit_type", "H", np.uint16), # Interned code, decoded back to names in to_frame()
+    ("player_id", "B", np.uint8),
+    ("position_x", "d", np.float64),
+    ("position_y", "d", np.float64),
+    ("is_snapshot", "B", np.bool_),
+    ("health", "d", np.float64),
+    ("shield", "d", np.float64),
+    ("energy", "d", np.float64),
+    ("build_progress", "d", np.float64),
+    ("resource_remaining", "d", np.float64),
+)
+
+# Bytes per captured row in the column buffers (used to turn a byte threshold into a row threshold).
+ROW_BYTES = sum(np.dtype(dtype).itemsize for _, _, dtype in UNIT_COLUMNS)
+
+TAG = 1
+TYPE = 2
+OWNER = 3
+POS_X = 4
+POS_Y = 5
+
+class SpilledUnits:
+    """Stands in for the units DataFrame when a recorder has spilled its rows to a Parquet part file."""
+
+    def __init__(self, path, rows: int, type_names: list[str]):
+        self.path = Path(path)
+        self.rows = rows
+        self.type_names = type_names
+
+    @property
+    def empty(self) -> bool:
+        return self.rows == 0
+
+class UnitRecorder:
+    """
+    Columnar capture buffer for unit snapshots.
+
+    Rows are staged per unit tag (later rows for the same tag replace earlier ones) and appended to one
+    growable typed array per column when flush() is called. Unit types are interned to small integer codes.
+
+    If a spill path is given, the column buffers are written out as a Parquet row group (sorted by timestamp
+    and unit tag) whenever they reach `spill_rows` rows, so memory use is bounded by the threshold.
+    """
+
+    __slots__ = ("_columns", "_staged", "_type_codes", "type_names", "_spill_path", "_spill_rows", "_writer", "spilled_rows")
+
+    def __init__(self, spill_path=None, spill_rows: int | None = None):
+        self._columns = self._new_columns()
+        self._staged = {}
+        self._type_codes = {}
+        self.type_names = []
+        self._spill_path = spill_path
+        self._spill_rows = spill_rows
+        self._writer = None
+        self.spilled_rows = 0
+
+    @staticmethod
+    def _new_columns():
+        return tuple(array(typecode) for _, typecode, _ in UNIT_COLUMNS)
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def intern_type(self, type_name: str) -> int:
+        """Returns the small integer code for a unit type name, assigning a new one on first sight."""
+        code = self._type_codes.get(type_name)
+        if code is None:
+            code = len(self.type_names)
+            self._type_codes[type_name] = code
+            self.type_names.append(type_name)
+        return code
+
+    def stage(self, row: tuple) -> tuple:
+        """Stages a row (ordered as UNIT_COLUMNS) as the latest state of its unit tag."""
+        self._staged[row[TAG]] = row
+        return row
+
+    def flush(self):
+        """Appends every staged row to the column buffers and clears the staging area."""
+        if not self._staged:
+            return
+        for column, values in zip(self._columns, zip(*self._staged.values())):
+            column.extend(values)
+        self._staged.clear()
+
+        if self._spill_path is not None and self._spill_rows and len(self) >= self._spill_rows:
+            self.spill()
+
+    def type_name(self, code: int) -> str:
+        return self.type_names[code]
+
+    def _arrays(self) -> dict[str, np.ndarray]:
+        data = {}
+        for (name, _, dtype), column in zip(UNIT_COLUMNS, self._columns):
+            data[name] = np.array(column, dtype=np.uint8 if dtype is np.bool_ else dtype)
+        data["is_snapshot"] = data["is_snapshot"].view(np.bool_)
+        return data
+
+    def spill(self):
+        """Writes the buffered rows to the spill file as one row group and empties the buffers."""
+        if not len(self):
+            return
+        data = self._arrays()
+        # Each flush only holds rows staged after the previous flush, so sorting per row group keeps the whole file sorted.
+        order = np.lexsort((data["unit_tag"], data["timestamp"]))
+        columns = {name: values[order] for name, values in data.items()}
+        columns["unit_type"] = pa.DictionaryArray.from_arrays(columns["unit_type"].astype(np.int32), pa.array(self.type_names, pa.string()))
+        table = pa.table(columns)
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._spill_path, table.schema)
+        self._writer.write_table(table)
+        self.spilled_rows += len(self)
+        self._columns = self._new_columns()
+
+    def close_spill(self) -> SpilledUnits:
+        """Spills any remaining rows, closes the spill file and returns a handle to it."""
+        self.spill()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return SpilledUnits(self._spill_path, self.spilled_rows, list(self.type_names))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Builds a DataFrame directly from the column buffers. Unit types are returned as a categorical."""
+        if not len(self):
+            return pd.DataFrame()
+
+        data = self._arrays()
+
+        # Remap interned codes so the categories are sorted, matching astype('category') on the names.
+        names = np.array(self.type_names, dtype=object)
+        order = np.argsort(names)
+        remap = np.empty_like(order)
+        remap[order] = np.arange(len(order))
+        data["unit_type"] = pd.Categorical.from_codes(remap[data["unit_type"]], categories=names[order])
+
+        return pd.DataFrame(data, copy=False)
+
+class LastSeenTable:
+    """
+    Struct-of-arrays store of the last known (unit type code, owner, x, y) of units keyed by tag.
+    Slots freed by pop() are reused, so the table only grows with the number of concurrently tracked tags.
+    """
+
+    __slots__ = ("_slots", "_free", "_type", "_owner", "_x", "_y")
+
+    def __init__(self):
+        self._slots = {}
+        self._free = []
+        self._type = array("H")
+        self._owner = array("B")
+        self._x = array("d")
+        self._y = array("d")
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, tag) -> bool:
+        return tag in self._slots
+
+    def put(self, tag: int, type_code: int, owner: int, x: float, y: float):
+        slot = self._slots.get(tag)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._type)
+                self._type.append(0)
+                self._owner.append(0)
+                self._x.append(0.0)
+                self._y.append(0.0)
+            self._slots[tag] = slot
+        self._type[slot] = type_code
+        self._owner[slot] = owner
+        self._x[slot] = x
+        self._y[slot] = y
+
+    def pop(self, tag: int) -> tuple[int, int, float, float] | None:
+        """Removes a tag and returns its (type code, owner, x, y), or None if the tag is not tracked."""
+        slot = self._slots.pop(tag, None)
+        if slot is None:
+            return None
+        self._free.append(slot)
+        return self._type[slot], self._owner[slot], self._x[slot], self._y[slot]